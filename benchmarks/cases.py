@@ -0,0 +1,283 @@
+"""Benchmarks of the validator verification path.
+
+The inputs are generated from the test fixtures by benchmarks/fixtures.py, so the benchmarks run
+offline and without miners. Benchmarks that need gromacs are skipped when gmx is not installed.
+"""
+
+import os
+import shutil
+import itertools
+import struct
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.core import SkipBenchmark, benchmark
+from benchmarks.fixtures import PRECISION, compress, write_large_gro_file, write_md_log
+from folding.utils.ops import gro_hash, get_last_step_time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDB_FIXTURES = os.path.join(ROOT_PATH, "tests", "fixtures", "pdb_files")
+
+PROTEIN_CONFIG = SimpleNamespace(
+    suppress_cmd_output=True, verbose=False, seed=None, force_use_pdb=True
+)
+
+
+def write_system(gro_path: str, xtc_path: str, n_atoms: int, n_frames: int):
+    """Writes a gro file with n_atoms water atoms and an xtc trajectory of n_frames frames (100ps apart)."""
+    rng = np.random.default_rng(0)
+    box = 2.0 * (n_atoms / 1000) ** (1 / 3) + 1.0
+    # Atoms of the same molecule are close to each other, like in a real system.
+    molecules = rng.uniform(0.5, box - 0.5, size=(n_atoms // 3 + 1, 1, 3))
+    coordinates = molecules + rng.normal(scale=0.05, size=(len(molecules), 3, 3))
+    coordinates = np.round(coordinates.reshape(-1, 3)[:n_atoms], 3)
+
+    with open(gro_path, "w") as f:
+        f.write("Benchmark system in water\n")
+        f.write(f"{n_atoms:5d}\n")
+        for i, (x, y, z) in enumerate(coordinates):
+            atom_name = ("OW", "HW1", "HW2")[i % 3]
+            residue = (i // 3 + 1) % 100000
+            f.write(
+                f"{residue:5d}SOL  {atom_name:>5}{(i + 1) % 100000:5d}{x:8.3f}{y:8.3f}{z:8.3f}\n"
+            )
+        f.write(f"{box:10.5f}{box:10.5f}{box:10.5f}\n")
+
+    # Frames share their coordinates, so the (slow) test encoder only runs once.
+    ints = np.round(coordinates * PRECISION).astype(np.int64)
+    minint, maxint, smallidx, data = compress(ints)
+    with open(xtc_path, "wb") as f:
+        for i in range(n_frames):
+            f.write(struct.pack(">iiif", 1995, n_atoms, i * 50000, i * 100.0))
+            f.write(struct.pack(">9f", box, 0, 0, 0, box, 0, 0, 0, box))
+            f.write(struct.pack(">i", n_atoms))
+            f.write(
+                struct.pack(
+                    ">f3i3iii", PRECISION, *minint, *maxint, smallidx, len(data)
+                )
+            )
+            f.write(data + b"\0" * ((4 - len(data) % 4) % 4))
+
+
+def prepare_protein(tmp_dir: str, pdb_id: str):
+    """Prepares the validator files of a fixture pdb with gromacs."""
+    if shutil.which("gmx") is None:
+        raise SkipBenchmark("gmx is not installed")
+
+    from folding.validators.protein import Protein
+
+    protein = Protein(pdb_id=pdb_id, ff="charmm27", box="cubic", config=PROTEIN_CONFIG)
+
+    # The generated files are kept in tmp_dir, while the mdp templates are read from the data directory.
+    protein.pdb_directory = os.path.join(tmp_dir, pdb_id)
+    protein.pdb_location = os.path.join(protein.pdb_directory, protein.pdb_file)
+    protein.validator_directory = os.path.join(protein.pdb_directory, "validator")
+    protein.gro_path = os.path.join(protein.validator_directory, "em.gro")
+    protein.topol_path = os.path.join(protein.validator_directory, "topol.top")
+
+    os.makedirs(protein.pdb_directory, exist_ok=True)
+    shutil.copy(os.path.join(PDB_FIXTURES, f"{pdb_id}.pdb"), protein.pdb_location)
+    protein.setup_simulation()
+    return protein
+
+
+@benchmark(
+    "gro_hash",
+    params=[{"n_atoms": n} for n in (10_000, 100_000, 500_000)],
+)
+def bench_gro_hash(tmp_dir: str, n_atoms: int):
+    gro_path = os.path.join(tmp_dir, "md_0_1.gro")
+    write_large_gro_file(gro_path, n_atoms=n_atoms)
+    return lambda: gro_hash(gro_path=gro_path)
+
+
+@benchmark(
+    "get_last_step_time",
+    params=[{"n_steps": n} for n in (10_000_000, 100_000_000, 1_000_000_000)],
+)
+def bench_get_last_step_time(tmp_dir: str, n_steps: int):
+    log_path = os.path.join(tmp_dir, "md_0_1.log")
+    write_md_log(log_path, n_steps=n_steps)
+    return lambda: get_last_step_time(log_path)
+
+
+@benchmark(
+    "compute_intermediate_gro",
+    params=[
+        {"n_atoms": n_atoms, "n_frames": 20, "index": index}
+        for n_atoms in (1_000, 10_000, 50_000)
+        for index in (False, True)
+    ],
+)
+def bench_compute_intermediate_gro(
+    tmp_dir: str, n_atoms: int, n_frames: int, index: bool
+):
+    """Extracts the last frame of a trajectory. Without an index, every call scans the whole file."""
+    from folding.validators.protein import Protein
+
+    protein = Protein(
+        pdb_id="benchmark", ff="charmm27", box="cubic", config=PROTEIN_CONFIG
+    )
+    protein.gro_path = os.path.join(tmp_dir, "em.gro")
+    xtc_path = os.path.join(tmp_dir, "md_0_1.xtc")
+    write_system(protein.gro_path, xtc_path, n_atoms=n_atoms, n_frames=n_frames)
+
+    def remove_index():
+        if not index and os.path.exists(f"{xtc_path}.index"):
+            os.remove(f"{xtc_path}.index")
+
+    def compute():
+        protein.compute_intermediate_gro(
+            output_directory=tmp_dir,
+            md_outputs_exts={"xtc": "md_0_1.xtc", "tpr": "md_0_1.tpr"},
+            simulation_step_time=(n_frames - 1) * 100.0,
+        )
+
+    return compute, remove_index
+
+
+@benchmark("Protein.rerun", params=[{"pdb_id": "1ubq"}, {"pdb_id": "1fjs"}])
+def bench_rerun(tmp_dir: str, pdb_id: str):
+    protein = prepare_protein(tmp_dir, pdb_id=pdb_id)
+    output_directory = os.path.join(protein.validator_directory, "miner")
+    os.makedirs(output_directory, exist_ok=True)
+
+    return lambda: protein.rerun(
+        output_directory=output_directory, gro_file_location=protein.gro_path
+    )
+
+
+@benchmark("Protein.is_run_valid", params=[{"pdb_id": "1ubq"}, {"pdb_id": "1fjs"}])
+def bench_is_run_valid(tmp_dir: str, pdb_id: str):
+    protein = prepare_protein(tmp_dir, pdb_id=pdb_id)
+    hotkey = "5Benchmark"
+    protein.get_miner_data_directory(hotkey=hotkey)
+    os.makedirs(protein.miner_data_directory, exist_ok=True)
+    shutil.copy(
+        protein.gro_path, os.path.join(protein.miner_data_directory, "intermediate.gro")
+    )
+
+    return lambda: protein.is_run_valid(energy=protein.init_energy, hotkey=hotkey)
+
+
+@benchmark(
+    "EnergyRewardModel.get_rewards",
+    params=[
+        {"n_miners": n_miners, "n_steps": n_steps}
+        for n_miners in (10, 50, 200)
+        for n_steps in (100, 1000)
+    ],
+)
+def bench_energy_reward_model(tmp_dir: str, n_miners: int, n_steps: int):
+    try:
+        from folding.rewards.energy import EnergyRewardModel
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+
+    rng = np.random.default_rng(0)
+    data = {
+        uid: {
+            "prod_energy": pd.DataFrame(
+                {
+                    "step": np.arange(n_steps),
+                    "prod_energy": -1e5 + rng.normal(scale=1e3, size=n_steps),
+                }
+            )
+        }
+        for uid in range(n_miners)
+    }
+    model = EnergyRewardModel()
+    return lambda: model.apply(data=data)
+
+
+@benchmark("reward_pipeline", params=[{"n_miners": n} for n in (10, 50, 200)])
+def bench_reward_pipeline(tmp_dir: str, n_miners: int):
+    try:
+        import torch
+        from folding.rewards.reward_pipeline import reward_pipeline
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    from folding.store import Job
+
+    hotkeys = [f"hotkey-{i}" for i in range(n_miners)]
+    energies = torch.Tensor(-1e5 - np.arange(n_miners) * 10.0)
+    energies[::5] = 0  # some miners did not return a valid run.
+    job = Job(
+        pdb="1ubq",
+        ff="charmm27",
+        box="cubic",
+        water="tip3p",
+        hotkeys=hotkeys,
+        created_at=pd.Timestamp.now(),
+        updated_at=pd.Timestamp.now(),
+        best_hotkey=hotkeys[-1],
+        best_loss=energies[-1].item(),
+    )
+
+    return lambda: reward_pipeline(
+        energies=energies,
+        rewards=torch.zeros(n_miners),
+        top_reward=0.8,
+        job=job,
+    )
+
+
+def make_store(tmp_dir: str, store: str, n_jobs: int):
+    """Creates a job store with n_jobs active jobs."""
+    from folding.store import PandasJobStore, SQLiteJobStore
+
+    store_class = {"pandas": PandasJobStore, "sqlite": SQLiteJobStore}[store]
+    job_store = store_class(db_path=tmp_dir, force_create=True)
+    for i in range(n_jobs):
+        job_store.insert(
+            pdb=f"pdb{i}",
+            ff="charmm27",
+            box="cubic",
+            water="tip3p",
+            hotkeys=[f"hotkey-{j}" for j in range(10)],
+            epsilon=5e3,
+            event={"pdb_id": f"pdb{i}", "hp_search": [{"ff": "charmm27"}] * 5},
+        )
+    return job_store
+
+
+STORE_PARAMS = [
+    {"store": store, "n_jobs": n_jobs}
+    for store in ("pandas", "sqlite")
+    for n_jobs in (100, 1_000, 10_000)
+]
+
+
+@benchmark("store.insert", params=STORE_PARAMS, quick_params=STORE_PARAMS[:1])
+def bench_store_insert(tmp_dir: str, store: str, n_jobs: int):
+    job_store = make_store(tmp_dir, store=store, n_jobs=n_jobs)
+    counter = itertools.count(n_jobs)
+
+    return lambda: job_store.insert(
+        pdb=f"pdb{next(counter)}",
+        ff="charmm27",
+        box="cubic",
+        water="tip3p",
+        hotkeys=[f"hotkey-{j}" for j in range(10)],
+        epsilon=5e3,
+    )
+
+
+@benchmark("store.update", params=STORE_PARAMS, quick_params=STORE_PARAMS[:1])
+def bench_store_update(tmp_dir: str, store: str, n_jobs: int):
+    job_store = make_store(tmp_dir, store=store, n_jobs=n_jobs)
+    job = job_store.get_queue(ready=False).get()
+
+    def update():
+        job.update(loss=-1e5, hotkey=job.hotkeys[0], commit_hash="abc", gro_hash="def")
+        job_store.update(job)
+
+    return update
+
+
+@benchmark("store.get_queue", params=STORE_PARAMS, quick_params=STORE_PARAMS[:1])
+def bench_store_get_queue(tmp_dir: str, store: str, n_jobs: int):
+    job_store = make_store(tmp_dir, store=store, n_jobs=n_jobs)
+    return lambda: job_store.get_queue(ready=False)
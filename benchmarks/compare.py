@@ -0,0 +1,95 @@
+"""Compares two benchmark result files and reports the benchmarks that got slower.
+
+Usage:
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+
+Exits with status 1 if any benchmark is slower than the baseline by more than the threshold.
+"""
+
+import sys
+import argparse
+from typing import Dict, List
+
+from benchmarks.core import load_results
+
+
+def compare_results(
+    baseline: Dict, current: Dict, threshold: float = 0.1, metric: str = "best"
+) -> List[Dict]:
+    """Compares the results that are in both runs (and were not skipped).
+
+    Args:
+        threshold (float): relative change above which a benchmark is a regression (or below -threshold an improvement).
+        metric (str): timing that is compared, best or median.
+
+    Returns:
+        List[Dict]: key, baseline and current time, relative change and status of every benchmark.
+    """
+    baseline_results = {
+        result["key"]: result
+        for result in baseline["results"]
+        if "skipped" not in result
+    }
+
+    comparisons = []
+    for result in current["results"]:
+        if "skipped" in result or result["key"] not in baseline_results:
+            continue
+
+        before = baseline_results[result["key"]][metric]
+        after = result[metric]
+        change = (after - before) / before if before > 0 else 0.0
+
+        if change > threshold:
+            status = "slower"
+        elif change < -threshold:
+            status = "faster"
+        else:
+            status = "same"
+
+        comparisons.append(
+            {
+                "key": result["key"],
+                "baseline": before,
+                "current": after,
+                "change": change,
+                "status": status,
+            }
+        )
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("current", type=str)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument(
+        "--metric", type=str, choices=["best", "median"], default="best"
+    )
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    comparisons = compare_results(
+        baseline, current, threshold=args.threshold, metric=args.metric
+    )
+
+    print(
+        f"baseline: {baseline['metadata'].get('version')} ({baseline['metadata'].get('commit')}), "
+        f"current: {current['metadata'].get('version')} ({current['metadata'].get('commit')})"
+    )
+    for comparison in comparisons:
+        print(
+            f"{comparison['key']:<60} {comparison['baseline'] * 1e3:10.2f}ms -> {comparison['current'] * 1e3:10.2f}ms "
+            f"{comparison['change']:+8.1%} {comparison['status']}"
+        )
+
+    regressions = [c for c in comparisons if c["status"] == "slower"]
+    if len(regressions) > 0:
+        print(f"{len(regressions)} benchmarks are slower than the baseline.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Registry, timing and result files of the benchmark suite.
+
+A benchmark is a setup function that prepares its inputs in a temporary directory and returns the
+function to time. It is registered with a list of parameters (system sizes, table sizes, ...) and
+runs once per set of parameters:
+
+    @benchmark("gro_hash", params=[{"n_atoms": 10_000}, {"n_atoms": 100_000}])
+    def bench_gro_hash(tmp_dir: str, n_atoms: int):
+        gro_path = os.path.join(tmp_dir, "em.gro")
+        write_large_gro_file(gro_path, n_atoms=n_atoms)
+        return lambda: gro_hash(gro_path=gro_path)
+
+Setup functions raise SkipBenchmark when a requirement (e.g. gmx) is missing.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import statistics
+import subprocess
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import folding
+
+
+class SkipBenchmark(Exception):
+    """Exception raised by the setup of a benchmark that can not run in this environment."""
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable
+    params: List[Dict]
+    quick_params: List[Dict] = field(default_factory=list)
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, params: List[Dict], quick_params: List[Dict] = None):
+    """Registers a benchmark setup function. quick_params are used by --quick runs, and default to the first params."""
+
+    def decorator(setup: Callable):
+        BENCHMARKS[name] = Benchmark(
+            name=name,
+            setup=setup,
+            params=params,
+            quick_params=quick_params or params[:1],
+        )
+        return setup
+
+    return decorator
+
+
+def result_key(name: str, params: Dict) -> str:
+    """Identifies a result across runs, e.g. gro_hash[n_atoms=10000]."""
+    return f"{name}[{','.join(f'{k}={v}' for k, v in sorted(params.items()))}]"
+
+
+def measure(func: Callable, repeats: int, before: Callable = None) -> Dict:
+    """Times repeated calls of func. before is called (untimed) ahead of every call.
+
+    Returns:
+        Dict: best, median and mean wall time (seconds) of the calls.
+    """
+    times = []
+    for _ in range(repeats):
+        if before is not None:
+            before()
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+
+    return {
+        "best": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "repeats": repeats,
+    }
+
+
+def run_benchmark(bench: Benchmark, params: Dict, repeats: int) -> Dict:
+    result = {
+        "name": bench.name,
+        "params": params,
+        "key": result_key(bench.name, params),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            prepared = bench.setup(tmp_dir, **params)
+        except SkipBenchmark as e:
+            return {**result, "skipped": str(e)}
+
+        func, before = prepared if isinstance(prepared, tuple) else (prepared, None)
+
+        # The first call warms up imports and caches, and is not timed.
+        if before is not None:
+            before()
+        func()
+
+        return {**result, **measure(func, repeats=repeats, before=before)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    names: List[str] = None, quick: bool = False, repeats: int = 5
+) -> Dict:
+    """Runs the registered benchmarks (all of them if names is None).
+
+    Returns:
+        Dict: metadata of the run and the result of every benchmark and set of parameters.
+    """
+    unknown = set(names or []) - set(BENCHMARKS)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown benchmarks {sorted(unknown)}, choose from {sorted(BENCHMARKS)}"
+        )
+
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if names is not None and name not in names:
+            continue
+        for params in bench.quick_params if quick else bench.params:
+            result = run_benchmark(bench, params=params, repeats=repeats)
+            print(format_result(result), flush=True)
+            results.append(result)
+
+    return {
+        "metadata": {
+            "version": folding.__version__,
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def format_result(result: Dict) -> str:
+    if "skipped" in result:
+        return f"{result['key']:<60} skipped: {result['skipped']}"
+    return f"{result['key']:<60} best {result['best'] * 1e3:10.2f}ms  median {result['median'] * 1e3:10.2f}ms"
+
+
+def save_results(path: str, results: Dict):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
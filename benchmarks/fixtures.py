@@ -0,0 +1,158 @@
+"""Input generators and reference implementations that are shared by the benchmarks and the tests.
+
+The generated inputs are scaled up from the fixtures in tests/fixtures, so that they have the size
+of real systems without downloading anything.
+"""
+
+import os
+import re
+import random
+import hashlib
+
+import numpy as np
+
+from folding.utils.xtc import FIRSTIDX, MAGICINTS
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GRO_FIXTURES = os.path.join(ROOT_PATH, "tests", "fixtures", "gro_files")
+
+VALIDATOR_GRO_FILE = os.path.join(GRO_FIXTURES, "em.gro")
+MINER_GRO_FILE = os.path.join(GRO_FIXTURES, "md_0_1.gro")
+MINER_GRO_FILE_CORRUPT = os.path.join(GRO_FIXTURES, "md_0_1_altered.gro")
+PRECISION = 1000.0
+
+
+def legacy_gro_hash(gro_path: str):
+    """The original readlines based implementation of gro_hash, used as a reference."""
+    pattern = re.compile(r"\s*(-?\d+\w+)\s+(\w+'?\d*\s*\d+)\s+(\-?\d+\.\d+)")
+
+    with open(gro_path, "rb") as f:
+        name, length, *lines, _ = f.readlines()
+        name = name.decode().split(" t=")[0].strip("\n").encode()
+
+    buf = ""
+    for line in lines:
+        match = pattern.match(line.decode().strip())
+        buf += match.group(1) + match.group(2).replace(" ", "")
+
+    return hashlib.md5(name + buf.encode()).hexdigest()
+
+
+def write_large_gro_file(path: str, n_atoms: int):
+    """Writes a gro file with n_atoms atoms by repeating the atoms of the validator gro file."""
+    with open(VALIDATOR_GRO_FILE, "r") as f:
+        _, _, *atoms, box = f.readlines()
+
+    with open(path, "w") as f:
+        f.write("MAJOR VIRION PROTEIN in water t= 100.00000 step= 50000\n")
+        f.write(f"{n_atoms}\n")
+        for i in range(n_atoms):
+            atom = atoms[i % len(atoms)]
+            # atom numbers wrap around at 100000, like in gromacs.
+            f.write(f"{atom[:15]}{(i + 1) % 100000:5d}{atom[20:]}")
+        f.write(box)
+
+
+def write_md_log(log_path: str, n_steps: int, tail: str = ""):
+    """Writes a log with an energy block every 5000 steps, like mdrun does."""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "w") as f:
+        f.write("                      :-) GROMACS - gmx mdrun, 2024.1 (-:\n\n")
+        for step in range(0, n_steps, 5000):
+            f.write("           Step           Time\n")
+            f.write(f"{step:15d}{step * 0.002:15.5f}\n\n")
+            f.write("   Energies (kJ/mol)\n")
+            f.write(
+                "          Angle    Proper Dih.  Improper Dih.          LJ-14     Coulomb-14\n"
+            )
+            f.write(
+                "    9.74139e+03    4.34956e+03    2.98027e+02   -4.41451e+03    8.37812e+04\n\n"
+            )
+        f.write(tail)
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.num_of_bits = 0
+
+    def write(self, value: int, num_of_bits: int):
+        self.value = (self.value << num_of_bits) | value
+        self.num_of_bits += num_of_bits
+
+    def write_ints(self, ints, num_of_bits: int, sizes):
+        value = (ints[0] * sizes[1] + ints[1]) * sizes[2] + ints[2]
+        n_bytes = (num_of_bits + 7) >> 3
+        packed = value.to_bytes(n_bytes, "little")
+        for byte in packed[:-1]:
+            self.write(byte, 8)
+        self.write(packed[-1], num_of_bits - 8 * (n_bytes - 1))
+
+    def to_bytes(self) -> bytes:
+        padding = (8 - self.num_of_bits % 8) % 8
+        return (self.value << padding).to_bytes(
+            (self.num_of_bits + padding) // 8, "big"
+        )
+
+
+def compress(coordinates: np.ndarray, seed: int = 0):
+    """Compresses integer coordinates with the xtc scheme. Atoms that are close to each other
+    are written as runs of small integers, and the size of the small integers changes randomly.
+    """
+    rng = random.Random(seed)
+    minint = coordinates.min(axis=0).tolist()
+    maxint = coordinates.max(axis=0).tolist()
+    sizeint = [maxint[k] - minint[k] + 1 for k in range(3)]
+    bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+
+    first_smallidx = smallidx = FIRSTIDX + 14
+    writer = BitWriter()
+    coordinates = coordinates.tolist()
+
+    i = 0
+    while i < len(coordinates):
+        smallnum = MAGICINTS[smallidx] // 2
+        fits = lambda a, b: all(
+            0 <= a[k] - b[k] + smallnum < 2 * smallnum for k in range(3)
+        )
+
+        # Find the longest run: atom i is written as small ints relative to atom i + 1,
+        # and every following atom relative to the one before it (skipping atom i + 1).
+        group = [i]
+        if i + 1 < len(coordinates) and fits(coordinates[i], coordinates[i + 1]):
+            group = [i, i + 1]
+            previous = i
+            while (
+                group[-1] + 1 < len(coordinates)
+                and len(group) < 10
+                and fits(coordinates[group[-1] + 1], coordinates[previous])
+            ):
+                group.append(group[-1] + 1)
+                previous = group[-1]
+
+        large = coordinates[group[1]] if len(group) > 1 else coordinates[i]
+        writer.write_ints([large[k] - minint[k] for k in range(3)], bitsize, sizeint)
+
+        is_smaller = rng.choice([-1, 0, 1])
+        if not FIRSTIDX + 10 < smallidx + is_smaller < FIRSTIDX + 18:
+            is_smaller = 0
+        run = 3 * (len(group) - 1) + is_smaller + 1
+
+        writer.write(1, 1)
+        writer.write(run, 5)
+
+        previous = large
+        small_atoms = group[:1] + group[2:] if len(group) > 1 else []
+        for index in small_atoms:
+            atom = coordinates[index]
+            writer.write_ints(
+                [atom[k] - previous[k] + smallnum for k in range(3)],
+                smallidx,
+                [MAGICINTS[smallidx]] * 3,
+            )
+            previous = atom
+
+        smallidx += is_smaller
+        i = group[-1] + 1
+
+    return minint, maxint, first_smallidx, writer.to_bytes()
@@ -0,0 +1,64 @@
+"""Benchmarks gro_hash against the original readlines based implementation.
+
+The gro fixtures in tests/fixtures/gro_files are scaled up to the size of a solvated system
+by repeating their atoms.
+
+Usage:
+    python -m benchmarks.gro_hash --n-atoms 10000 100000 500000
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from folding.utils.ops import gro_hash
+from benchmarks.fixtures import (
+    VALIDATOR_GRO_FILE,
+    MINER_GRO_FILE,
+    legacy_gro_hash,
+    write_large_gro_file,
+)
+
+
+def timeit(func, repeats: int, **kwargs) -> float:
+    """Returns the best wall time (seconds) of repeated calls to func."""
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func(**kwargs)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def main(n_atoms: list, repeats: int):
+    for gro_path in [VALIDATOR_GRO_FILE, MINER_GRO_FILE]:
+        assert gro_hash(gro_path=gro_path) == legacy_gro_hash(gro_path=gro_path)
+        legacy = timeit(legacy_gro_hash, repeats, gro_path=gro_path)
+        streaming = timeit(gro_hash, repeats, gro_path=gro_path)
+        print(
+            f"{os.path.basename(gro_path):>20}: legacy {legacy * 1e3:8.2f}ms, streaming {streaming * 1e3:8.2f}ms"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in n_atoms:
+            gro_path = os.path.join(tmp_dir, f"{n}.gro")
+            write_large_gro_file(gro_path, n_atoms=n)
+
+            assert gro_hash(gro_path=gro_path) == legacy_gro_hash(gro_path=gro_path)
+            legacy = timeit(legacy_gro_hash, repeats, gro_path=gro_path)
+            streaming = timeit(gro_hash, repeats, gro_path=gro_path)
+            print(
+                f"{n:>14} atoms: legacy {legacy * 1e3:8.2f}ms, streaming {streaming * 1e3:8.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--n-atoms", type=int, nargs="+", default=[10_000, 100_000, 500_000]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    main(n_atoms=args.n_atoms, repeats=args.repeats)
@@ -0,0 +1,391 @@
+"""Load test of the validator loop against a local fleet of mock miners.
+
+The validator runs in mock mode (mock subtensor, metagraph and dendrite) for a fixed number of
+steps of Validator.run. Its queries are answered by mock miners, in-process or in local
+subprocesses, that return a realistic md_output payload after a configurable latency, and fail
+at a configurable rate. The payload is either generated (.xtc, .tpr and .log files of the requested
+size) or replayed from a directory of real miner outputs.
+
+By default the challenges are synthetic: their validator files are generated from the payload
+system, so the miner outputs go through the in-process part of the verification (saving the files,
+reading the log and the last frame, and checking the gro hash) without gromacs. The rerun that
+follows needs gmx, and is rejected without it. With --challenges gromacs, the challenges are
+prepared with gromacs like in production.
+
+Usage:
+    python -m benchmarks.load_test --steps 20 --miners 32 --payload-mb 50 --latency 2
+    python -m benchmarks.load_test --miner-processes 4 --failure-rate 0.1 --neuron.sample_size 8
+
+Arguments that are not listed below are passed on to the validator config.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+from typing import Dict, List
+
+import numpy as np
+
+from folding.mock import MockMiner, MockDendrite
+from folding.utils.commands import read_io_counters
+
+LOG_STEPS_PER_FRAME = 50_000  # steps of 2fs between xtc frames, which are 100ps apart.
+
+
+def make_payload(directory: str, size_mb: float, n_atoms: int) -> Dict[str, bytes]:
+    """Generates the md_output of a miner: a trajectory of about size_mb, its log and a tpr
+    placeholder of a realistic size. Also writes em.gro, the system of the trajectory.
+
+    The log ends one energy block after the last frame, so the frame that the validator
+    checks is the last frame of the trajectory.
+
+    Returns:
+        Dict[str, bytes]: content of md_0_1.xtc, md_0_1.tpr and md_0_1.log.
+    """
+    from benchmarks.cases import write_system
+    from benchmarks.fixtures import write_md_log
+
+    gro_path = os.path.join(directory, "em.gro")
+    xtc_path = os.path.join(directory, "md_0_1.xtc")
+
+    write_system(gro_path, xtc_path, n_atoms=n_atoms, n_frames=1)
+    n_frames = max(1, int(size_mb * 1024**2 / os.path.getsize(xtc_path)))
+    write_system(gro_path, xtc_path, n_atoms=n_atoms, n_frames=n_frames)
+    write_md_log(
+        os.path.join(directory, "md_0_1.log"),
+        n_steps=(n_frames - 1) * LOG_STEPS_PER_FRAME + 5001,
+    )
+    with open(os.path.join(directory, "md_0_1.tpr"), "wb") as f:
+        f.write(np.random.default_rng(0).bytes(n_atoms * 50))
+
+    return load_payload(directory, exclude=["em.gro"])
+
+
+def load_payload(directory: str, exclude: List[str] = None) -> Dict[str, bytes]:
+    """Reads the files of a directory as the md_output of a miner."""
+    payload = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and name not in (exclude or []):
+            with open(path, "rb") as f:
+                payload[name] = f.read()
+    return payload
+
+
+def process_tree_rss(pid: int = None) -> int:
+    """Resident memory (bytes) of a process and all of its children, e.g. the verification pool."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            rss = next(
+                int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:")
+            )
+    except (OSError, StopIteration):
+        return 0
+
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children", "r") as f:
+                rss += sum(process_tree_rss(int(child)) for child in f.read().split())
+        except OSError:
+            continue
+    return rss
+
+
+class StoreMonitor:
+    """Wraps the job store of the validator, and records the calls, time and bytes read and
+    written by each of its methods.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.stats = {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self.store, name)
+        if not callable(attribute):
+            return attribute
+
+        def wrapper(*args, **kwargs):
+            io = read_io_counters()
+            start_time = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                end_io = read_io_counters()
+                stats = self.stats.setdefault(
+                    name, {"calls": 0, "time": 0.0, "read_mb": 0.0, "write_mb": 0.0}
+                )
+                stats["calls"] += 1
+                stats["time"] += time.perf_counter() - start_time
+                stats["read_mb"] += (
+                    end_io.get("rchar", 0) - io.get("rchar", 0)
+                ) / 1024**2
+                stats["write_mb"] += (
+                    end_io.get("wchar", 0) - io.get("wchar", 0)
+                ) / 1024**2
+
+        return wrapper
+
+
+def make_validator_class():
+    # The validator is imported here, so that the payload helpers can be used without bittensor.
+    from neurons.validator import Validator
+    from folding.validators.protein import Protein
+
+    class LoadTestValidator(Validator):
+        """Validator that stops after max_steps steps of its loop, and records the latency of each step.
+
+        Args:
+            max_steps (int): number of steps to run.
+            em_gro_path (str, optional): system of the synthetic challenges. If None, challenges are prepared with gromacs.
+        """
+
+        def __init__(self, config, max_steps: int, em_gro_path: str = None):
+            super().__init__(config=config)
+            self.max_steps = max_steps
+            self.em_gro_path = em_gro_path
+            self.store = StoreMonitor(self.store)
+            self.synthetic_pdbs = []
+            self.pdb_counter = itertools.count()
+            self.step_times = []
+            self.peak_rss = 0
+
+        def get_challenge(self, exclude: List[str]):
+            if self.em_gro_path is None:
+                return super().get_challenge(exclude=exclude)
+
+            pdb_id = f"load{next(self.pdb_counter):05d}"
+            protein = Protein(
+                pdb_id=pdb_id, ff="charmm27", box="cubic", config=self.config.protein
+            )
+            os.makedirs(protein.validator_directory, exist_ok=True)
+            shutil.copy(self.em_gro_path, protein.gro_path)
+            for mdp in protein.mdp_files:
+                shutil.copy(
+                    os.path.join(protein.base_directory, mdp),
+                    protein.validator_directory,
+                )
+            self.synthetic_pdbs.append(protein)
+
+            return {
+                "pdb_id": pdb_id,
+                "ff": protein.ff,
+                "water": protein.water,
+                "box": protein.box,
+                "epsilon": protein.epsilon,
+            }
+
+        async def concurrent_forward(self, jobs: List) -> Dict:
+            round_event = await super().concurrent_forward(jobs=jobs)
+
+            now = time.perf_counter()
+            self.step_times.append(now - self.last_step_end)
+            self.last_step_end = now
+            self.peak_rss = max(self.peak_rss, process_tree_rss())
+
+            if len(self.step_times) >= self.max_steps:
+                self.should_exit = True
+            return round_event
+
+        def run(self):
+            self.last_step_end = time.perf_counter()
+            super().run()
+
+        def cleanup(self):
+            self.verification_pool.shutdown()
+            self.dendrite.close()
+            for protein in self.synthetic_pdbs:
+                shutil.rmtree(protein.pdb_directory, ignore_errors=True)
+
+    return LoadTestValidator
+
+
+def summarize(validator, elapsed: float) -> Dict:
+    import resource
+
+    step_times = np.array(validator.step_times)
+    responses = validator.dendrite.responses
+    return {
+        "steps": len(step_times),
+        "elapsed": elapsed,
+        "steps_per_minute": 60 * len(step_times) / elapsed if elapsed > 0 else 0.0,
+        "step_latency_p50": (
+            float(np.percentile(step_times, 50)) if len(step_times) else None
+        ),
+        "step_latency_p99": (
+            float(np.percentile(step_times, 99)) if len(step_times) else None
+        ),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_process_tree_rss_mb": validator.peak_rss / 1024**2,
+        "store": validator.store.stats,
+        "store_size_mb": sum(
+            os.path.getsize(validator.store.file_path + suffix) / 1024**2
+            for suffix in ("", "-wal")
+            if os.path.exists(validator.store.file_path + suffix)
+        ),
+        "responses": responses,
+        "received_mb": validator.dendrite.received_mb,
+    }
+
+
+def format_summary(summary: Dict) -> str:
+    lines = [
+        f"steps                 {summary['steps']} in {summary['elapsed']:.1f}s ({summary['steps_per_minute']:.2f} steps/minute)",
+        f"step latency          p50 {summary['step_latency_p50'] or 0:.2f}s  p99 {summary['step_latency_p99'] or 0:.2f}s",
+        f"peak memory           validator {summary['peak_rss_mb']:.0f}MB  with subprocesses {summary['peak_process_tree_rss_mb']:.0f}MB",
+        f"responses             {summary['responses']}",
+        f"received              {summary['received_mb']['transfer']:.1f}MB sent, {summary['received_mb']['decoded']:.1f}MB decoded",
+        f"store                 {summary['store_size_mb']:.2f}MB on disk",
+    ]
+    for name, stats in sorted(summary["store"].items()):
+        lines.append(
+            f"  {name:<20}{stats['calls']:6d} calls {stats['time']:8.3f}s  read {stats['read_mb']:8.2f}MB  write {stats['write_mb']:8.2f}MB"
+        )
+    return "\n".join(lines)
+
+
+class CountingDendrite(MockDendrite):
+    """MockDendrite that counts the status codes and the received bytes of the job responses."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.responses = {}
+        self.received_mb = {"transfer": 0.0, "decoded": 0.0}
+
+    async def forward(self, axons, synapse=None, *args, **kwargs):
+        responses = await super().forward(axons, synapse, *args, **kwargs)
+        if synapse.__class__.__name__ == "JobSubmissionSynapse":
+            for response in responses:
+                code = str(response.dendrite.status_code)
+                self.responses[code] = self.responses.get(code, 0) + 1
+                self.received_mb["transfer"] += (
+                    sum((response.md_output_transfer_sizes or {}).values()) / 1024**2
+                )
+                self.received_mb["decoded"] += (
+                    sum(len(v or b"") for v in response.md_output.values()) / 1024**2
+                )
+        return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.split("\n")[1:]),
+    )
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--miners", type=int, default=32)
+    parser.add_argument(
+        "--miner-processes",
+        type=int,
+        default=0,
+        help="Number of subprocesses that serve the miners. If 0, the miners run in the validator process.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=1.0, help="Mean miner latency (seconds)."
+    )
+    parser.add_argument("--latency-jitter", type=float, default=0.5)
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.05,
+        help="Fraction of queries that fail with a server error.",
+    )
+    parser.add_argument("--payload-mb", type=float, default=10.0)
+    parser.add_argument("--payload-atoms", type=int, default=10_000)
+    parser.add_argument(
+        "--payload-dir",
+        type=str,
+        default=None,
+        help="Directory of miner output files (.xtc, .tpr, .log, ...) that are replayed instead of a generated payload.",
+    )
+    parser.add_argument(
+        "--challenges", choices=["synthetic", "gromacs"], default="synthetic"
+    )
+    parser.add_argument("--output", type=str, default=None)
+    args, validator_args = parser.parse_known_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="folding_load_test_")
+    try:
+        payload_dir = os.path.join(tmp_dir, "payload")
+        os.makedirs(payload_dir)
+        # The system of the synthetic challenges is generated even if the payload is replayed.
+        payload = make_payload(
+            payload_dir,
+            size_mb=args.payload_mb if args.payload_dir is None else 0,
+            n_atoms=args.payload_atoms,
+        )
+        if args.payload_dir is not None:
+            payload = load_payload(args.payload_dir)
+        print(
+            f"Payload: { {name: f'{len(content) / 1024**2:.2f}MB' for name, content in payload.items()} }"
+        )
+
+        # Defaults of the load test, which can be overridden by the validator arguments.
+        # fmt: off
+        sys.argv = [sys.argv[0]] + [
+            "--mock",
+            "--netuid", "1",
+            "--wandb.off",
+            "--neuron.axon_off",
+            "--neuron.dont_save_events",
+            "--neuron.update_interval", "0",
+            "--neuron.challenge_buffer_size", "0",
+            "--neuron.queue_size", "4",
+            "--neuron.sample_size", "4",
+            "--neuron.timeout", "30",
+            "--neuron.mock_n_miners", str(args.miners),
+            "--neuron.db_path", os.path.join(tmp_dir, "db"),
+        ] + validator_args
+        # fmt: on
+
+        LoadTestValidator = make_validator_class()
+        validator = LoadTestValidator(
+            config=LoadTestValidator.config(),
+            max_steps=args.steps,
+            em_gro_path=(
+                os.path.join(payload_dir, "em.gro")
+                if args.challenges == "synthetic"
+                else None
+            ),
+        )
+
+        miners = {
+            hotkey: MockMiner(
+                md_output=payload,
+                latency=args.latency,
+                latency_jitter=args.latency_jitter,
+                failure_rate=args.failure_rate,
+            )
+            for hotkey in validator.metagraph.hotkeys
+            if hotkey != validator.wallet.hotkey.ss58_address
+        }
+        validator.dendrite = CountingDendrite(
+            wallet=validator.wallet, miners=miners, processes=args.miner_processes
+        )
+
+        start_time = time.perf_counter()
+        try:
+            validator.run()
+        finally:
+            elapsed = time.perf_counter() - start_time
+            validator.cleanup()
+
+        summary = summarize(validator, elapsed=elapsed)
+        print(format_summary(summary))
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump({"args": vars(args), "summary": summary}, f, indent=2)
+            print(f"Results written to {args.output}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Runs the benchmark suite and writes the results to a JSON file.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --only gro_hash store.update
+    python -m benchmarks.compare baseline.json results.json
+"""
+
+import argparse
+
+from benchmarks.core import BENCHMARKS, run_benchmarks, save_results
+import benchmarks.cases  # registers the benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", type=str, default="benchmark_results.json")
+    parser.add_argument(
+        "--only",
+        type=str,
+        nargs="+",
+        default=None,
+        help=f"Benchmarks to run, from {sorted(BENCHMARKS)}.",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Only run the smallest size of each benchmark.",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run_benchmarks(names=args.only, quick=args.quick, repeats=args.repeats)
+    save_results(args.output, results)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
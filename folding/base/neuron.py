@@ -81,7 +81,11 @@ class BaseNeuron(ABC):
         # The wallet holds the cryptographic key pairs for the miner.
         if self.config.mock:
             self.wallet = bt.MockWallet(config=self.config)
-            self.subtensor = MockSubtensor(self.config.netuid, wallet=self.wallet)
+            self.subtensor = MockSubtensor(
+                self.config.netuid,
+                n=self.config.neuron.mock_n_miners,
+                wallet=self.wallet,
+            )
             self.metagraph = MockMetagraph(self.config.netuid, subtensor=self.subtensor)
         else:
             self.wallet = bt.wallet(config=self.config)
@@ -25,11 +25,13 @@ import argparse
 import threading
 import bittensor as bt
 
-from typing import List
+from typing import Dict, List
 from traceback import print_exception
 
 from folding.base.neuron import BaseNeuron
 from folding.mock import MockDendrite
+from folding.utils.logging import log_event
+from folding.utils.tracing import current_job
 from folding.utils.config import add_validator_args
 
 
@@ -103,11 +105,78 @@ class BaseValidatorNeuron(BaseNeuron):
             bt.logging.error(f"Failed to create Axon initialize with exception: {e}")
             pass
 
-    async def concurrent_forward(self):
-        coroutines = [
-            self.forward() for _ in range(self.config.neuron.num_concurrent_forwards)
-        ]
-        await asyncio.gather(*coroutines)
+    async def forward_job(self, job, semaphore: asyncio.Semaphore):
+        """Queries the miners of a single job and updates the job with the results.
+
+        The miner query runs concurrently with the other jobs in the round (bounded by the semaphore),
+        while scoring and writes to the store are serialized through self.lock.
+
+        Args:
+            job (Job): Job object containing the pdb and hotkeys
+            semaphore (asyncio.Semaphore): bounds the number of jobs that are in flight at once
+        """
+        # Spans recorded for the job are logged with its event. Each job runs in its own task
+        # (see concurrent_forward), which has its own copy of the context.
+        current_job.set(job.pdb)
+
+        # Remove any deregistered hotkeys from current job. This will update the store when the job is updated.
+        if not job.check_for_available_hotkeys(self.metagraph.hotkeys):
+            async with self.lock:
+                self.store.update(job=job)
+            return
+
+        # Here we straightforwardly query the workers associated with each job and update the jobs accordingly
+        async with semaphore:
+            job_event = await self.forward(job=job)
+
+        async with self.lock:
+            # If we don't have any miners reply to the query, we will make it inactive.
+            if len(job_event["energies"]) == 0:
+                job.active = False
+                self.store.update(job=job)
+                return
+
+            if isinstance(job.event, str):
+                job.event = eval(job.event)  # if str, convert to dict.
+
+            job.event.update(job_event)
+            # Determine the status of the job based on the current energy and the previous values (early stopping)
+            # Update the DB with the current status
+            self.update_job(job)
+
+    async def concurrent_forward(self, jobs: List) -> Dict:
+        """Runs the forward pass for all jobs in the round concurrently, with at most
+        neuron.num_concurrent_forwards jobs querying miners at the same time.
+
+        Args:
+            jobs (List[Job]): jobs to forward in this round
+
+        Returns:
+            Dict: round event containing the wall time of the round
+        """
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(self.config.neuron.num_concurrent_forwards)
+
+        results = await asyncio.gather(
+            *[self.forward_job(job=job, semaphore=semaphore) for job in jobs],
+            return_exceptions=True,
+        )
+
+        # A failing job should not take down the rest of the round.
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                bt.logging.error(f"Error during forward of job {job.pdb}: {result}")
+                bt.logging.debug(
+                    print_exception(type(result), result, result.__traceback__)
+                )
+
+        return {
+            "step": self.step,
+            "round_time": time.time() - start_time,
+            "round_num_jobs": len(jobs),
+            "round_num_failed_jobs": sum(isinstance(r, Exception) for r in results),
+            "num_concurrent_forwards": self.config.neuron.num_concurrent_forwards,
+        }
 
     def run(self):
         """
@@ -157,29 +226,15 @@ class BaseValidatorNeuron(BaseNeuron):
                     # We also assign the pdb to a group of workers (miners), based on their workloads
                     self.add_jobs(k=self.config.neuron.queue_size - queue.qsize())
 
-                # TODO: maybe concurrency for the loop below
-                for job in self.store.get_queue(ready=False).queue:
-                    # Remove any deregistered hotkeys from current job. This will update the store when the job is updated.
-                    if not job.check_for_available_hotkeys(self.metagraph.hotkeys):
-                        self.store.update(job=job)
-                        continue
-
-                    # Here we straightforwardly query the workers associated with each job and update the jobs accordingly
-                    job_event = self.forward(job=job)
-
-                    # If we don't have any miners reply to the query, we will make it inactive. 
-                    if len(job_event["energies"]) == 0: 
-                        job.active = False
-                        self.store.update(job=job)
-                        continue 
-
-                    if isinstance(job.event, str):
-                        job.event = eval(job.event)  # if str, convert to dict.
-
-                    job.event.update(job_event)
-                    # Determine the status of the job based on the current energy and the previous values (early stopping)
-                    # Update the DB with the current status
-                    self.update_job(job)
+                # Query the miners of all active jobs concurrently. Scoring and store writes remain serialized.
+                jobs = list(self.store.get_queue(ready=False).queue)
+                round_event = self.loop.run_until_complete(
+                    self.concurrent_forward(jobs=jobs)
+                )
+                bt.logging.info(
+                    f"Forwarded {len(jobs)} jobs in {round_event['round_time']:.2f}s"
+                )
+                log_event(self, event=round_event)
 
                 # Check if we should exit.
                 if self.should_exit:
@@ -3,14 +3,22 @@ import time
 import glob
 import base64
 import concurrent.futures
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 import bittensor as bt
 
 # import base miner class which takes care of most of the boilerplate
 from folding.base.miner import BaseMinerNeuron
+from folding.miners.response_cache import ResponseCache
 from folding.protocol import JobSubmissionSynapse
 from folding.utils.logging import log_event
+from folding.utils.compression import choose_encoding, encode_file
+from folding.utils.incremental import (
+    SentFiles,
+    get_append_offset,
+    inputs_digest,
+    is_incremental,
+)
 from folding.utils.ops import (
     run_cmd_commands,
     check_if_directory_exists,
@@ -24,21 +32,60 @@ BASE_DATA_PATH = os.path.join(ROOT_DIR, "miner-data")
 
 
 def attach_files(
-    files_to_attach: List, synapse: JobSubmissionSynapse
+    files_to_attach: List,
+    synapse: JobSubmissionSynapse,
+    sent_files: SentFiles = None,
+    response_cache: ResponseCache = None,
 ) -> JobSubmissionSynapse:
-    """function that parses a list of files and attaches them to the synapse object"""
+    """function that parses a list of files and attaches them to the synapse object
+
+    Files are memory-mapped and base64 encoded in chunks, see folding.utils.compression.encode_file.
+    If the validator accepts a compression of md_output that is available here, each file is
+    compressed before it is base64 encoded. The sizes of the files before compression are sent along.
+
+    If the validator already holds the start of a file (md_output_offsets), only the bytes that
+    were appended since are sent, see folding.utils.incremental. Other files that did not change
+    since they were sent to this validator (sent_files) are sent empty, at an offset of their size.
+
+    Files that were encoded the same way before, and did not change since, are taken from response_cache.
+    """
     bt.logging.info(f"Sending files to validator: {files_to_attach}")
+    encoding = choose_encoding(synapse.md_output_encodings)
+    synapse.md_output_encoding = encoding
+    synapse.md_output_sizes = {}
+    synapse.md_output_appended = {}
+    validator = getattr(getattr(synapse, "dendrite", None), "hotkey", None)
+
     for filename in files_to_attach:
         # trrs are large, and validators don't need them.
         if filename.endswith(".trr"):
             continue
 
         try:
-            with open(filename, "rb") as f:
-                filename = filename.split("/")[
-                    -1
-                ]  # remove the directory from the filename
-                synapse.md_output[filename] = base64.b64encode(f.read())
+            name = filename.split("/")[-1]  # remove the directory from the filename
+            offset = synapse.md_output_offsets.get(name)
+            stat = os.stat(filename)
+            if is_incremental(filename):
+                start = get_append_offset(filename, offset)
+            elif sent_files is not None and sent_files.is_unchanged(
+                validator, filename, stat, offset
+            ):
+                start = stat.st_size
+            else:
+                start = 0
+
+            if response_cache is not None:
+                content, size = response_cache.encode_file(
+                    filename, stat, encoding=encoding, offset=start
+                )
+            else:
+                content, size = encode_file(filename, encoding=encoding, offset=start)
+            synapse.md_output[name] = content
+            synapse.md_output_sizes[name] = size
+            if start > 0:
+                synapse.md_output_appended[name] = start
+            if sent_files is not None and validator is not None:
+                sent_files.add(validator, filename, stat)
         except Exception as e:
             bt.logging.error(f"Failed to read file {filename!r} with error: {e}")
             get_tracebacks()
@@ -50,6 +97,8 @@ def attach_files_to_synapse(
     synapse: JobSubmissionSynapse,
     data_directory: str,
     state: str,
+    sent_files: SentFiles = None,
+    response_cache: ResponseCache = None,
 ) -> JobSubmissionSynapse:
     """load the output files as bytes and add to synapse.md_output
 
@@ -57,6 +106,8 @@ def attach_files_to_synapse(
         synapse (JobSubmissionSynapse): Recently received synapse object
         data_directory (str): directory where the miner is holding the necessary data for the validator.
         state (str): the current state of the simulation
+        sent_files (SentFiles, optional): versions of the files that were sent to each validator.
+        response_cache (ResponseCache, optional): encoded files of previous queries.
 
     state is either:
      1. nvt
@@ -97,7 +148,12 @@ def attach_files_to_synapse(
                 f"No files found for {state}"
             )  # if this happens, goes to except block
 
-        synapse = attach_files(files_to_attach=files_to_attach, synapse=synapse)
+        synapse = attach_files(
+            files_to_attach=files_to_attach,
+            synapse=synapse,
+            sent_files=sent_files,
+            response_cache=response_cache,
+        )
 
     except Exception as e:
         bt.logging.error(
@@ -111,6 +167,19 @@ def attach_files_to_synapse(
         return synapse  # either return the synapse wth the md_output attached or the synapse as is.
 
 
+def md_inputs_digest_path(output_dir: str, pdb_id: str) -> str:
+    return os.path.join(output_dir, f"{pdb_id}_md_inputs_digest.txt")
+
+
+def get_md_inputs_held(output_dir: str, pdb_id: str) -> Optional[str]:
+    """Digest of the md_inputs that the simulation of pdb_id was started from, if it is known."""
+    try:
+        with open(md_inputs_digest_path(output_dir, pdb_id), "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
 def check_synapse(
     self, synapse: JobSubmissionSynapse, output_dir: str, event: Dict = None
 ) -> JobSubmissionSynapse:
@@ -123,9 +192,18 @@ def check_synapse(
     if synapse.md_output is not None:
         event["md_output_sizes"] = list(map(len, synapse.md_output.values()))
         event["md_output_filenames"] = list(synapse.md_output.keys())
+        event["md_output_encoding"] = synapse.md_output_encoding
+        event["md_output_appended"] = synapse.md_output_appended
+        if synapse.md_output_sizes is not None:
+            event["md_output_raw_sizes"] = list(synapse.md_output_sizes.values())
 
     if not self.config.wandb.off:
-        energy_event = self.get_state_energies(output_dir=output_dir)
+        if self.response_cache is not None:
+            energy_event = self.response_cache.get_state_energies(
+                output_dir, self.get_state_energies
+            )
+        else:
+            energy_event = self.get_state_energies(output_dir=output_dir)
         event.update(energy_event)
 
     event["query_forward_time"] = time.time() - self.query_start_time
@@ -148,6 +226,12 @@ class FoldingMiner(BaseMinerNeuron):
             else os.path.join(BASE_DATA_PATH, self.wallet.hotkey.ss58_address[:8])
         )
         self.simulations = self.create_default_dict()
+        self.sent_files = SentFiles()
+        self.response_cache = (
+            ResponseCache(max_bytes=self.config.neuron.response_cache_mb * 1024**2)
+            if self.config.neuron.response_cache_mb > 0
+            else None
+        )
 
         self.max_workers = self.config.neuron.max_workers
         bt.logging.info(
@@ -281,6 +365,12 @@ class FoldingMiner(BaseMinerNeuron):
                 synapse=synapse,
                 data_directory=simulation["output_dir"],
                 state=current_executor_state,
+                sent_files=self.sent_files,
+                response_cache=self.response_cache,
+            )
+
+            synapse.md_inputs_held = get_md_inputs_held(
+                simulation["output_dir"], synapse.pdb_id
             )
 
             event["condition"] = "running_simulation"
@@ -312,7 +402,11 @@ class FoldingMiner(BaseMinerNeuron):
                         f"❗ Found existing data for protein: {synapse.pdb_id}... Sending previously computed, most advanced simulation state ❗"
                     )
                     synapse = attach_files_to_synapse(
-                        synapse=synapse, data_directory=output_dir, state=state
+                        synapse=synapse,
+                        data_directory=output_dir,
+                        state=state,
+                        sent_files=self.sent_files,
+                        response_cache=self.response_cache,
                     )
                 except Exception as e:
                     bt.logging.error(
@@ -320,6 +414,8 @@ class FoldingMiner(BaseMinerNeuron):
                     )
                     state = None
 
+                synapse.md_inputs_held = get_md_inputs_held(output_dir, synapse.pdb_id)
+
                 event["condition"] = "found_existing_data"
                 event["state"] = state
 
@@ -355,6 +451,12 @@ class FoldingMiner(BaseMinerNeuron):
             output_dir=output_dir,
         )
 
+        # The validators only send the inputs again if the miner does not report holding them.
+        synapse.md_inputs_held = inputs_digest(synapse.md_inputs)
+        check_if_directory_exists(output_directory=output_dir)
+        with open(md_inputs_digest_path(output_dir, synapse.pdb_id), "w") as f:
+            f.write(synapse.md_inputs_held)
+
         future = self.executor.submit(
             simulation_manager.run,
             synapse.md_inputs,
@@ -454,22 +556,26 @@ class SimulationManager:
 
         # Make sure the output directory exists and if not, create it
         check_if_directory_exists(output_directory=self.output_dir)
-        os.chdir(self.output_dir)  # TODO: will this be a problem with many processes?
+        state_file = os.path.join(self.output_dir, self.state_file_name)
 
         # The following files are required for GROMACS simulations and are recieved from the validator
         for filename, content in md_inputs.items():
             # Write the file to the output directory
-            with open(filename, "w") as file:
+            with open(os.path.join(self.output_dir, filename), "w") as file:
                 bt.logging.info(f"\nWriting {filename} to {self.output_dir}")
                 file.write(content)
 
         for state, commands in commands.items():
             bt.logging.info(f"Running {state} commands")
-            with open(self.state_file_name, "w") as f:
+            with open(state_file, "w") as f:
                 f.write(f"{state}\n")
 
+            # Commands are run inside the output directory without changing the working directory of the process.
             run_cmd_commands(
-                commands=commands, suppress_cmd_output=suppress_cmd_output, verbose=True
+                commands=commands,
+                suppress_cmd_output=suppress_cmd_output,
+                verbose=True,
+                cwd=self.output_dir,
             )
 
             if mock:
@@ -482,7 +588,7 @@ class SimulationManager:
         bt.logging.success(f"✅ Finished simulation for protein: {self.pdb_id} ✅")
 
         state = "finished"
-        with open(self.state_file_name, "w") as f:
+        with open(state_file, "w") as f:
             f.write(f"{state}\n")
 
     def get_state(self) -> str:
@@ -0,0 +1,97 @@
+"""Cache of the responses of the miner, keyed by the state of the simulation files.
+
+Several validators query the same miner about the same pdb_id, usually more often than mdrun
+writes new frames. The encoded md_output files are cached by (path, size, modification time,
+encoding, offset), and the energy summary of a simulation by the sizes and modification times of
+its edr files. When mdrun appends to a file its size and modification time change, so the entry
+is not used anymore and is evicted in time.
+"""
+
+import os
+import glob
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from folding.utils.compression import encode_file
+
+MAX_ENERGIES = 1000  # simulations whose energy summary is kept.
+
+
+def files_state(paths) -> Tuple:
+    """Name, size and modification time of each file, the key of what was computed from them."""
+    state = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        state.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return tuple(state)
+
+
+class ResponseCache:
+    """Encoded md_output files, up to max_bytes in total, and energy summaries of the miner.
+
+    Args:
+        max_bytes (int): total size of the encoded files that are kept, least recently used first out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._files: "OrderedDict[Tuple, Tuple[bytes, int]]" = OrderedDict()
+        self._energies: "OrderedDict[str, Tuple[Tuple, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode_file(
+        self,
+        path: str,
+        stat: os.stat_result,
+        encoding: Optional[str] = None,
+        offset: int = 0,
+    ) -> Tuple[bytes, int]:
+        """Returns encode_file(path, encoding=encoding, offset=offset) for the file as it was when
+        stat was taken, from the cache if it was encoded before.
+        """
+        key = (path, stat.st_size, stat.st_mtime_ns, encoding, offset)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is not None:
+                self.hits += 1
+                self._files.move_to_end(key)
+                return cached
+            self.misses += 1
+
+        content, size = encode_file(path, encoding=encoding, offset=offset)
+
+        # A file that grew while it was read is not the version of stat, so it is not cached.
+        if offset + size == stat.st_size and len(content) <= self.max_bytes:
+            with self._lock:
+                # Another query may have encoded the same file in the meantime.
+                if key not in self._files:
+                    self._files[key] = (content, size)
+                    self.nbytes += len(content)
+                self._files.move_to_end(key)
+                while self.nbytes > self.max_bytes:
+                    _, (evicted, _) = self._files.popitem(last=False)
+                    self.nbytes -= len(evicted)
+        return content, size
+
+    def get_state_energies(
+        self, output_dir: str, compute: Callable[[str], Dict]
+    ) -> Dict:
+        """Returns compute(output_dir), which is only called again once the edr files changed."""
+        state = files_state(glob.glob(os.path.join(output_dir, "*.edr")))
+        with self._lock:
+            cached = self._energies.get(output_dir)
+            if cached is not None and cached[0] == state:
+                self._energies.move_to_end(output_dir)
+                return dict(cached[1])
+
+        event = compute(output_dir)
+        with self._lock:
+            self._energies[output_dir] = (state, dict(event))
+            self._energies.move_to_end(output_dir)
+            while len(self._energies) > MAX_ENERGIES:
+                self._energies.popitem(last=False)
+        return event
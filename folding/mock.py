@@ -1,10 +1,15 @@
 import time
-
+import json
+import base64
 import asyncio
 import random
+import concurrent.futures
 import bittensor as bt
 
-from typing import List
+from typing import Dict, List, Tuple
+
+from folding.protocol import PingSynapse
+from folding.utils.compression import choose_encoding, compress
 
 
 class MockSubtensor(bt.MockSubtensor):
@@ -51,13 +56,123 @@ class MockMetagraph(bt.metagraph):
         bt.logging.info(f"Axons: {self.axons}")
 
 
+class MockMiner:
+    """A miner that answers the queries of the MockDendrite without running any simulation.
+
+    Job queries are answered with a fixed md_output payload (e.g. replayed .xtc/.tpr/.log files),
+    after a random latency. A fraction of the queries fail with a server error.
+
+    Args:
+        md_output (Dict[str, bytes]): files returned to job queries, by filename.
+        latency (float): mean time (seconds) taken to answer a job query.
+        latency_jitter (float): standard deviation (seconds) of the latency.
+        failure_rate (float): fraction of the job queries that fail with status code 500.
+        can_serve (bool): answer of the miner to ping queries.
+    """
+
+    def __init__(
+        self,
+        md_output: Dict[str, bytes] = None,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        can_serve: bool = True,
+    ):
+        self.md_output = md_output or {}
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.can_serve = can_serve
+        self._bodies = {}
+
+    def body(self, encodings: List[str] = None) -> bytes:
+        """The json body of a successful job response, in which the files are compressed and base64
+        encoded like in the responses of real miners. It is built once per encoding, as the payload
+        does not change.
+        """
+        encoding = choose_encoding(encodings)
+        if encoding not in self._bodies:
+            self._bodies[encoding] = json.dumps(
+                {
+                    "md_output": {
+                        name: base64.b64encode(
+                            compress(content, encoding) if encoding else content
+                        ).decode()
+                        for name, content in self.md_output.items()
+                    },
+                    "md_output_encoding": encoding,
+                    "md_output_sizes": {
+                        name: len(content) for name, content in self.md_output.items()
+                    },
+                }
+            ).encode()
+        return self._bodies[encoding]
+
+    def respond(
+        self, synapse_name: str, encodings: List[str] = None
+    ) -> Tuple[float, int, bytes]:
+        """Answers a query. encodings are the compressions of md_output accepted by the validator.
+
+        Returns:
+            Tuple[float, int, bytes]: latency (seconds), status code and json body of the response.
+        """
+        if synapse_name == PingSynapse.__name__:
+            return 0.0, 200, json.dumps({"can_serve": self.can_serve}).encode()
+
+        latency = max(0.0, random.gauss(self.latency, self.latency_jitter))
+        if random.random() < self.failure_rate:
+            return latency, 500, b""
+        return latency, 200, self.body(encodings)
+
+
+# Miners of the fleet that is served by a subprocess of the MockDendrite, by hotkey.
+_FLEET: Dict[str, MockMiner] = {}
+
+
+def _init_fleet(miners: Dict[str, MockMiner]):
+    global _FLEET
+    _FLEET = miners
+
+
+def _respond(
+    hotkey: str, synapse_name: str, encodings: List[str]
+) -> Tuple[float, int, bytes]:
+    return _FLEET.get(hotkey, MockMiner()).respond(synapse_name, encodings)
+
+
+STATUS_MESSAGES = {200: "OK", 408: "Timeout", 500: "Internal Server Error"}
+
+
 class MockDendrite(bt.dendrite):
     """
-    Replaces a real bittensor network request with a mock request that just returns some static completion for all axons that are passed and adds some random delay.
+    Replaces a real bittensor network request with a mock request that is answered by a fleet of
+    mock miners. Axons without a mock miner are answered by a miner that serves an empty md_output.
+
+    The miners either run in the validator process, or in local subprocesses so that building
+    their responses does not take time from the validator. In both cases the responses are
+    decoded from json by the validator, like the responses of real miners.
+
+    Args:
+        wallet: wallet of the validator.
+        miners (Dict[str, MockMiner], optional): mock miners by hotkey.
+        processes (int): number of subprocesses that serve the miners. If 0, the miners run in-process.
     """
 
-    def __init__(self, wallet):
+    def __init__(self, wallet, miners: Dict[str, MockMiner] = None, processes: int = 0):
         super().__init__(wallet)
+        self.miners = miners or {}
+        self.executor = None
+        if processes > 0:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_fleet,
+                initargs=(self.miners,),
+            )
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
     async def forward(
         self,
@@ -81,20 +196,34 @@ class MockDendrite(bt.dendrite):
                 s = synapse.copy()
                 # Attach some more required data so it looks real
                 s = self.preprocess_synapse_for_request(axon, s, timeout)
-                # We just want to mock the response, so we'll just fill in some data
-                process_time = random.random()
-                if process_time < timeout:
-                    s.dendrite.process_time = str(time.time() - start_time)
-                    # Update the status code and status message of the dendrite to match the axon
-                    s.dummy_output = s.dummy_input * 2
-                    s.dendrite.status_code = 200
-                    s.dendrite.status_message = "OK"
-                    synapse.dendrite.process_time = str(process_time)
+
+                synapse_name = s.__class__.__name__
+                if self.executor is not None:
+                    (
+                        latency,
+                        status_code,
+                        body,
+                    ) = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, _respond, axon.hotkey, synapse_name
+                    )
                 else:
-                    s.dummy_output = ""
-                    s.dendrite.status_code = 408
-                    s.dendrite.status_message = "Timeout"
-                    synapse.dendrite.process_time = str(timeout)
+                    miner = self.miners.get(axon.hotkey, MockMiner())
+                    latency, status_code, body = miner.respond(synapse_name)
+
+                # The miner answers after its latency, unless the query times out first.
+                remaining = latency - (time.time() - start_time)
+                if latency >= timeout:
+                    status_code, body = 408, b""
+                    remaining = timeout - (time.time() - start_time)
+                await asyncio.sleep(max(0.0, remaining))
+
+                if len(body) > 0:
+                    for key, value in json.loads(body).items():
+                        setattr(s, key, value)
+
+                s.dendrite.process_time = str(time.time() - start_time)
+                s.dendrite.status_code = status_code
+                s.dendrite.status_message = STATUS_MESSAGES[status_code]
 
                 # Return the updated synapse object after deserializing if requested
                 if deserialize:
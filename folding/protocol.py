@@ -37,6 +37,14 @@ class JobSubmissionSynapse(bt.Synapse):
     - pdb_id: A Protein id, which contains the necessary details of the protein to be folded.
     - md_inputs: A dictionary containing the input files for the gromacs simulation.
     - mdrun_args: A string containing the arguments to be passed to the gromacs mdrun command.
+    - md_output_encodings: Compressions of md_output that the validator accepts, in order of preference.
+    - md_output_encoding: Compression used by the miner for md_output, None for plain base64.
+    - md_output_sizes: Sizes of the md_output files before compression, filled by the miner.
+    - md_output_transfer_sizes: Sizes of the md_output files as they were received, filled on deserialize.
+    - md_output_offsets: Size and tail digest of the growing files that the validator already holds.
+    - md_output_appended: Offset at which each file of md_output starts, for files of which only the appended tail was sent.
+    - md_inputs_digest: Digest of the inputs of the job. md_inputs is left empty for miners that already hold them.
+    - md_inputs_held: Digest of the inputs that the miner runs the simulation of pdb_id from, filled by the miner.
     """
 
     # Required request input, filled by sending dendrite caller.
@@ -49,8 +57,38 @@ class JobSubmissionSynapse(bt.Synapse):
     # Miner can decide if they are serving the request or not.
     miner_serving: bool = True
 
+    # Compression of md_output is opt-in. Miners that do not know these fields send plain base64 files.
+    md_output_encodings: typing.List[str] = []
+
+    # Incremental transfer of growing files (see folding.utils.incremental). Files that are not in
+    # md_output_appended were sent in full.
+    md_output_offsets: dict = {}
+    md_output_appended: dict = {}
+
+    # The validator only sends md_inputs to miners that do not report holding them (see folding.utils.incremental).
+    md_inputs_digest: typing.Optional[str] = None
+    md_inputs_held: typing.Optional[str] = None
+
     # Optional request output, filled by recieving axon.
     md_output: typing.Optional[dict] = None
+    md_output_encoding: typing.Optional[str] = None
+    md_output_sizes: typing.Optional[dict] = None
+    md_output_transfer_sizes: typing.Optional[dict] = None
+
+    # If set (by the validator), md_output files are decoded into this directory instead of into memory.
+    spool_directory: typing.ClassVar[typing.Optional[str]] = None
+
+    # Compressed md_output files that expand past this size, or past their size in md_output_sizes, are rejected.
+    max_md_output_size: typing.ClassVar[int] = 1024**3
+
+    def get_max_size(self, filename: str) -> int:
+        """Size that a compressed file of md_output may expand to: the size that the miner declared
+        for it in md_output_sizes, and at most max_md_output_size.
+        """
+        declared = (self.md_output_sizes or {}).get(filename)
+        if isinstance(declared, int) and declared >= 0:
+            return min(declared, self.max_md_output_size)
+        return self.max_md_output_size
 
     def deserialize(self) -> int:
         """
@@ -58,20 +96,48 @@ class JobSubmissionSynapse(bt.Synapse):
         the miner in the form of a bytestream, deserializes it and returns it
         as the output of the dendrite.query() call.
 
+        If a spool directory is set, each file is decoded chunk by chunk into a
+        spool file, and md_output holds SpoolFile objects instead of bytes.
+
         Returns:
         - dict: The serialized response, which in this case is the value of md_output.
         """
         bt.logging.info(
             f"Deserializing response from miner, I am: {self.pdb_id}, hotkey: {self.axon.hotkey[:8]}"
         )
+        # Imported here, as folding.utils imports this module.
+        from folding.utils.compression import decompress
+        from folding.utils.spool import spool_base64
+
         # Right here we perform validation that the reponse has expected hash
         if not isinstance(self.md_output, dict):
             self.md_output = {}
         else:
             md_output = {}
-            for k, v in self.md_output.items():
+            self.md_output_transfer_sizes = {}
+            encoded, self.md_output = self.md_output, None
+            for k in list(encoded.keys()):
+                # Files are removed from the response once they are decoded, so their memory can be freed.
+                v = encoded.pop(k)
                 try:
+                    self.md_output_transfer_sizes[k] = len(v)
+                    if self.spool_directory is not None:
+                        md_output[k] = spool_base64(
+                            v,
+                            spool_directory=self.spool_directory,
+                            prefix=f"{self.axon.hotkey[:8]}_{k}_",
+                            encoding=self.md_output_encoding,
+                            max_size=self.get_max_size(k),
+                        )
+                        continue
+
                     md_output[k] = base64.b64decode(v)
+                    if self.md_output_encoding is not None:
+                        md_output[k] = decompress(
+                            md_output[k],
+                            self.md_output_encoding,
+                            max_size=self.get_max_size(k),
+                        )
                 except Exception as e:
                     bt.logging.error(f"Error decoding {k} from md_output: {e}")
                     md_output[k] = None
@@ -1,19 +1,30 @@
 import os
+import ast
+import json
 import random
 import string
+import sqlite3
+import threading
+import zlib
 
 from typing import List
 from queue import Queue
 
 import numpy as np
 import pandas as pd
+import bittensor as bt
 from dataclasses import dataclass, asdict
 
 DB_DIR = os.path.join(os.path.dirname(__file__), "db")
 
 
 class PandasJobStore:
-    """Basic csv-based job store using pandas."""
+    """Basic csv-based job store using pandas.
+
+    Inserts and updates are appended to a journal file next to the csv snapshot, so that each
+    write only costs the size of the changed job. The journal is compacted into the snapshot
+    every `compact_every` records, and replayed on top of the snapshot when the store is loaded.
+    """
 
     columns = {
         # "pdb": "str",
@@ -32,10 +43,19 @@ class PandasJobStore:
         "event": "object",
     }
 
-    def __init__(self, db_path=DB_DIR, table_name="protein_jobs", force_create=False):
+    def __init__(
+        self,
+        db_path=DB_DIR,
+        table_name="protein_jobs",
+        force_create=False,
+        compact_every=100,
+    ):
         self.db_path = db_path
         self.table_name = table_name
         self.file_path = os.path.join(self.db_path, f"{self.table_name}.csv")
+        self.journal_path = os.path.join(self.db_path, f"{self.table_name}.journal")
+        self.compact_every = compact_every
+        self.journal_size = 0
 
         self._db = self.load_table(force_create=force_create)
 
@@ -44,8 +64,17 @@ class PandasJobStore:
         return f"{self.__class__.__name__}\n{self._db.__repr__()}"
 
     def write(self):
-        """The write method writes the current state of the database to a csv file."""
-        self._db.to_csv(self.file_path, index=True, index_label="pdb")
+        """The write method writes the current state of the database to a csv file.
+
+        The snapshot is written to a temporary file and moved into place, so a crash never leaves
+        a truncated csv behind. The journal is emptied once its records are part of the snapshot.
+        """
+        tmp_path = f"{self.file_path}.tmp"
+        self._db.to_csv(tmp_path, index=True, index_label="pdb")
+        os.replace(tmp_path, self.file_path)
+
+        open(self.journal_path, "w").close()
+        self.journal_size = 0
 
     def load_table(self, force_create=False) -> pd.DataFrame:
         """Creates a table in the database to store jobs."""
@@ -60,7 +89,65 @@ class PandasJobStore:
 
         df = pd.read_csv(self.file_path).astype(self.columns).set_index("pdb")
         df["hotkeys"] = df["hotkeys"].apply(eval)
-        return df
+        self._db = df
+
+        records = self.read_journal()
+        if len(records) > 0:
+            bt.logging.info(
+                f"Replaying {len(records)} journal records from {self.journal_path!r}"
+            )
+            for record in records:
+                self._apply(_job_from_record(record["job"]))
+            self.write()
+
+        return self._db
+
+    def read_journal(self) -> List[dict]:
+        """Reads all complete records from the journal. A partially written last record (e.g. from a
+        crash during an append) is ignored.
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+
+        records = []
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    bt.logging.warning(
+                        f"Ignoring incomplete record in journal {self.journal_path!r}"
+                    )
+        return records
+
+    def append(self, op: str, job):
+        """Appends a job mutation to the journal and compacts the journal when it is large enough."""
+        record = json.dumps(
+            {"op": op, "job": _job_to_record(job)}, default=_json_default
+        )
+        with open(self.journal_path, "a") as f:
+            f.write(record + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.journal_size += 1
+        if self.journal_size >= self.compact_every:
+            self.write()
+
+    def _apply(self, job):
+        """Inserts the job into the in-memory table, or updates it if the pdb already exists."""
+        if job.pdb in self._db.index:
+            self._db.update(job.to_frame())
+            return
+
+        frame = job.to_frame()
+        if len(self._db) == 0:
+            self._db = frame  # .astype(self.columns)
+        else:
+            self._db = pd.concat([self._db, frame], ignore_index=False, axis=0)
+
+        self._db.index.name = "pdb"
+        self._db = self._db.astype(self.columns)
 
     def get_queue(self, ready=True) -> Queue:
         """Checks DB for all jobs with active status and returns them as a DataFrame.
@@ -113,25 +200,424 @@ class PandasJobStore:
             updated_at=pd.Timestamp.now().floor("s"),
             epsilon=epsilon,
             **kwargs,
-        ).to_frame()
+        )
 
-        if len(self._db) == 0:
-            self._db = job  # .astype(self.columns)
-        else:
-            self._db = pd.concat([self._db, job], ignore_index=False, axis=0)
+        self._apply(job)
+        self.append(op="insert", job=job)
 
-        self._db.index.name = "pdb"
-        self._db = self._db.astype(self.columns)
+    def update(self, job):
+        """Updates the status of a job in the database."""
+
+        self._apply(job)
+        self.append(op="update", job=job)
+
+    def get_all_pdbs(self) -> List[str]:
+        """Returns the pdbs of all jobs in the store, active or not."""
+        return list(self._db.index)
+
+
+class SQLiteJobStore:
+    """SQLite-based job store. Each job is a single row, so inserts and updates only write that row.
+
+    The database runs in WAL mode, and has indexes on the active and updated_at columns so that the
+    queue of active jobs can be read without scanning the full history of jobs. Hotkeys and events
+    are stored as json.
+
+    Jobs that become inactive are moved to an archive table, where the event is stored compressed.
+    The live table therefore only holds active jobs, and the archived pdbs are kept in memory as a
+    set so that excluding previously used pdbs does not need to read the archive.
+    """
+
+    columns = {
+        "pdb": "TEXT PRIMARY KEY",
+        "ff": "TEXT",
+        "box": "TEXT",
+        "water": "TEXT",
+        "hotkeys": "JSON",
+        "active": "BOOLEAN",
+        "created_at": "TIMESTAMP",
+        "updated_at": "TIMESTAMP",
+        "best_loss": "REAL",
+        "best_loss_at": "TIMESTAMP",
+        "best_hotkey": "TEXT",
+        "commit_hash": "TEXT",
+        "gro_hash": "TEXT",
+        "update_interval": "REAL",  # seconds
+        "updated_count": "INTEGER",
+        "max_time_no_improvement": "REAL",  # seconds
+        "min_updates": "INTEGER",
+        "epsilon": "REAL",
+        "event": "JSON",
+    }
+
+    # The archive stores the event as zlib compressed json.
+    archive_columns = {**columns, "event": "BLOB"}
+
+    def __init__(self, db_path=DB_DIR, table_name="protein_jobs", force_create=False):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.archive_table_name = f"{self.table_name}_archive"
+        self.file_path = os.path.join(self.db_path, f"{self.table_name}.db")
+
+        # The store is read from the challenge buffer thread as well as the main loop.
+        self.lock = threading.Lock()
+        self.connection = self.load_table(force_create=force_create)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.file_path!r}, n_jobs={len(self.get_all_pdbs())})"
+
+    def load_table(self, force_create=False) -> sqlite3.Connection:
+        """Creates the table and its indexes if they do not exist yet. If a csv file from the
+        PandasJobStore exists in the same location, the jobs are migrated from it, until a
+        migration succeeds (see migrate_from_csv).
+        """
+        os.makedirs(self.db_path, exist_ok=True)
+
+        if force_create and os.path.exists(self.file_path):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.file_path + suffix):
+                    os.remove(self.file_path + suffix)
+
+        connection = sqlite3.connect(self.file_path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        columns = ", ".join(f"{name} {dtype}" for name, dtype in self.columns.items())
+        archive_columns = ", ".join(
+            f"{name} {dtype}" for name, dtype in self.archive_columns.items()
+        )
+        with connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table_name} ({columns})"
+            )
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.archive_table_name} ({archive_columns})"
+            )
+            for column in ("active", "updated_at"):
+                connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{self.table_name}_{column} ON {self.table_name} ({column})"
+                )
+
+        self.connection = connection
+
+        # user_version is 0 until the jobs of the csv store (if any) are in the database.
+        if connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+            csv_path = os.path.join(self.db_path, f"{self.table_name}.csv")
+            if not force_create and os.path.exists(csv_path):
+                self.migrate_from_csv(csv_path=csv_path)
+            else:
+                with connection:
+                    connection.execute("PRAGMA user_version = 1")
+
+        self.archived_pdbs = set(
+            row["pdb"]
+            for row in connection.execute(f"SELECT pdb FROM {self.archive_table_name}")
+        )
+        self.archive_inactive()
+
+        return connection
+
+    def migrate_from_csv(self, csv_path: str) -> int:
+        """Copies all jobs from a PandasJobStore csv file into the database. Jobs that are already
+        in the database, or in its archive, are left untouched.
+
+        The jobs are inserted in one transaction, which also records that the migration is done.
+        If it fails, nothing is inserted and the migration is tried again at the next start.
+
+        Returns:
+            int: the number of jobs that were migrated.
+        """
+        db_path, filename = os.path.split(csv_path)
+        csv_store = PandasJobStore(
+            db_path=db_path, table_name=filename.rsplit(".", 1)[0]
+        )
+
+        archived_pdbs = set(
+            row["pdb"]
+            for row in self.connection.execute(
+                f"SELECT pdb FROM {self.archive_table_name}"
+            )
+        )
+
+        jobs = []
+        for pdb, row in csv_store._db.iterrows():
+            if pdb in archived_pdbs:
+                continue
+            job = Job(pdb=pdb, **row.to_dict())
+            if isinstance(job.event, str):
+                job.event = _parse_csv_event(pdb=pdb, event=job.event)
+            if not isinstance(job.event, dict):
+                job.event = {}  # forward_job updates the event of the job.
+            jobs.append(self._to_row(job))
+
+        with self.lock, self.connection:
+            cursor = self.connection.executemany(
+                f"INSERT OR IGNORE INTO {self.table_name} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+                jobs,
+            )
+            self.connection.execute("PRAGMA user_version = 1")
 
-        self.write()
+        bt.logging.info(
+            f"Migrated {cursor.rowcount} jobs from {csv_path!r} to {self.file_path!r}"
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    def _to_row(job) -> tuple:
+        """Converts a job into a row of the table, in the same order as the columns."""
+
+        def timestamp(value):
+            return None if pd.isna(value) else str(pd.Timestamp(value).floor("s"))
+
+        def seconds(value):
+            return pd.Timedelta(value).total_seconds()
+
+        return (
+            job.pdb,
+            job.ff,
+            job.box,
+            job.water,
+            json.dumps(list(job.hotkeys)),
+            bool(job.active),
+            timestamp(job.created_at),
+            timestamp(job.updated_at),
+            float(job.best_loss),
+            timestamp(job.best_loss_at),
+            None if pd.isna(job.best_hotkey) else job.best_hotkey,
+            None if pd.isna(job.commit_hash) else job.commit_hash,
+            None if pd.isna(job.gro_hash) else job.gro_hash,
+            seconds(job.update_interval),
+            int(job.updated_count),
+            seconds(job.max_time_no_improvement),
+            int(job.min_updates),
+            float(job.epsilon),
+            json.dumps(job.event, default=_json_default),
+        )
+
+    @staticmethod
+    def _to_job(row):
+        def timestamp(value):
+            return pd.NaT if value is None else pd.Timestamp(value)
+
+        return Job(
+            pdb=row["pdb"],
+            ff=row["ff"],
+            box=row["box"],
+            water=row["water"],
+            hotkeys=json.loads(row["hotkeys"]),
+            active=bool(row["active"]),
+            created_at=timestamp(row["created_at"]),
+            updated_at=timestamp(row["updated_at"]),
+            best_loss=row["best_loss"],
+            best_loss_at=timestamp(row["best_loss_at"]),
+            best_hotkey=row["best_hotkey"],
+            commit_hash=row["commit_hash"],
+            gro_hash=row["gro_hash"],
+            update_interval=pd.Timedelta(seconds=row["update_interval"]),
+            updated_count=row["updated_count"],
+            max_time_no_improvement=pd.Timedelta(
+                seconds=row["max_time_no_improvement"]
+            ),
+            min_updates=row["min_updates"],
+            epsilon=row["epsilon"],
+            event=json.loads(row["event"]),
+        )
+
+    def get_queue(self, ready=True) -> Queue:
+        """Checks DB for all jobs with active status and returns them as a Queue.
+
+        Args:
+            ready (bool, optional): Return rows where rows of the db have not been updated longer than the update_interval. Defaults to True.
+
+        Returns:
+            Queue: queue with jobs
+        """
+        query = f"SELECT * FROM {self.table_name} WHERE active = 1"
+        params = ()
+        if ready:
+            query += (
+                " AND (julianday(?) - julianday(updated_at)) * 86400 >= update_interval"
+            )
+            params = (str(pd.Timestamp.now().floor("s")),)
+
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        queue = Queue()
+        for row in rows:
+            queue.put(self._to_job(row))
+
+        return queue
+
+    def insert(
+        self,
+        pdb: str,
+        ff: str,
+        box: str,
+        water: str,
+        hotkeys: List[str],
+        epsilon: float,
+        **kwargs,
+    ):
+        """Adds a new job to the database."""
+
+        job = Job(
+            pdb=pdb,
+            ff=ff,
+            box=box,
+            water=water,
+            hotkeys=hotkeys,
+            created_at=pd.Timestamp.now().floor("s"),
+            updated_at=pd.Timestamp.now().floor("s"),
+            epsilon=epsilon,
+            **kwargs,
+        )
+
+        if pdb in self.archived_pdbs:
+            raise ValueError(f"pdb {pdb!r} is already in the store")
+
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    f"INSERT INTO {self.table_name} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+                    self._to_row(job),
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"pdb {pdb!r} is already in the store")
 
     def update(self, job):
-        """Updates the status of a job in the database."""
+        """Updates the status of a job in the database. Jobs that are no longer active are moved to the archive."""
+
+        if not job.active:
+            self._archive([self._to_row(job)])
+            return
+
+        columns = list(self.columns)[1:]  # all columns except the pdb
+        row = self._to_row(job)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"UPDATE {self.table_name} SET {', '.join(f'{c} = ?' for c in columns)} WHERE pdb = ?",
+                (*row[1:], row[0]),
+            )
+
+    def _archive(self, rows: List[tuple]):
+        """Moves rows from the live table to the archive in a single transaction."""
+        archive_rows = [(*row[:-1], zlib.compress(row[-1].encode())) for row in rows]
 
-        job_to_update = job.to_frame()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {self.archive_table_name} ({', '.join(self.archive_columns)}) VALUES ({', '.join('?' * len(self.archive_columns))})",
+                archive_rows,
+            )
+            self.connection.executemany(
+                f"DELETE FROM {self.table_name} WHERE pdb = ?",
+                [(row[0],) for row in rows],
+            )
+            self.archived_pdbs.update(row[0] for row in rows)
 
-        self._db.update(job_to_update)
-        self.write()
+    def archive_inactive(self) -> int:
+        """Moves all inactive jobs in the live table to the archive.
+
+        Returns:
+            int: the number of archived jobs.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT * FROM {self.table_name} WHERE active = 0"
+            ).fetchall()
+
+        if len(rows) > 0:
+            self._archive([tuple(row) for row in rows])
+            bt.logging.info(f"Archived {len(rows)} inactive jobs")
+
+        return len(rows)
+
+    def get_archived_jobs(self) -> List["Job"]:
+        """Reads all jobs from the archive."""
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT * FROM {self.archive_table_name}"
+            ).fetchall()
+
+        jobs = []
+        for row in rows:
+            row = dict(row)
+            row["event"] = zlib.decompress(row["event"]).decode()
+            jobs.append(self._to_job(row))
+        return jobs
+
+    def get_all_pdbs(self) -> List[str]:
+        """Returns the pdbs of all jobs in the store, active or not."""
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT pdb FROM {self.table_name}"
+            ).fetchall()
+            archived_pdbs = list(self.archived_pdbs)
+        return [row["pdb"] for row in rows] + archived_pdbs
+
+
+class _NonFiniteFloats(ast.NodeTransformer):
+    """Replaces the names inf and nan, which repr writes for non-finite floats, by their values."""
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in ("inf", "nan"):
+            return ast.copy_location(ast.Constant(float(node.id)), node)
+        return node
+
+
+def _parse_csv_event(pdb: str, event: str):
+    """Parses an event of the csv store, which holds the repr of a dict. Events that can not be
+    parsed are dropped, so that the rest of the job is still migrated.
+    """
+    try:
+        tree = _NonFiniteFloats().visit(ast.parse(event, mode="eval"))
+        parsed = ast.literal_eval(tree)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError) as e:
+        bt.logging.warning(
+            f"Dropping the event of job {pdb!r}, which can not be parsed: {e}"
+        )
+        return None
+
+    if not isinstance(parsed, dict):
+        bt.logging.warning(f"Dropping the event of job {pdb!r}, which is not a dict")
+        return None
+    return parsed
+
+
+def _json_default(value):
+    """Converts numpy and pandas values in job events to something that json can store."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, pd.Timedelta):
+        return value.total_seconds()
+    return str(value)
+
+
+def _job_to_record(job) -> dict:
+    """Converts a job into a json-serializable dict, used for the journal of the PandasJobStore."""
+    record = job.to_dict()
+    for key, value in record.items():
+        if isinstance(value, pd.Timedelta):
+            record[key] = value.total_seconds()
+        elif isinstance(value, (pd.Timestamp, type(pd.NaT))):
+            record[key] = None if pd.isna(value) else str(value)
+        elif isinstance(value, float) and np.isnan(value):
+            record[key] = None
+    return record
+
+
+def _job_from_record(record: dict):
+    """Inverse of _job_to_record."""
+    record = dict(record)
+    for key in ["created_at", "updated_at", "best_loss_at"]:
+        record[key] = pd.NaT if record[key] is None else pd.Timestamp(record[key])
+    for key in ["update_interval", "max_time_no_improvement"]:
+        record[key] = pd.Timedelta(seconds=record[key])
+    return Job(**record)
 
 
 @dataclass
@@ -0,0 +1,303 @@
+"""Execution of external (gromacs) commands.
+
+Commands are started directly from an argument list when possible, instead of through `/bin/sh`.
+Shell strings that are used throughout the code base (e.g. `echo "SOL" | gmx genion ...`) are
+translated into an argument list and the bytes written to stdin, and only commands that need
+other shell features (redirections, chains, globs, etc.) are still run through the shell.
+
+Each command runs in its own process group, so a timeout or a stop_event kills the command together
+with any processes it started. The output of the command is read while it runs and only the last
+max_output_bytes of stdout and stderr are kept, and the wall time, cpu time and peak memory of the
+command are measured from the rusage and I/O counters of the process.
+"""
+
+import os
+import re
+import time
+import shlex
+import signal
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+MAX_OUTPUT_BYTES = 1024 * 1024  # per stream
+READ_SIZE = 64 * 1024
+
+# Characters that need a shell to be interpreted. Quotes are handled by shlex.
+SHELL_CHARACTERS = re.compile(r"[|&;<>()$`\\*?\[\]#~!{}\n%]")
+PIPED_INPUT_PATTERN = re.compile(r"^\s*(echo|printf)\s+(.*?)\s*\|\s*(.+)$", re.DOTALL)
+
+
+class CommandCancelled(Exception):
+    """Exception raised when a running command is stopped through its stop_event."""
+
+    def __init__(self, message="Command was cancelled"):
+        self.message = message
+        super().__init__(self.message)
+
+
+@dataclass
+class CommandResult:
+    """Output and resource usage of a finished command.
+
+    Attributes:
+        cmd: the command as it was given.
+        args: the arguments that were executed (["/bin/sh", "-c", cmd] if the shell was needed).
+        returncode: exit code of the command, negative if it was killed by a signal.
+        stdout, stderr: the last max_output_bytes of each stream.
+        truncated: True if the beginning of stdout or stderr was dropped.
+        wall_time: seconds between the start and the end of the command.
+        cpu_time: user + system seconds of the command and the processes it waited for.
+        user_time, sys_time: the user and system parts of cpu_time.
+        max_rss: peak resident memory (kB) of the largest process of the command.
+        read_bytes, write_bytes: bytes read and written by the command (including pipes and cached files).
+    """
+
+    cmd: Union[str, List[str]]
+    args: List[str]
+    returncode: int
+    stdout: bytes = b""
+    stderr: bytes = b""
+    truncated: bool = False
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    user_time: float = 0.0
+    sys_time: float = 0.0
+    max_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    timed_out: bool = False
+
+    def to_dict(self) -> Dict:
+        """Timings of the command, in the format used in the event logs."""
+        return {
+            "cmd": self.cmd if isinstance(self.cmd, str) else shlex.join(self.cmd),
+            "returncode": self.returncode,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "max_rss_mb": self.max_rss / 1024,
+            "read_mb": self.read_bytes / 1024**2,
+            "write_mb": self.write_bytes / 1024**2,
+            "timed_out": self.timed_out,
+        }
+
+
+def parse_command(cmd: Union[str, List[str]]) -> Tuple[List[str], Optional[bytes]]:
+    """Translates a command into an argument list and the bytes to write to its stdin.
+
+    Argument lists are returned as is. Strings without shell features are split with shlex, and
+    `echo ... | command` or `printf ... | command` are translated into command with the echo/printf
+    output as stdin. Anything else is run by the shell.
+
+    Returns:
+        Tuple[List[str], Optional[bytes]]: the arguments to execute and the stdin of the command (None if there is none).
+    """
+    if not isinstance(cmd, str):
+        return list(cmd), None
+
+    match = PIPED_INPUT_PATTERN.match(cmd)
+    if match is not None:
+        program, arguments, command = match.groups()
+        try:
+            words = shlex.split(arguments)
+            # Newlines are only taken literally inside of a quoted argument.
+            quoted = arguments[:1] in ("'", '"') and arguments[-1] == arguments[0]
+            if (
+                SHELL_CHARACTERS.search(arguments.replace("\n", "" if quoted else ";"))
+                is None
+            ):
+                args, _ = parse_command(command)
+                if program == "printf" and len(words) == 1:
+                    return args, words[0].encode()
+                if program == "echo" and not any(w.startswith("-") for w in words):
+                    return args, (" ".join(words) + "\n").encode()
+        except ValueError:
+            pass
+
+    elif SHELL_CHARACTERS.search(cmd) is None:
+        try:
+            return shlex.split(cmd), None
+        except ValueError:
+            pass
+
+    return ["/bin/sh", "-c", cmd], None
+
+
+class _OutputReader(threading.Thread):
+    """Reads a stream of a process until it is closed, keeping only its last max_bytes."""
+
+    def __init__(self, stream, max_bytes: int):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self.truncated = False
+        self.start()
+
+    def run(self):
+        while True:
+            chunk = self.stream.read1(READ_SIZE)
+            if not chunk:
+                break
+            self.buffer += chunk
+            # Trimming in large steps keeps the cost of the copy low for commands with a lot of output.
+            if len(self.buffer) > 2 * self.max_bytes:
+                del self.buffer[: len(self.buffer) - self.max_bytes]
+                self.truncated = True
+        self.stream.close()
+
+    def output(self) -> bytes:
+        if len(self.buffer) > self.max_bytes:
+            self.truncated = True
+        return bytes(self.buffer[-self.max_bytes :] if self.max_bytes else b"")
+
+
+def read_io_counters(path: str = "/proc/thread-self/io") -> Dict[str, int]:
+    """Reads the I/O counters of a process or thread (rchar and wchar are the bytes read and written).
+    Returns an empty dict on systems without /proc.
+    """
+    try:
+        with open(path, "r") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def _reap(pid: int):
+    """Reaps an exited (or killed) process, and returns its exit status, rusage and I/O counters.
+    The I/O counters of a process (including the processes it waited for) can only be read before it is reaped.
+    """
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    io = read_io_counters(f"/proc/{pid}/io")
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage, io
+
+
+def _kill(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_command(
+    cmd: Union[str, List[str]],
+    cwd: str = None,
+    stop_event: threading.Event = None,
+    timeout: float = None,
+    max_output_bytes: int = MAX_OUTPUT_BYTES,
+    input: bytes = None,
+    check: bool = True,
+) -> CommandResult:
+    """Runs a single command and measures its resource usage.
+
+    Args:
+        cmd (Union[str, List[str]]): argument list, or a command string (see parse_command).
+        cwd (str, optional): working directory of the command. Defaults to None.
+        stop_event (threading.Event, optional): If set, the command is killed. Defaults to None.
+        timeout (float, optional): seconds after which the command is killed. Defaults to None (no timeout).
+        max_output_bytes (int, optional): number of bytes of stdout and stderr that are kept. Defaults to MAX_OUTPUT_BYTES.
+        input (bytes, optional): bytes written to the stdin of the command, instead of the piped input of cmd.
+        check (bool, optional): raise CalledProcessError if the command fails. Defaults to True.
+
+    Raises:
+        subprocess.CalledProcessError: if check and the command returns a non-zero exit code.
+        subprocess.TimeoutExpired: if the command did not finish within timeout.
+        CommandCancelled: if the stop_event was set while the command was running.
+    """
+    args, piped_input = parse_command(cmd)
+    input = piped_input if input is None else input
+
+    start_time = time.time()
+    try:
+        process = subprocess.Popen(
+            args,
+            cwd=cwd,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    except (FileNotFoundError, PermissionError) as e:
+        # Fail like the shell does when the program does not exist or can not be executed.
+        result = CommandResult(
+            cmd=cmd, args=args, returncode=127, stderr=str(e).encode()
+        )
+        if check:
+            error = subprocess.CalledProcessError(
+                result.returncode, cmd, output=result.stdout, stderr=result.stderr
+            )
+            error.result = result
+            raise error
+        return result
+
+    stdout = _OutputReader(process.stdout, max_output_bytes)
+    stderr = _OutputReader(process.stderr, max_output_bytes)
+
+    if input is not None:
+        try:
+            process.stdin.write(input)
+        except BrokenPipeError:
+            pass  # the command exited without reading its input.
+        finally:
+            process.stdin.close()
+
+    # Wait for the process to exit without reaping it, polling less often the longer it runs.
+    cancelled = timed_out = False
+    interval = 0.001
+    while (
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+    ):
+        if stop_event is not None and stop_event.is_set():
+            cancelled = True
+        elif timeout is not None and time.time() - start_time > timeout:
+            timed_out = True
+
+        if cancelled or timed_out:
+            _kill(process)
+            break
+
+        time.sleep(interval)
+        interval = min(interval * 2, 0.1)
+
+    status, rusage, io = _reap(process.pid)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.time() - start_time
+
+    stdout.join()
+    stderr.join()
+
+    result = CommandResult(
+        cmd=cmd,
+        args=args,
+        returncode=process.returncode,
+        stdout=stdout.output(),
+        stderr=stderr.output(),
+        truncated=stdout.truncated or stderr.truncated,
+        wall_time=wall_time,
+        cpu_time=rusage.ru_utime + rusage.ru_stime,
+        user_time=rusage.ru_utime,
+        sys_time=rusage.ru_stime,
+        max_rss=rusage.ru_maxrss,
+        read_bytes=io.get("rchar", 0),
+        write_bytes=io.get("wchar", 0),
+        timed_out=timed_out,
+    )
+
+    if cancelled:
+        raise CommandCancelled(f"Command was cancelled: {cmd}")
+    if timed_out:
+        error = subprocess.TimeoutExpired(
+            cmd, timeout, output=result.stdout, stderr=result.stderr
+        )
+        error.result = result
+        raise error
+    if check and result.returncode != 0:
+        error = subprocess.CalledProcessError(
+            result.returncode, cmd, output=result.stdout, stderr=result.stderr
+        )
+        error.result = result
+        raise error
+
+    return result
@@ -0,0 +1,189 @@
+"""Compression of the md_output files that miners send to validators.
+
+The validator lists the encodings that it accepts in the synapse, and the miner compresses each
+file with the first of them that it supports. The compressed files are still base64 encoded, as
+the synapse is sent as json. Miners and validators that do not know about encodings keep sending
+and reading plain base64 files.
+
+zstd is used when the zstandard package is installed, gzip is always available.
+
+The files come from miners, so they are decompressed in bounded chunks and rejected as soon as
+they expand past a maximum size: a small compressed file could otherwise expand to gigabytes.
+"""
+
+import io
+import os
+import mmap
+import zlib
+import base64
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024**2  # files are read and compressed 1MB at a time.
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+GZIP_WBITS = 31  # zlib stream with a gzip header and trailer.
+MAX_DECOMPRESSED_SIZE = 1024**3  # bytes that a single file may expand to.
+
+
+def available_encodings() -> List[str]:
+    """Encodings that can be used in this environment, in order of preference."""
+    encodings = ["gzip"]
+    if zstandard is not None:
+        encodings.insert(0, "zstd")
+    return encodings
+
+
+def choose_encoding(accepted: Optional[List[str]]) -> Optional[str]:
+    """Returns the first of the accepted encodings that is available, or None for plain base64."""
+    available = available_encodings()
+    for encoding in accepted or []:
+        if encoding in available:
+            return encoding
+    return None
+
+
+def _compressor(encoding: str):
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    if encoding == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+    raise ValueError(f"Unsupported md_output encoding {encoding!r}")
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _release(view: mmap.mmap, start: int, end: int):
+    """Drops the pages of a read-only mapping between start and end from the resident memory of
+    the process. They stay in the page cache, so reading them again does not hit the disk.
+    """
+    start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+    if end > start and hasattr(mmap, "MADV_DONTNEED"):
+        view.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def encode_file(
+    path: str,
+    encoding: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    offset: int = 0,
+) -> Tuple[bytes, int]:
+    """Base64 encodes a file from offset, compressing it first if encoding is set.
+
+    The file is memory-mapped and encoded chunk by chunk: neither the file nor its compressed copy
+    is ever held in memory in full, and the pages of each chunk are released once it is encoded.
+    Only the base64 output, which is sent in the json body of the synapse, grows with the file.
+
+    Returns:
+        Tuple[bytes, int]: the base64 encoded file, and the number of bytes that were read. Files
+            that are still being written to (e.g. by mdrun) can have grown since.
+    """
+    compressor = _compressor(encoding) if encoding is not None else None
+    output = io.BytesIO()
+    pending = (
+        b""  # base64 encodes 3 bytes at a time, the rest is kept for the next chunk.
+    )
+
+    def write(data: bytes):
+        nonlocal pending
+        data = pending + data
+        end = len(data) - len(data) % 3
+        output.write(base64.b64encode(data[:end]))
+        pending = data[end:]
+
+    with open(path, "rb") as f:
+        size = max(0, os.fstat(f.fileno()).st_size - offset)
+        if size > 0:  # empty files can not be mapped.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                size = max(0, len(view) - offset)
+                for start in range(offset, offset + size, chunk_size):
+                    end = min(start + chunk_size, offset + size)
+                    chunk = view[start:end]
+                    write(compressor.compress(chunk) if compressor else chunk)
+                    _release(view, start, end)
+
+    if compressor is not None:
+        write(compressor.flush())
+    output.write(base64.b64encode(pending))
+    return output.getvalue(), size
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file object over an iterable of bytes, for zstd stream readers."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _decompress_chunks(
+    chunks: Iterable[bytes], encoding: str, chunk_size: int
+) -> Iterator[bytes]:
+    if encoding == "zstd" and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            _ChunkReader(chunks), read_across_frames=True
+        )
+        yield from iter(lambda: reader.read(chunk_size), b"")
+        return
+
+    if encoding != "gzip":
+        raise ValueError(f"Unsupported md_output encoding {encoding!r}")
+
+    stream = zlib.decompressobj(GZIP_WBITS)
+    for chunk in chunks:
+        # max_length bounds the output of each call, the rest of the input is kept in unconsumed_tail.
+        while chunk:
+            output = stream.decompress(chunk, chunk_size)
+            chunk = stream.unconsumed_tail
+            if output:
+                yield output
+    output = stream.flush()
+    if output:
+        yield output
+
+
+def iter_decompress(
+    chunks: Iterable[bytes],
+    encoding: str,
+    max_size: int = MAX_DECOMPRESSED_SIZE,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Decompresses a stream of compressed chunks, chunk_size bytes of output at a time.
+
+    Raises:
+        ValueError: as soon as the output exceeds max_size bytes, before it is held in memory.
+    """
+    size = 0
+    for output in _decompress_chunks(chunks, encoding, chunk_size):
+        size += len(output)
+        if size > max_size:
+            raise ValueError(f"Decompressed file exceeds {max_size} bytes")
+        yield output
+
+
+def decompress(
+    data: bytes, encoding: str, max_size: int = MAX_DECOMPRESSED_SIZE
+) -> bytes:
+    """Decompresses data, see iter_decompress."""
+    return b"".join(iter_decompress([data], encoding, max_size=max_size))
@@ -99,6 +99,13 @@ def add_args(cls, parser):
         default=False,
     )
 
+    parser.add_argument(
+        "--neuron.mock_n_miners",
+        type=int,
+        help="The number of miners registered on the mock subtensor.",
+        default=16,
+    )
+
     parser.add_argument(
         "--protein.pdb_id",
         type=str,
@@ -176,6 +183,20 @@ def add_args(cls, parser):
         default=True,
     )
 
+    parser.add_argument(
+        "--protein.cmd_timeout",
+        type=float,
+        help="Time (seconds) that a single gromacs command is allowed to run before it is killed. If None, there is no limit.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--protein.cmd_max_output_bytes",
+        type=int,
+        help="Number of bytes of the stdout and stderr of each gromacs command that are kept for logging.",
+        default=1024 * 1024,
+    )
+
     parser.add_argument(
         "--protein.force_use_pdb",
         action="store_true",
@@ -204,6 +225,13 @@ def add_args(cls, parser):
         default=False,
     )
 
+    parser.add_argument(
+        "--neuron.trace_path",
+        type=str,
+        help="If set, the traced gromacs commands and Protein methods are appended to this Chrome trace (JSON) file.",
+        default=None,
+    )
+
     parser.add_argument(
         "--wandb.off",
         action="store_true",
@@ -257,6 +285,13 @@ def add_miner_args(cls, parser):
         default=8,
     )
 
+    parser.add_argument(
+        "--neuron.response_cache_mb",
+        type=int,
+        help="Size of the cache of encoded md_output files that are sent to validators, in MB. 0 disables it.",
+        default=512,
+    )
+
     parser.add_argument(
         "--blacklist.force_validator_permit",
         action="store_true",
@@ -309,6 +344,41 @@ def add_validator_args(cls, parser):
         default=3,
     )
 
+    parser.add_argument(
+        "--neuron.compress_md_output",
+        action="store_true",
+        help="Asks miners to compress the files of md_output (zstd or gzip). Miners that do not support it send them uncompressed.",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--neuron.incremental_md_output",
+        action="store_true",
+        help="Asks miners to only send what was appended to their trajectory and log since the last query. Miners that do not support it send the full files.",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--neuron.md_inputs_cache_mb",
+        type=int,
+        help="Size of the in-memory cache of the input files of jobs, in MB. 0 disables it.",
+        default=256,
+    )
+
+    parser.add_argument(
+        "--neuron.max_md_output_mb",
+        type=int,
+        help="Size in MB past which a compressed md_output file from a miner is rejected while it is decompressed.",
+        default=1024,
+    )
+
+    parser.add_argument(
+        "--neuron.spool_md_output",
+        action="store_true",
+        help="Decodes the md_output files of miners to disk (data/spool) as they arrive, instead of holding them in memory.",
+        default=False,
+    )
+
     parser.add_argument(
         "--neuron.update_interval",
         type=float,
@@ -319,8 +389,36 @@ def add_validator_args(cls, parser):
     parser.add_argument(
         "--neuron.num_concurrent_forwards",
         type=int,
-        help="The number of concurrent forwards running at any time.",
-        default=1,
+        help="The maximum number of jobs whose miners are queried concurrently in a single round.",
+        default=4,
+    )
+
+    parser.add_argument(
+        "--neuron.verification_workers",
+        type=int,
+        help="The number of processes used to verify miner outputs in parallel.",
+        default=10,
+    )
+
+    parser.add_argument(
+        "--neuron.verification_timeout",
+        type=float,
+        help="The time allowed to verify the output of a single miner. (seconds)",
+        default=600,
+    )
+
+    parser.add_argument(
+        "--neuron.challenge_buffer_size",
+        type=int,
+        help="The number of challenges that are prepared ahead of time in the background. If 0, challenges are prepared when a job is created.",
+        default=2,
+    )
+
+    parser.add_argument(
+        "--neuron.db_path",
+        type=str,
+        help="Directory of the job store database. Defaults to folding/db.",
+        default=None,
     )
 
     parser.add_argument(
@@ -368,6 +466,13 @@ def add_validator_args(cls, parser):
         default=4096,
     )
 
+    parser.add_argument(
+        "--protein.hp_search_workers",
+        type=int,
+        help="The number of hyperparameter combinations that are prepared at the same time. The first that succeeds is used.",
+        default=1,
+    )
+
     parser.add_argument(
         "--wandb.project_name",
         type=str,
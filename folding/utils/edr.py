@@ -0,0 +1,226 @@
+"""In-process reader for GROMACS energy (.edr) files.
+
+An edr file is written with XDR (big endian). It starts with the names and units of the energy
+terms, followed by one frame per energy output step. Like every string that GROMACS writes,
+names and units are preceded by their size (including the null terminator) and then written
+as XDR strings:
+
+    frame header: magic real, magic int, version, time, step, nsum, nsteps, dt, nre, nblock, ...
+    energies: nre values (e), or nre triplets (e, eav, esum) if nsum > 0
+    blocks: extra data, such as free energy or restraint data
+
+Reals are floats or doubles depending on the precision of the GROMACS build that wrote the file.
+Only files written by GROMACS versions that use file version >= 4 (GROMACS 4.5 and later) are supported.
+"""
+
+import os
+import mmap
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+ENX_MAGIC = -55555
+FRAME_MAGIC = -7777777
+FRAME_MAGIC_REAL = -2e10
+
+# xdr_datatype in GROMACS: int, float, double, int64 (char and string blocks are not supported).
+BLOCK_ITEM_SIZES = {0: 4, 1: 4, 2: 8, 3: 8}
+
+
+class EDRFormatError(Exception):
+    """Exception raised when an edr file can not be read."""
+
+    def __init__(self, message="Unsupported or corrupt edr file"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class EDRReader:
+    """Reads the energy terms of an edr file without calling `gmx energy`.
+
+    Args:
+        edr_path (str): location of the edr file.
+    """
+
+    def __init__(self, edr_path: str):
+        self.edr_path = edr_path
+
+        with open(edr_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise EDRFormatError(f"{edr_path!r} is empty")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self.names, self.units, self.data_offset = self._read_names()
+            self.real_size = self._detect_precision()
+        except struct.error:
+            raise EDRFormatError(f"{edr_path!r} has an incomplete header")
+
+        self.real_dtype = ">f4" if self.real_size == 4 else ">f8"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.buffer.close()
+
+    def _read_int(self, offset: int) -> Tuple[int, int]:
+        return struct.unpack_from(">i", self.buffer, offset)[0], offset + 4
+
+    def _read_string(self, offset: int) -> Tuple[str, int]:
+        """Reads a string the way gmx_fio_do_string writes it: an int with the size of the
+        string including its null terminator, followed by the XDR string (length and padded bytes).
+        """
+        size, offset = self._read_int(offset)
+        length, offset = self._read_int(offset)
+        if size != length + 1:
+            raise EDRFormatError(
+                f"{self.edr_path!r} has a corrupt string at offset {offset - 8}"
+            )
+        value = bytes(self.buffer[offset : offset + length]).decode()
+        return value, offset + (length + 3) // 4 * 4  # strings are padded to 4 bytes
+
+    def _read_names(self) -> Tuple[List[str], List[str], int]:
+        magic, offset = self._read_int(0)
+        if magic > 0:
+            raise EDRFormatError(f"{self.edr_path!r} uses the pre GROMACS 4.5 format")
+        if magic != ENX_MAGIC:
+            raise EDRFormatError(f"{self.edr_path!r} is not an edr file")
+
+        file_version, offset = self._read_int(offset)
+        if file_version < 4:
+            raise EDRFormatError(
+                f"{self.edr_path!r} has unsupported file version {file_version}"
+            )
+        nre, offset = self._read_int(offset)
+
+        names, units = [], []
+        for _ in range(nre):
+            name, offset = self._read_string(offset)
+            unit, offset = self._read_string(offset)
+            names.append(name)
+            units.append(unit)
+
+        return names, units, offset
+
+    def _detect_precision(self) -> int:
+        """Each frame starts with the real -2e10, which tells if the file is single or double precision."""
+        if len(self.buffer) <= self.data_offset:
+            return 4  # no frames were written yet.
+
+        if struct.unpack_from(">f", self.buffer, self.data_offset)[0] < -1e10:
+            return 4
+        if struct.unpack_from(">d", self.buffer, self.data_offset)[0] < -1e10:
+            return 8
+        raise EDRFormatError(f"{self.edr_path!r} has an unknown frame header")
+
+    def _read_frame_header(self, offset: int) -> Dict:
+        """Reads the header of the frame at offset, and computes where its energies and the next frame start."""
+        offset += self.real_size  # FRAME_MAGIC_REAL
+        magic, offset = self._read_int(offset)
+        if magic != FRAME_MAGIC:
+            raise EDRFormatError(f"{self.edr_path!r} has a corrupt frame at {offset}")
+
+        file_version, time, step, nsum = struct.unpack_from(
+            ">idqi", self.buffer, offset
+        )
+        offset += 24
+        offset += 8  # nsteps (int64)
+        if file_version >= 5:
+            offset += 8  # dt (double)
+        nre, _, nblock = struct.unpack_from(">iii", self.buffer, offset)
+        offset += 12
+
+        block_size = 0
+        for _ in range(nblock):
+            _, nsub = struct.unpack_from(">ii", self.buffer, offset)
+            offset += 8
+            for _ in range(nsub):
+                dtype, nr = struct.unpack_from(">ii", self.buffer, offset)
+                offset += 8
+                if dtype not in BLOCK_ITEM_SIZES:
+                    raise EDRFormatError(
+                        f"{self.edr_path!r} has unsupported block data type {dtype}"
+                    )
+                block_size += BLOCK_ITEM_SIZES[dtype] * nr
+
+        offset += 12  # e_size and two reserved ints
+
+        values_per_term = 3 if nsum > 0 else 1
+        energy_size = nre * values_per_term * self.real_size
+
+        return {
+            "time": time,
+            "step": step,
+            "nre": nre,
+            "values_per_term": values_per_term,
+            "energy_offset": offset,
+            "next_offset": offset + energy_size + block_size,
+        }
+
+    def frames(self) -> List[Dict]:
+        """Reads the headers of all complete frames in the file. A frame that is still being written is ignored."""
+        frames = []
+        offset = self.data_offset
+        while offset < len(self.buffer):
+            try:
+                frame = self._read_frame_header(offset)
+            except struct.error:
+                break
+            if frame["next_offset"] > len(self.buffer):
+                break
+            frames.append(frame)
+            offset = frame["next_offset"]
+        return frames
+
+    def read(
+        self, terms: List[str] = None, last_only: bool = False
+    ) -> Dict[str, np.ndarray]:
+        """Reads energy terms from the file.
+
+        Args:
+            terms (List[str], optional): names of the energy terms, e.g. ["Potential"]. Defaults to all terms.
+            last_only (bool, optional): only read the last frame. Defaults to False.
+
+        Returns:
+            Dict[str, np.ndarray]: time (ps) and step of each frame, and the values of each term.
+        """
+        terms = self.names if terms is None else terms
+        missing = [term for term in terms if term not in self.names]
+        if len(missing) > 0:
+            raise KeyError(f"Energy terms {missing} are not in {self.edr_path!r}")
+        indices = [self.names.index(term) for term in terms]
+
+        frames = self.frames()
+        if last_only:
+            frames = frames[-1:]
+
+        data = {
+            "time": np.array([frame["time"] for frame in frames], dtype=np.float64),
+            "step": np.array([frame["step"] for frame in frames], dtype=np.int64),
+        }
+        values = np.zeros((len(frames), len(terms)), dtype=np.float64)
+        for i, frame in enumerate(frames):
+            if frame["nre"] == 0:
+                values[i] = np.nan  # frames without energies only hold block data.
+                continue
+            start = frame["energy_offset"]
+            end = start + frame["nre"] * frame["values_per_term"] * self.real_size
+            energies = np.frombuffer(self.buffer[start:end], dtype=self.real_dtype)
+            values[i] = energies[:: frame["values_per_term"]][indices]
+
+        for j, term in enumerate(terms):
+            data[term] = values[:, j]
+        return data
+
+
+def read_edr(
+    edr_path: str, terms: List[str] = None, last_only: bool = False
+) -> Dict[str, np.ndarray]:
+    """Reads energy terms from an edr file. See EDRReader.read."""
+    with EDRReader(edr_path) as reader:
+        return reader.read(terms=terms, last_only=last_only)
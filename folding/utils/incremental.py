@@ -0,0 +1,168 @@
+"""Incremental transfer of the files that grow during a simulation (trajectory and log).
+
+The validator keeps the files of each miner in its miner data directory. On the next query it
+sends, for each of the growing files, the size of its copy and a digest of the last bytes of it.
+If the file of the miner still holds the same bytes at that position, the miner only sends what was
+appended since, and the validator appends it to its copy. Otherwise (e.g. the miner restarted its
+simulation, or the validator has no copy) the full file is sent.
+
+The other files (e.g. tpr and cpt) are rewritten rather than appended to, so the tail digest does
+not tell whether they changed. The miner keeps the version (size and modification time) of the
+files it sent to each validator in a SentFiles cache, and sends nothing for a file that did not
+change since, as long as the validator still holds it.
+
+The inputs of a job (md_inputs) go the other way: the validator sends their digest, the miner
+answers with the digest of the inputs it runs the simulation from, and the validator only sends
+the inputs again to miners that do not hold them.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, Union
+
+from folding.utils.spool import SpoolFile
+
+INCREMENTAL_EXTENSIONS = ("xtc", "log")
+DIGEST_BYTES = 1024**2  # the last MB before the offset must be the same on both sides.
+MAX_SENT_FILES = 10_000  # (validator, file) pairs remembered by the miner.
+
+
+def tail_digest(path: str, size: int) -> str:
+    """Hashes the last DIGEST_BYTES of the first size bytes of a file."""
+    with open(path, "rb") as f:
+        f.seek(max(0, size - DIGEST_BYTES))
+        return hashlib.md5(f.read(size - f.tell())).hexdigest()
+
+
+def get_file_offsets(directory: str) -> Dict[str, Dict]:
+    """Returns the size and tail digest of the files of a miner data directory, by filename."""
+    offsets = {}
+    if not os.path.isdir(directory):
+        return offsets
+
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        if size > 0:
+            offsets[filename] = {"size": size, "digest": tail_digest(path, size)}
+    return offsets
+
+
+def inputs_digest(files: Dict[str, Union[str, bytes]]) -> str:
+    """Digest of a set of files, which does not depend on their order."""
+    digest = hashlib.md5()
+    for name in sorted(files):
+        content = files[name]
+        content = content.encode() if isinstance(content, str) else content
+        digest.update(f"{name}:{len(content)}:".encode())
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def is_incremental(path: str) -> bool:
+    return path.split(".")[-1] in INCREMENTAL_EXTENSIONS
+
+
+def get_append_offset(path: str, offset: Optional[Dict]) -> int:
+    """Returns the position from which a file has to be sent: the size of the copy of the
+    validator if the file starts with the same bytes, or 0 to send the full file.
+    """
+    try:
+        size = int(offset["size"])
+        if (
+            os.path.getsize(path) >= size
+            and tail_digest(path, size) == offset["digest"]
+        ):
+            return size
+    except (TypeError, KeyError, ValueError, OSError):
+        pass
+    return 0
+
+
+def append_file(path: str, offset: int, content: Union[bytes, SpoolFile]):
+    """Writes the content that a miner appended to a file after offset, onto the local copy.
+
+    Raises:
+        ValueError: if the local copy is missing or shorter than offset, so the file can not be rebuilt.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < offset:
+        raise ValueError(
+            f"Can not append to {path!r} at offset {offset}, the local copy is missing or too short"
+        )
+
+    with open(path, "r+b") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        if isinstance(content, SpoolFile):
+            content.copy_to(f)
+        else:
+            f.write(content)
+
+
+class SentFiles:
+    """Versions of the files that the miner sent to each validator, by (validator hotkey, path).
+
+    A version is the size and modification time of the file when it was sent, along with the tail
+    digest of it, which is computed once per version. The axon handlers of the miner use it from
+    several threads at the same time.
+    """
+
+    def __init__(self, max_size: int = MAX_SENT_FILES):
+        self.max_size = max_size
+        self._versions: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def add(self, validator: str, path: str, stat: os.stat_result):
+        """Records that the file, as it was when stat was taken, was sent to the validator."""
+        with self._lock:
+            self._versions[(validator, path)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "digest": None,
+            }
+            self._versions.move_to_end((validator, path))
+            while len(self._versions) > self.max_size:
+                self._versions.popitem(last=False)
+
+    @staticmethod
+    def _is_version(version: Optional[Dict], stat: os.stat_result) -> bool:
+        """Whether version is the file as it was when stat was taken."""
+        return version is not None and (version["size"], version["mtime_ns"]) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def is_unchanged(
+        self,
+        validator: str,
+        path: str,
+        stat: os.stat_result,
+        offset: Optional[Dict],
+    ) -> bool:
+        """Whether the file did not change since it was sent to the validator, and the validator
+        still holds that version of it (offset, see get_file_offsets).
+        """
+        with self._lock:
+            version = self._versions.get((validator, path))
+            version = None if version is None else dict(version)
+        if offset is None or not self._is_version(version, stat):
+            return False
+
+        try:
+            if int(offset["size"]) != stat.st_size:
+                return False
+            if version["digest"] is None:
+                version["digest"] = tail_digest(path, stat.st_size)
+                with self._lock:
+                    # The file may have been sent again while the digest was computed.
+                    current = self._versions.get((validator, path))
+                    if self._is_version(current, stat):
+                        current["digest"] = version["digest"]
+            return version["digest"] == offset["digest"]
+        except (TypeError, KeyError, ValueError, OSError):
+            return False
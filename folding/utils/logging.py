@@ -7,6 +7,12 @@ import datetime as dt
 
 import folding
 import bittensor as bt
+from folding.utils.tracing import (
+    tracer,
+    current_job,
+    summarize_spans,
+    append_chrome_trace,
+)
 
 
 @dataclass
@@ -74,6 +80,13 @@ def init_wandb(self, reinit=False):
 
 
 def log_event(self, event):
+    # Summarize the gromacs commands and Protein methods that ran for this job since its last event.
+    spans = tracer.drain_job(current_job.get())
+    if len(spans) > 0:
+        event["trace_summary"] = summarize_spans(spans)
+        if self.config.neuron.trace_path is not None:
+            append_chrome_trace(self.config.neuron.trace_path, spans)
+
     if not self.config.neuron.dont_save_events:
         logger.log("EVENTS", "events", **event)
 
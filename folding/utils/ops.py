@@ -1,4 +1,5 @@
 import hashlib
+import json
 import os
 import pickle as pkl
 import random
@@ -6,14 +7,23 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
 import traceback
-from typing import Dict, List
+from typing import Dict, List, Union
 
 import bittensor as bt
+import pandas as pd
 import requests
-import tqdm
 
 from folding.protocol import JobSubmissionSynapse
+from folding.utils.edr import read_edr
+from folding.utils.commands import (
+    run_command,
+    CommandResult,
+    CommandCancelled,
+    MAX_OUTPUT_BYTES,
+)
+from folding.utils.tracing import tracer
 
 # Recommended force field-water pairs, retrieved from gromacs-2024.1/share/top
 FF_WATER_PAIRS = {
@@ -82,6 +92,9 @@ def select_random_pdb_id(PDB_IDS: Dict, exclude: list = None) -> str:
             return selected_pdb_id
 
 
+GRO_ATOM_PATTERN = re.compile(rb"\s*(-?\d+\w+)\s+(\w+'?\d*\s*\d+)\s+(\-?\d+\.\d+)")
+
+
 def gro_hash(gro_path: str):
     """Generates the hash for a specific gro file.
     Enables validators to ensure that miners are running the correct
@@ -96,53 +109,135 @@ def gro_hash(gro_path: str):
 
     Output: 10LYSN1LYSH12
 
+    The file is read line by line through a buffered reader and each line is fed to the
+    hash directly, so memory use does not grow with the number of atoms.
+
     Args:
         gro_path (str): location to the gro file
     """
     bt.logging.info(f"Calculating hash for path {gro_path!r}")
-    pattern = re.compile(r"\s*(-?\d+\w+)\s+(\w+'?\d*\s*\d+)\s+(\-?\d+\.\d+)")
+    md5 = hashlib.md5()
 
-    with open(gro_path, "rb") as f:
-        name, length, *lines, _ = f.readlines()
+    with open(gro_path, "rb", buffering=1024 * 1024) as f:
+        name, length = f.readline(), f.readline()
         name = (
             name.decode().split(" t=")[0].strip("\n").encode()
         )  # if we are rerunning the gro file using trajectory, we need to include this
         length = int(length)
-        bt.logging.info(f"{name=}, {length=}, {len(lines)=}")
+        md5.update(name)
+
+        # The last line of the file holds the box vectors, so each line is only hashed once the next one is read.
+        n_lines = 0
+        previous = f.readline()
+        if not previous:
+            raise ValueError(f"Error parsing {gro_path!r}: missing box vectors")
+
+        for line in f:
+            line, previous = previous.strip(), line
+            match = GRO_ATOM_PATTERN.match(line)
+            if not match:
+                raise Exception(
+                    f"Error parsing line in {gro_path!r}: {line.decode()!r}"
+                )
+            md5.update(match.group(1))
+            md5.update(match.group(2).replace(b" ", b""))
+            n_lines += 1
+
+    bt.logging.info(f"{name=}, {length=}, {n_lines=}")
+    return md5.hexdigest()
+
+
+def cached_gro_hash(gro_path: str) -> str:
+    """Returns the gro_hash of a file that does not change, like the em.gro of a validator.
+
+    The hash is stored in a sidecar file next to the gro file (`<gro_path>.hash`) together with
+    the size and modification time of the gro file. It is only recomputed when these change.
+
+    Args:
+        gro_path (str): location to the gro file
+    """
+    stat = os.stat(gro_path)
+    cache_path = f"{gro_path}.hash"
+
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+        if cache["size"] == stat.st_size and cache["mtime_ns"] == stat.st_mtime_ns:
+            return cache["hash"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    cache = {
+        "hash": gro_hash(gro_path=gro_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+    # Several verification processes can compute the hash at the same time.
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+    return cache["hash"]
+
+
+def get_energy_from_edr(
+    edr_file: str,
+    data_type: str = "Potential",
+    last_only: bool = False,
+    xvg_file: str = None,
+) -> pd.DataFrame:
+    """Reads an energy term from an edr file.
+
+    The file is read in-process with the EDRReader. If it can not be read (e.g. an old or
+    unsupported file format), the term is extracted with gmx energy instead.
+
+    Args:
+        edr_file (str): location of the edr file
+        data_type (str): name of the energy term, e.g. Potential
+        last_only (bool): only return the last frame
+        xvg_file (str): xvg file written by the gmx energy fallback. Defaults to the edr file with a .xvg extension.
+
+    Returns:
+        pd.DataFrame: time (ps) and energy of each frame
+    """
+    try:
+        data = read_edr(edr_file, terms=[data_type], last_only=last_only)
+        return pd.DataFrame({"time": data["time"], "energy": data[data_type]})
+    except Exception as e:
+        bt.logging.warning(
+            f"Failed to read {edr_file!r} in-process with error: {e}. Falling back to gmx energy."
+        )
 
-    buf = ""
-    for line in lines:
-        line = line.decode().strip()
-        match = pattern.match(line)
-        if not match:
-            raise Exception(f"Error parsing line in {gro_path!r}: {line!r}")
-        buf += match.group(1) + match.group(2).replace(" ", "")
+    output_dir = os.path.dirname(edr_file)
+    xvg_file = xvg_file or os.path.splitext(edr_file)[0] + ".xvg"
+    command = [
+        f"printf '{data_type}\n0\n' | gmx energy -f {edr_file} -o {xvg_file} -xvg none -nobackup"
+    ]
+    run_cmd_commands(command, cwd=output_dir or None)
 
-    return hashlib.md5(name + buf.encode()).hexdigest()
+    df = pd.read_csv(xvg_file, sep="\s+", header=None, names=["time", "energy"])
+    return df.tail(1).reset_index(drop=True) if last_only else df
 
 
 def calc_potential_from_edr(
     output_dir: str = None, edr_name: str = "em.edr", xvg_name: str = "_tmp.xvg"
 ):
-    """Calculate the potential energy from an edr file using gmx energy.
+    """Calculate the potential energy from an edr file.
     Args:
         output_dir (str): directory containing the edr file
         edr_name (str): name of the edr file
-        xvg_name (str): name of the xvg file
+        xvg_name (str): name of the xvg file, only written if gmx energy is needed
 
     Returns:
         float: potential energy
     """
     edr_file = os.path.join(output_dir, edr_name)
     xvg_file = os.path.join(output_dir, xvg_name)
-    command = [f"echo 'Potential' | gmx energy -f {edr_file} -o {xvg_file} -nobackup"]
 
-    run_cmd_commands(command, verbose=True)
-
-    # Just take the last line of the 2 column xvg file (step, energy) and report the energy
-    with open(xvg_file, "r") as f:
-        lines = [line.strip("\n") for line in f.readlines()]
-        return float(lines[-1].split()[-1])
+    df = get_energy_from_edr(edr_file=edr_file, last_only=True, xvg_file=xvg_file)
+    return float(df["energy"].iloc[-1])
 
 
 def check_if_directory_exists(output_directory):
@@ -162,29 +257,83 @@ def get_tracebacks():
 
 
 def run_cmd_commands(
-    commands: List[str], suppress_cmd_output: bool = True, verbose: bool = False
-):
-    for cmd in tqdm.tqdm(commands):
-        bt.logging.debug(f"Running command: {cmd}")
-
-        try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+    commands: List[Union[str, List[str]]],
+    suppress_cmd_output: bool = True,
+    verbose: bool = False,
+    cwd: str = None,
+    stop_event: threading.Event = None,
+    timeout: float = None,
+    max_output_bytes: int = MAX_OUTPUT_BYTES,
+    timings: List[Dict] = None,
+) -> List[CommandResult]:
+    """Run a list of commands one after another.
+
+    Args:
+        commands (List[Union[str, List[str]]]): commands to run, as argument lists or shell strings (see run_command).
+        suppress_cmd_output (bool, optional): If False, the stdout of each command is logged. Defaults to True.
+        verbose (bool, optional): If True, the output of failed commands is logged. Defaults to False.
+        cwd (str, optional): working directory of the commands. Relative paths and any files that gromacs
+            writes by default (mdout.mdp, backups, etc.) are resolved against this directory rather than the
+            working directory of the process, so commands for different directories can run at the same time.
+            Defaults to None (the working directory of the process).
+        stop_event (threading.Event, optional): If set, the running command is killed and the remaining
+            commands are skipped by raising CommandCancelled. Defaults to None.
+        timeout (float, optional): seconds that each command is allowed to take. Defaults to None (no timeout).
+        max_output_bytes (int, optional): number of bytes of the stdout and stderr of each command that are kept.
+        timings (List[Dict], optional): If given, the timings of each command (including failed ones) are appended to it,
+            so they can be added to the event logs.
+
+    Returns:
+        List[CommandResult]: output, timings and resource usage of each command.
+    """
+    results = []
+    with tracer.span("run_cmd_commands", category="cmd", cwd=cwd):
+        for cmd in commands:
+            if stop_event is not None and stop_event.is_set():
+                raise CommandCancelled(
+                    f"Command was cancelled before it started: {cmd}"
+                )
+
+            bt.logging.debug(
+                f"Running command: {cmd}" + (f" in {cwd!r}" if cwd else "")
+            )
+
+            result = None
+            try:
+                result = run_command(
+                    cmd,
+                    cwd=cwd,
+                    stop_event=stop_event,
+                    timeout=timeout,
+                    max_output_bytes=max_output_bytes,
+                )
+                results.append(result)
+                if not suppress_cmd_output:
+                    bt.logging.info(result.stdout.decode(errors="replace"))
+
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                result = e.result
+                if isinstance(e, subprocess.TimeoutExpired):
+                    bt.logging.error(f"❌ Command timed out after {timeout}s ❌: {cmd}")
+                else:
+                    bt.logging.error(f"❌ Failed to run command ❌: {cmd}")
+                if verbose:
+                    bt.logging.error(f"Output: {e.stdout.decode(errors='replace')}")
+                    bt.logging.error(f"Error: {e.stderr.decode(errors='replace')}")
+                    get_tracebacks()
+                raise
+
+            finally:
+                if result is not None:
+                    tracer.record_command(result)
+                    if timings is not None:
+                        timings.append(result.to_dict())
+
+            bt.logging.debug(
+                f"Command took {result.wall_time:.2f}s (cpu {result.cpu_time:.2f}s, {result.max_rss / 1024:.0f}MB): {cmd}"
             )
-            if not suppress_cmd_output:
-                bt.logging.info(result.stdout.decode())
 
-        except subprocess.CalledProcessError as e:
-            bt.logging.error(f"❌ Failed to run command ❌: {cmd}")
-            if verbose:
-                bt.logging.error(f"Output: {e.stdout.decode()}")
-                bt.logging.error(f"Error: {e.stderr.decode()}")
-                get_tracebacks()
-            raise
+    return results
 
 
 def check_and_download_pdbs(
@@ -245,13 +394,21 @@ def is_pdb_complete(pdb_text: str) -> bool:
 
 
 def get_response_info(responses: List[JobSubmissionSynapse]) -> Dict:
-    """Gather all desired response information from the set of miners."""
+    """Gather all desired response information from the set of miners.
+
+    The sizes of the returned files are reported as they were received (base64, and compressed if
+    the miner used an encoding) and after decoding, which shows what the compression saved. Files
+    that were sent incrementally only count the bytes that were appended.
+    """
 
     response_times = []
     response_status_messages = []
     response_status_codes = []
     response_returned_files = []
     response_returned_files_sizes = []
+    response_returned_files_transfer_sizes = []
+    response_encodings = []
+    response_appended_files = []
     response_miners_serving = []
 
     for resp in responses:
@@ -263,7 +420,15 @@ def get_response_info(responses: List[JobSubmissionSynapse]) -> Dict:
         response_status_messages.append(str(resp.dendrite.status_message))
         response_status_codes.append(str(resp.dendrite.status_code))
         response_returned_files.append(list(resp.md_output.keys()))
-        response_returned_files_sizes.append(list(map(len, resp.md_output.values())))
+        response_returned_files_sizes.append(
+            [len(v) if v is not None else 0 for v in resp.md_output.values()]
+        )
+        transfer_sizes = resp.md_output_transfer_sizes or {}
+        response_returned_files_transfer_sizes.append(
+            [transfer_sizes.get(k, 0) for k in resp.md_output.keys()]
+        )
+        response_encodings.append(resp.md_output_encoding)
+        response_appended_files.append(list(resp.md_output_appended.keys()))
         response_miners_serving.append(resp.miner_serving)
 
     return {
@@ -272,33 +437,60 @@ def get_response_info(responses: List[JobSubmissionSynapse]) -> Dict:
         "response_status_codes": response_status_codes,
         "response_returned_files": response_returned_files,
         "response_returned_files_sizes": response_returned_files_sizes,
+        "response_returned_files_transfer_sizes": response_returned_files_transfer_sizes,
+        "response_encodings": response_encodings,
+        "response_appended_files": response_appended_files,
         "response_miners_serving": response_miners_serving,
     }
 
 
+def read_lines_reversed(file_path: str, block_size: int = 64 * 1024):
+    """Yields the lines of a file from the last to the first, without line endings.
+
+    The file is read from the end in blocks, so only a block and a partial line are kept in
+    memory, and nothing before the last line that is needed is read.
+
+    Args:
+        file_path (str): location of the file
+        block_size (int): number of bytes read at a time
+    """
+    with open(file_path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0)  # may be the end of a line in the previous block
+            for line in reversed(lines):
+                yield line
+
+        yield remainder
+
+
 def get_last_step_time(log_file: str) -> float:
     """Validators need to know where miners are in the simulation procedure to ensure that
     the gro file that is computed is done on the most recent step of the simulation. The easiest
     way to do this is by checking a log file and parsing it such that it finds the Step Time header.
 
+    The log is read backwards from its end, so only the last part of (possibly very large) logs is read.
+
     args:
         log_file (str): location of the log file that contains the step time header
     """
-    step_pattern = re.compile(r"^\s*Step\s+Time$")
-    step_value_pattern = re.compile(r"^\s*(\d+)\s+([\d.]+)$")
+    step_pattern = re.compile(rb"^\s*Step\s+Time$")
+    step_value_pattern = re.compile(rb"^\s*(\d+)\s+([\d.]+)$")
 
     num_matches = 0
     last_step_time = 0  # default incase we don't have more than 1 log.
 
-    # Open and read the log file
-    with open(log_file, "r") as file:
-        lines = file.readlines()
-
-    # Reverse iterate over the lines for efficiency
-    for i, line in enumerate(reversed(lines)):
-        if step_pattern.match(line.strip()):  # Check for "Step Time" header
-            # Check the previous line in the original order for step value
-            value_line = lines[-1 + (-i + 1)]
+    # The line after the current one in the original order, which holds the step value.
+    value_line = None
+    for line in read_lines_reversed(log_file):
+        if value_line is not None and step_pattern.match(line.strip()):
             match = step_value_pattern.match(value_line.strip())
             if match:
                 num_matches += 1
@@ -307,5 +499,6 @@ def get_last_step_time(log_file: str) -> float:
                         match.group(2)
                     )  # group looks like:   191   0.3200
                     break
+        value_line = line
 
     return last_step_time
@@ -0,0 +1,100 @@
+"""Spooling of the md_output files of miners to disk.
+
+When a spool directory is set, JobSubmissionSynapse.deserialize decodes each base64 (and possibly
+compressed) file chunk by chunk into a file of the spool directory, instead of into memory. The
+file is handed on as a SpoolFile, which is moved into the miner data directory when the files are
+saved. Only the paths of the files are passed to the verification processes.
+"""
+
+import os
+import base64
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Union
+
+from folding.utils.compression import MAX_DECOMPRESSED_SIZE, iter_decompress
+
+CHUNK_SIZE = 1024**2  # bytes decoded at a time.
+
+
+@dataclass
+class SpoolFile:
+    """A file of md_output that was decoded to disk. len() is the size of the file, like for
+    files that are decoded to bytes.
+    """
+
+    path: str
+    size: int
+    moved: bool = False
+
+    def __len__(self) -> int:
+        return self.size
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def copy_to(self, f, chunk_size: int = CHUNK_SIZE):
+        """Writes the content of the file to an open file object, chunk by chunk."""
+        with open(self.path, "rb") as source:
+            shutil.copyfileobj(source, f, chunk_size)
+
+    def move_to(self, path: str):
+        """Moves the file to path. The file is only copied if the spool directory is on another filesystem."""
+        shutil.move(self.path, path)
+        self.path = path
+        self.moved = True
+
+    def remove(self):
+        """Removes the file from the spool directory. Files that were moved out of it are kept."""
+        if not self.moved and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def spool_base64(
+    data: Union[str, bytes],
+    spool_directory: str,
+    prefix: str = "",
+    encoding: str = None,
+    chunk_size: int = CHUNK_SIZE,
+    max_size: int = MAX_DECOMPRESSED_SIZE,
+) -> SpoolFile:
+    """Decodes a base64 file, and decompresses it if it has an encoding, into a new file of the
+    spool directory. At most chunk_size bytes of the decoded file are held in memory.
+
+    Raises:
+        ValueError: if a compressed file expands past max_size bytes. The partial file is removed.
+    """
+    os.makedirs(spool_directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=spool_directory, prefix=prefix)
+
+    # Every 4 base64 characters decode to 3 bytes, so chunks of a multiple of 4 characters decode independently.
+    step = max(4, chunk_size // 3 * 4)
+    chunks = (
+        base64.b64decode(data[start : start + step])
+        for start in range(0, len(data), step)
+    )
+    if encoding is not None:
+        chunks = iter_decompress(
+            chunks, encoding, max_size=max_size, chunk_size=chunk_size
+        )
+
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return SpoolFile(path=path, size=size)
+
+
+def remove_spool_files(md_output: Dict):
+    """Removes the spool files of an md_output that were not moved into a miner data directory."""
+    for content in (md_output or {}).values():
+        if isinstance(content, SpoolFile):
+            content.remove()
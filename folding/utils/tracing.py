@@ -0,0 +1,297 @@
+"""Tracing of the gromacs pipeline.
+
+A span is recorded for every call of run_cmd_commands, every command that it runs, and the major
+Protein methods. Each span holds its wall time, user/sys cpu time, peak memory and the bytes read
+and written, both by the thread that opened it and by the commands that were run inside of it.
+
+Spans are collected by the tracer of the process, and tagged with the job (pdb) that they were
+recorded for, see trace_job. The validator drains the spans of a job when it logs the event of the
+job, adds a summary per span name to the event, and can append them to a Chrome trace file, which
+can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import os
+import json
+import time
+import resource
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from folding.utils.commands import CommandResult, read_io_counters
+
+# The cpu time of a thread can only be measured on linux, other systems measure the whole process.
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+# Job (pdb) that the spans recorded in the current context belong to, None outside of a job.
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+@dataclass
+class Span:
+    """Timing and resource usage of a traced piece of work.
+
+    Attributes:
+        name: name of the span, e.g. Protein.rerun or gmx mdrun.
+        category: cmd for commands, function for python code.
+        parent: name of the span that was open when this span started, if any.
+        start_time: epoch time (seconds) at which the span started.
+        wall_time, user_time, sys_time: seconds spent in the span.
+        max_rss: peak resident memory (kB) of the process or command.
+        read_bytes, write_bytes: bytes read and written.
+        job: job (pdb) that the span was recorded for, if any.
+    """
+
+    name: str
+    category: str
+    parent: Optional[str] = None
+    start_time: float = 0.0
+    wall_time: float = 0.0
+    user_time: float = 0.0
+    sys_time: float = 0.0
+    max_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    pid: int = 0
+    thread_id: int = 0
+    job: Optional[str] = None
+    attributes: Dict = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        """Name of the span in summaries. Commands are summarized per span they ran in (e.g. Protein.rerun/gmx mdrun)."""
+        if self.category == "cmd" and self.parent is not None:
+            return f"{self.parent}/{self.name}"
+        return self.name
+
+    def add_usage(self, other: "Span"):
+        self.user_time += other.user_time
+        self.sys_time += other.sys_time
+        self.max_rss = max(self.max_rss, other.max_rss)
+        self.read_bytes += other.read_bytes
+        self.write_bytes += other.write_bytes
+
+    def to_chrome_event(self) -> Dict:
+        """Complete event of the Chrome trace event format (times in microseconds)."""
+        return {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": self.start_time * 1e6,
+            "dur": self.wall_time * 1e6,
+            "pid": self.pid,
+            "tid": self.thread_id,
+            "args": {
+                "user_time": self.user_time,
+                "sys_time": self.sys_time,
+                "max_rss_mb": self.max_rss / 1024,
+                "read_mb": self.read_bytes / 1024**2,
+                "write_mb": self.write_bytes / 1024**2,
+                **self.attributes,
+            },
+        }
+
+
+def command_name(result: CommandResult) -> str:
+    """Short name of a command for spans: the gmx subcommand (gmx mdrun) or the program that was run."""
+    args = result.args
+    if args[:2] == ["/bin/sh", "-c"]:
+        args = result.cmd.split() if isinstance(result.cmd, str) else args[2:]
+    if len(args) > 1 and os.path.basename(args[0]) == "gmx":
+        return f"gmx {args[1]}"
+    return os.path.basename(args[0]) if len(args) > 0 else "sh"
+
+
+class Tracer:
+    """Collects the spans of a process.
+
+    Args:
+        max_spans (int): number of spans that are kept until they are drained. The oldest spans are dropped first.
+    """
+
+    def __init__(self, max_spans: int = 100_000):
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _open_spans(self) -> List[Span]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def add(self, spans: Iterable[Span]):
+        """Adds spans to the tracer. Spans without a job (e.g. from a pool process) get the current job."""
+        job = current_job.get()
+        with self.lock:
+            for span in spans:
+                if span.job is None:
+                    span.job = job
+                self.spans.append(span)
+
+    def drain(self) -> List[Span]:
+        """Removes and returns all spans that were collected."""
+        with self.lock:
+            spans = list(self.spans)
+            self.spans.clear()
+        return spans
+
+    def drain_job(self, job: Optional[str]) -> List[Span]:
+        """Removes and returns the spans of job, or the spans recorded outside of any job if job is None."""
+        with self.lock:
+            spans = [span for span in self.spans if span.job == job]
+            others = [span for span in self.spans if span.job != job]
+            self.spans.clear()
+            self.spans.extend(others)
+        return spans
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "function", **attributes):
+        """Records the work done inside of the context as a span.
+
+        The cpu time and I/O of the calling thread are measured, and the usage of commands recorded
+        with record_command while the span is open is added to it.
+        """
+        stack = self._open_spans()
+        span = Span(
+            name=name,
+            category=category,
+            parent=stack[-1].name if stack else None,
+            start_time=time.time(),
+            pid=os.getpid(),
+            thread_id=threading.get_native_id(),
+            job=current_job.get(),
+            attributes=attributes,
+        )
+        usage = resource.getrusage(RUSAGE_THREAD)
+        io = read_io_counters()
+        start = time.perf_counter()
+
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.wall_time = time.perf_counter() - start
+
+            end_usage = resource.getrusage(RUSAGE_THREAD)
+            end_io = read_io_counters()
+            thread_span = Span(
+                name=name,
+                category=category,
+                user_time=end_usage.ru_utime - usage.ru_utime,
+                sys_time=end_usage.ru_stime - usage.ru_stime,
+                # Peak memory is only known for the process, not for the thread.
+                max_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                read_bytes=end_io.get("rchar", 0) - io.get("rchar", 0),
+                write_bytes=end_io.get("wchar", 0) - io.get("wchar", 0),
+            )
+            # The usage of the thread already includes the spans nested in this one, so only
+            # the usage of commands is passed on to the open parent spans.
+            span.add_usage(thread_span)
+            self.add([span])
+
+    def record_command(self, result: CommandResult, **attributes) -> Span:
+        """Records a finished command as a span, and adds its usage to the spans that are open in this thread.
+        The parent of the command is the innermost open function span (e.g. Protein.rerun), not run_cmd_commands.
+        """
+        stack = self._open_spans()
+        functions = [span for span in stack if span.category != "cmd"]
+        span = Span(
+            name=command_name(result),
+            category="cmd",
+            parent=functions[-1].name if functions else None,
+            start_time=time.time() - result.wall_time,
+            wall_time=result.wall_time,
+            user_time=result.user_time,
+            sys_time=result.sys_time,
+            max_rss=result.max_rss,
+            read_bytes=result.read_bytes,
+            write_bytes=result.write_bytes,
+            pid=os.getpid(),
+            thread_id=threading.get_native_id(),
+            job=current_job.get(),
+            attributes={"cmd": result.to_dict()["cmd"], **attributes},
+        )
+        for parent in stack:
+            parent.add_usage(span)
+        self.add([span])
+        return span
+
+
+# Tracer of the process, used by run_cmd_commands and the traced functions.
+tracer = Tracer()
+
+
+@contextlib.contextmanager
+def trace_job(job: str):
+    """Tags the spans recorded inside of the context with job. Threads that should record spans for
+    the job must be started with contextvars.copy_context().run, since they do not inherit it.
+    """
+    token = current_job.set(job)
+    try:
+        yield
+    finally:
+        current_job.reset(token)
+
+
+def traced(name: str = None, category: str = "function"):
+    """Decorator that records every call of a function as a span. Defaults to the qualified name of the function."""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, category=category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summarize_spans(spans: List[Span]) -> Dict[str, Dict]:
+    """Rolls up spans per name, e.g. {"Protein.rerun/gmx mdrun": {"count": 3, "wall_time": 12.5, ...}}."""
+    summary = {}
+    for span in spans:
+        entry = summary.setdefault(
+            span.key,
+            {
+                "count": 0,
+                "wall_time": 0.0,
+                "user_time": 0.0,
+                "sys_time": 0.0,
+                "max_rss_mb": 0.0,
+                "read_mb": 0.0,
+                "write_mb": 0.0,
+            },
+        )
+        entry["count"] += 1
+        entry["wall_time"] += span.wall_time
+        entry["user_time"] += span.user_time
+        entry["sys_time"] += span.sys_time
+        entry["max_rss_mb"] = max(entry["max_rss_mb"], span.max_rss / 1024)
+        entry["read_mb"] += span.read_bytes / 1024**2
+        entry["write_mb"] += span.write_bytes / 1024**2
+    return summary
+
+
+def export_chrome_trace(path: str, spans: List[Span]):
+    """Writes spans to a Chrome trace file (JSON object format)."""
+    with open(path, "w") as f:
+        json.dump({"traceEvents": [span.to_chrome_event() for span in spans]}, f)
+
+
+def append_chrome_trace(path: str, spans: List[Span]):
+    """Appends spans to a Chrome trace file in the JSON array format. The closing bracket of the
+    array is optional in this format, so the file can be appended to after every step.
+    """
+    with open(path, "a") as f:
+        if f.tell() == 0:
+            f.write("[\n")
+        for span in spans:
+            f.write(json.dumps(span.to_chrome_event()) + ",\n")
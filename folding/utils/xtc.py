@@ -0,0 +1,355 @@
+"""In-process reader for GROMACS compressed trajectory (.xtc) files.
+
+Each xtc frame starts with a fixed size header (magic, number of atoms, step, time, box), followed
+by the compressed coordinates and their size in bytes. This makes it possible to find all frames
+by only reading their headers, and to decompress just the frame that is needed.
+
+The decompression follows xdr3dfcoord from the GROMACS xdrfile library.
+"""
+
+import os
+import json
+import bisect
+import struct
+import hashlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+XTC_MAGIC = 1995
+
+# magic, natoms, step, time, box (9 floats), natoms
+FRAME_HEADER = struct.Struct(">iiif9fi")
+# precision, minint (3 ints), maxint (3 ints), smallidx, byte count
+COORDINATES_HEADER = struct.Struct(">f3i3iii")
+
+FIRSTIDX = 9
+MAGICINTS = [
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 8, 10, 12, 16, 20, 25, 32, 40, 50, 64, 80, 101, 128, 161, 203,
+    256, 322, 406, 512, 645, 812, 1024, 1290, 1625, 2048, 2580, 3250, 4096, 5060, 6501, 8192,
+    10321, 13003, 16384, 20642, 26007, 32768, 41285, 52015, 65536, 82570, 104031, 131072, 165140,
+    208063, 262144, 330280, 416127, 524287, 660561, 832255, 1048576, 1321122, 1664510, 2097152,
+    2642245, 3329021, 4194304, 5284491, 6658042, 8388607, 10568983, 13316085, 16777216,
+]  # fmt: skip
+
+
+class XTCFormatError(Exception):
+    """Exception raised when an xtc file can not be read."""
+
+    def __init__(self, message="Unsupported or corrupt xtc file"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class BitReader:
+    """Reads integers of any number of bits from a byte string, most significant bit first."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0  # in bits
+
+    def read(self, num_of_bits: int) -> int:
+        start = self.position >> 3
+        end = (self.position + num_of_bits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], "big")
+        shift = (end << 3) - self.position - num_of_bits
+        self.position += num_of_bits
+        return (chunk >> shift) & ((1 << num_of_bits) - 1)
+
+    def read_ints(self, num_of_bits: int, sizes: Tuple[int, int, int]) -> List[int]:
+        """Reads three integers that were packed together into num_of_bits bits.
+
+        The bits are written as bytes with the least significant byte first, and the last byte
+        only holds the remaining bits.
+        """
+        value = self.read(num_of_bits)
+        n_bytes = (num_of_bits + 7) >> 3
+        last_bits = num_of_bits - 8 * (n_bytes - 1)
+
+        packed = bytearray((value << (8 - last_bits)).to_bytes(n_bytes, "big"))
+        packed[-1] >>= 8 - last_bits
+        value = int.from_bytes(packed, "little")
+
+        value, z = divmod(value, sizes[2])
+        x, y = divmod(value, sizes[1])
+        return [x, y, z]
+
+
+def decompress_coordinates(
+    data: bytes,
+    natoms: int,
+    minint: Tuple[int, int, int],
+    maxint: Tuple[int, int, int],
+    smallidx: int,
+) -> np.ndarray:
+    """Decompresses the integer coordinates of a frame (xdr3dfcoord in GROMACS).
+
+    Returns:
+        np.ndarray: integer coordinates with shape (natoms, 3), to be divided by the precision.
+    """
+    sizeint = [maxint[k] - minint[k] + 1 for k in range(3)]
+
+    # If one of the sizes is too large, the three coordinates are stored separately.
+    if (sizeint[0] | sizeint[1] | sizeint[2]) > 0xFFFFFF:
+        bitsizeint = [size.bit_length() for size in sizeint]
+        bitsize = 0
+    else:
+        bitsize = (sizeint[0] * sizeint[1] * sizeint[2]).bit_length()
+
+    smaller = MAGICINTS[max(FIRSTIDX, smallidx - 1)] // 2
+    smallnum = MAGICINTS[smallidx] // 2
+    sizesmall = [MAGICINTS[smallidx]] * 3
+
+    reader = BitReader(data)
+    coordinates = np.zeros((natoms, 3), dtype=np.int64)
+
+    i = 0
+    run = 0
+    while i < natoms:
+        if bitsize == 0:
+            thiscoord = [reader.read(bitsizeint[k]) for k in range(3)]
+        else:
+            thiscoord = reader.read_ints(bitsize, sizeint)
+        thiscoord = [thiscoord[k] + minint[k] for k in range(3)]
+        prevcoord = thiscoord
+
+        is_smaller = 0
+        if reader.read(1) == 1:
+            run = reader.read(5)
+            is_smaller = run % 3
+            run -= is_smaller
+            is_smaller -= 1
+
+        if run > 0:
+            for k in range(0, run, 3):
+                small = reader.read_ints(smallidx, sizesmall)
+                small = [small[j] + prevcoord[j] - smallnum for j in range(3)]
+                if k == 0:
+                    # The first two atoms of a run are swapped, for better compression of water.
+                    coordinates[i] = small
+                    coordinates[i + 1] = thiscoord
+                    i += 2
+                else:
+                    coordinates[i] = small
+                    i += 1
+                prevcoord = small
+        else:
+            coordinates[i] = thiscoord
+            i += 1
+
+        smallidx += is_smaller
+        if is_smaller < 0:
+            smallnum = smaller
+            smaller = MAGICINTS[smallidx - 1] // 2 if smallidx > FIRSTIDX else 0
+        elif is_smaller > 0:
+            smaller = smallnum
+            smallnum = MAGICINTS[smallidx] // 2
+        sizesmall = [MAGICINTS[smallidx]] * 3
+
+    return coordinates
+
+
+class XTCReader:
+    """Finds the frames of an xtc file from their headers, and reads the coordinates of single frames.
+
+    The frame index (byte offset, size, step and time of each frame) can be persisted next to the
+    trajectory. The trajectory of a miner grows between queries, so when the index is loaded again
+    only the frames that were appended since the last time are scanned.
+
+    Args:
+        xtc_path (str): location of the xtc file.
+        index_path (str, optional): location of the json file that persists the frame index.
+    """
+
+    def __init__(self, xtc_path: str, index_path: str = None):
+        self.xtc_path = xtc_path
+        self.index_path = index_path
+        self.frames: List[Dict] = self.load_index()
+
+    def _digest(self, frame: Dict) -> str:
+        """Hashes the headers of a frame, to check that an indexed frame is still in the file."""
+        with open(self.xtc_path, "rb") as f:
+            f.seek(frame["offset"])
+            return hashlib.md5(
+                f.read(FRAME_HEADER.size + COORDINATES_HEADER.size)
+            ).hexdigest()
+
+    def load_index(self) -> List[Dict]:
+        """Loads the persisted frame index and scans the frames after it. The index is rebuilt if
+        the frames that it points to are no longer in the file (e.g. the miner restarted its simulation).
+        """
+        if self.index_path is None:
+            return self.scan(offset=0)
+
+        frames = []
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+
+            frames = index["frames"]
+            end = frames[-1]["offset"] + frames[-1]["size"]
+            if end > os.path.getsize(self.xtc_path):
+                frames = []
+            else:
+                digests = [self._digest(frames[0]), self._digest(frames[-1])]
+                if digests != index["digests"]:
+                    frames = []
+        except (OSError, ValueError, KeyError, IndexError):
+            frames = []
+
+        n_indexed = len(frames)
+        offset = frames[-1]["offset"] + frames[-1]["size"] if n_indexed > 0 else 0
+        frames = frames + self.scan(offset=offset)
+
+        if len(frames) > n_indexed:
+            self.save_index(frames)
+        return frames
+
+    def save_index(self, frames: List[Dict]):
+        index = {
+            "frames": frames,
+            "digests": [self._digest(frames[0]), self._digest(frames[-1])],
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def scan(self, offset: int) -> List[Dict]:
+        """Reads the headers of all complete frames from offset until the end of the file.
+
+        Returns:
+            List[Dict]: byte offset, step and time of each frame.
+        """
+        frames = []
+        file_size = os.path.getsize(self.xtc_path)
+
+        with open(self.xtc_path, "rb") as f:
+            while offset + FRAME_HEADER.size <= file_size:
+                f.seek(offset)
+                header = f.read(FRAME_HEADER.size + COORDINATES_HEADER.size)
+                magic, natoms, step, time, *_ = FRAME_HEADER.unpack_from(header)
+                if magic != XTC_MAGIC:
+                    raise XTCFormatError(
+                        f"{self.xtc_path!r} has a corrupt frame at byte {offset}"
+                    )
+
+                if natoms <= 9:  # small systems are not compressed
+                    size = FRAME_HEADER.size + 12 * natoms
+                elif len(header) < FRAME_HEADER.size + COORDINATES_HEADER.size:
+                    break
+                else:
+                    byte_count = COORDINATES_HEADER.unpack_from(
+                        header, FRAME_HEADER.size
+                    )[-1]
+                    size = (
+                        FRAME_HEADER.size
+                        + COORDINATES_HEADER.size
+                        + (byte_count + 3) // 4 * 4
+                    )
+
+                if offset + size > file_size:
+                    break  # the frame is still being written
+
+                frames.append(
+                    {
+                        "offset": offset,
+                        "size": size,
+                        "step": step,
+                        "time": time,
+                        "natoms": natoms,
+                    }
+                )
+                offset += size
+
+        return frames
+
+    def find_frame(self, time: float, tolerance: float = 1e-3) -> int:
+        """Returns the index of the first frame at the given time (ps), or None if there is no such frame.
+        The frames of a trajectory are ordered by time, so this is a binary search.
+        """
+        times = [frame["time"] for frame in self.frames]
+        index = bisect.bisect_left(times, time - tolerance)
+        if index < len(times) and abs(times[index] - time) <= tolerance:
+            return index
+        return None
+
+    def read_frame(self, index: int) -> Dict:
+        """Reads and decompresses a single frame.
+
+        Returns:
+            Dict: step, time, box (3, 3) and coordinates (natoms, 3) in nm, as float32 like in GROMACS.
+        """
+        frame = self.frames[index]
+
+        with open(self.xtc_path, "rb") as f:
+            f.seek(frame["offset"])
+            header = f.read(FRAME_HEADER.size)
+            _, natoms, step, time, *box, _ = FRAME_HEADER.unpack(header)
+            box = np.array(box, dtype=np.float32).reshape(3, 3)
+
+            if natoms <= 9:
+                coordinates = np.frombuffer(f.read(12 * natoms), dtype=">f4")
+                coordinates = coordinates.reshape(natoms, 3).astype(np.float32)
+            else:
+                precision, *ints, byte_count = COORDINATES_HEADER.unpack(
+                    f.read(COORDINATES_HEADER.size)
+                )
+                data = f.read(byte_count)
+
+                coordinates = decompress_coordinates(
+                    data=data,
+                    natoms=natoms,
+                    minint=ints[:3],
+                    maxint=ints[3:6],
+                    smallidx=ints[6],
+                )
+                inv_precision = np.float32(1.0) / np.float32(precision)
+                coordinates = coordinates.astype(np.float32) * inv_precision
+
+        return {"step": step, "time": time, "box": box, "coordinates": coordinates}
+
+
+def write_gro_frame(
+    gro_path: str, reference_gro_path: str, frame: Dict, title: str = None
+):
+    """Writes a frame to a gro file, using the residue and atom names of a reference gro file
+    with the same atoms (e.g. the em.gro of the validator). The output has the same layout as
+    `gmx trjconv -o *.gro`.
+
+    Args:
+        gro_path (str): location of the gro file to write.
+        reference_gro_path (str): location of the gro file with the names of the atoms.
+        frame (Dict): frame from XTCReader.read_frame.
+        title (str, optional): title of the system. Defaults to the title of the reference gro file.
+    """
+    coordinates = frame["coordinates"]
+
+    with open(reference_gro_path, "r") as f:
+        reference_title = f.readline().split(" t=")[0].strip()
+        natoms = int(f.readline())
+        if natoms != len(coordinates):
+            raise XTCFormatError(
+                f"Frame has {len(coordinates)} atoms, but {reference_gro_path!r} has {natoms}"
+            )
+        names = [f.readline()[:20] for _ in range(natoms)]
+
+    title = title or reference_title
+
+    lines = [
+        f"{title} t= {frame['time']:9.5f} step= {frame['step']}\n",
+        f"{natoms:5d}\n",
+    ]
+    for name, (x, y, z) in zip(names, coordinates.tolist()):
+        lines.append(f"{name}{x:8.3f}{y:8.3f}{z:8.3f}\n")
+
+    box = frame["box"]
+    off_diagonal = [box[0, 1], box[0, 2], box[1, 0], box[1, 2], box[2, 0], box[2, 1]]
+    if any(value != 0 for value in off_diagonal):
+        values = [box[0, 0], box[1, 1], box[2, 2], *off_diagonal]
+    else:
+        values = [box[0, 0], box[1, 1], box[2, 2]]
+    lines.append("".join(f"{value:10.5f}" for value in values) + "\n")
+
+    with open(gro_path, "w") as f:
+        f.writelines(lines)
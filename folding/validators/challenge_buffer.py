@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+import bittensor as bt
+
+from folding.validators.protein import Protein
+from folding.validators.forward import create_new_challenge
+from folding.utils.ops import get_tracebacks
+
+
+class ChallengeBuffer:
+    """Keeps a small buffer of fully prepared challenges so that the validator does not have to
+    wait for the download and GROMACS preparation of a pdb when it creates a new job.
+
+    A background thread prepares challenges with create_new_challenge until the buffer holds
+    `depth` of them. The generated files stay in the validator directory of each pdb, and the
+    challenge events are kept in a json file so that the buffer survives a validator restart.
+
+    Args:
+        validator: the validator neuron, used for its config, store and event logging.
+        depth (int): number of prepared challenges to keep in the buffer.
+        path (str): location of the json file that persists the buffer.
+    """
+
+    def __init__(self, validator, depth: int, path: str):
+        self.validator = validator
+        self.depth = depth
+        self.path = path
+
+        self.lock = threading.Lock()
+        self.should_exit: bool = False
+        self.thread: threading.Thread = None
+
+        self.challenges: List[Dict] = [
+            event for event in self.load() if self.is_prepared(event)
+        ]
+        bt.logging.info(
+            f"Loaded {len(self.challenges)} prepared challenges from {self.path!r}"
+        )
+
+    def __len__(self):
+        with self.lock:
+            return len(self.challenges)
+
+    def load(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            bt.logging.error(
+                f"Failed to load prepared challenges from {self.path!r}: {e}"
+            )
+            return []
+
+    def save(self):
+        """Writes the buffer to a temporary file first, so that a crash never leaves a partial buffer behind."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.challenges, f, default=str)
+        os.replace(tmp_path, self.path)
+
+    def is_prepared(self, event: Dict) -> bool:
+        """Checks that the simulation files of a buffered challenge are still on disk."""
+        try:
+            protein = Protein(
+                pdb_id=event["pdb_id"],
+                ff=event["ff"],
+                box=event["box"],
+                water=event["water"],
+                config=self.validator.config.protein,
+            )
+        except Exception:
+            return False
+        return os.path.exists(protein.gro_path)
+
+    @property
+    def pdbs(self) -> List[str]:
+        with self.lock:
+            return [event["pdb_id"] for event in self.challenges]
+
+    def put(self, event: Dict):
+        with self.lock:
+            self.challenges.append(event)
+            self.save()
+
+    def pop(self) -> Optional[Dict]:
+        """Returns the oldest prepared challenge in the buffer, or None if the buffer is empty."""
+        with self.lock:
+            while len(self.challenges) > 0:
+                event = self.challenges.pop(0)
+                self.save()
+
+                if self.is_prepared(event):
+                    event["challenge_buffer_time"] = time.time() - event["prepared_at"]
+                    return event
+
+                bt.logging.warning(
+                    f"Files for prepared challenge {event['pdb_id']} no longer exist... Skipping!"
+                )
+        return None
+
+    def run(self):
+        """Prepares new challenges until the buffer is full, then waits until one is taken."""
+        while not self.should_exit:
+            if len(self) >= self.depth:
+                time.sleep(5)
+                continue
+
+            exclude = set(self.validator.get_pdbs_to_exclude() + self.pdbs)
+
+            # A fixed pdb_id can only be prepared once at a time.
+            pdb_id = self.validator.config.protein.pdb_id
+            if pdb_id is not None and pdb_id in exclude:
+                time.sleep(5)
+                continue
+
+            try:
+                event = create_new_challenge(self.validator, exclude=exclude)
+            except Exception as e:
+                bt.logging.error(f"Failed to prepare a new challenge: {e}")
+                get_tracebacks()
+                time.sleep(5)
+                continue
+
+            event["prepared_at"] = time.time()
+            self.put(event)
+            bt.logging.success(
+                f"Prepared challenge {event['pdb_id']} ({len(self)}/{self.depth} in buffer)"
+            )
+
+    def start(self):
+        if self.thread is None:
+            bt.logging.debug("Starting challenge buffer in background thread.")
+            self.should_exit = False
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            bt.logging.debug("Stopping challenge buffer.")
+            self.should_exit = True
+            self.thread.join(5)
+            self.thread = None
@@ -1,16 +1,32 @@
+import os
 import time
+import asyncio
+import shutil
+import functools
+import threading
+import contextvars
+import concurrent.futures
 from tqdm import tqdm
 import bittensor as bt
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from itertools import chain
 from collections import defaultdict
 
 from folding.validators.protein import Protein
 from folding.utils.logging import log_event
 from folding.validators.reward import get_energies
 from folding.protocol import PingSynapse, JobSubmissionSynapse
-
-from folding.utils.ops import select_random_pdb_id, load_pdb_ids, get_response_info
+from folding.utils.compression import available_encodings
+from folding.utils.spool import remove_spool_files
+from folding.utils.tracing import trace_job
+
+from folding.utils.ops import (
+    select_random_pdb_id,
+    load_pdb_ids,
+    get_response_info,
+    CommandCancelled,
+)
 from folding.validators.hyperparameters import HyperParameters
 
 ROOT_DIR = Path(__file__).resolve().parents[2]
@@ -44,32 +60,93 @@ def run_ping_step(
     return ping_report
 
 
-def run_step(
+async def run_step(
     self,
     protein: Protein,
     uids: List[int],
     timeout: float,
     mdrun_args="",  #'-ntomp 64' #limit the number of threads to 64
 ) -> Dict:
+    """Queries the miners assigned to the protein and verifies their outputs.
+
+    The dendrite query is awaited so that several jobs can wait on their miners at the same time.
+    Verification of the miner outputs is serialized across jobs through self.lock, and runs in a
+    worker thread so that the event loop can keep serving the other queries in flight.
+    """
     start_time = time.time()
 
     # Get the list of uids to query for this step.
     axons = [self.metagraph.axons[uid] for uid in uids]
+    md_inputs_digest = protein.get_md_inputs_digest()
     synapse = JobSubmissionSynapse(
-        pdb_id=protein.pdb_id, md_inputs=protein.md_inputs, mdrun_args=mdrun_args
+        pdb_id=protein.pdb_id,
+        md_inputs=protein.md_inputs,
+        md_inputs_digest=md_inputs_digest,
+        mdrun_args=mdrun_args,
+        md_output_encodings=(
+            available_encodings() if self.config.neuron.compress_md_output else []
+        ),
     )
 
-    # Make calls to the network with the prompt - this is synchronous.
-    bt.logging.warning("waiting for responses....")
-    responses: List[JobSubmissionSynapse] = self.dendrite.query(
-        axons=axons,
-        synapse=synapse,
-        timeout=timeout,
-        deserialize=True,  # decodes the bytestream response inside of md_outputs.
+    # The inputs are only sent to the miners that did not report holding them at the last query.
+    md_inputs_held = protein.get_md_inputs_held()
+    skip_md_inputs = [
+        md_inputs_held.get(axon.hotkey) == md_inputs_digest for axon in axons
+    ]
+    md_inputs_size = sum(map(len, protein.md_inputs.values()))
+    md_inputs_bytes_saved = md_inputs_size * sum(skip_md_inputs)
+    bt.logging.info(
+        f"Sending md_inputs to {len(axons) - sum(skip_md_inputs)}/{len(axons)} miners, saved {md_inputs_bytes_saved} bytes"
     )
 
+    # Make calls to the network with the prompt - this is awaited alongside the other jobs in the round.
+    bt.logging.warning("waiting for responses....")
+    if self.config.neuron.incremental_md_output or any(skip_md_inputs):
+        # Each miner is told which part of its files the validator already holds, so it gets its own synapse.
+        miner_synapses = []
+        for axon, skip in zip(axons, skip_md_inputs):
+            miner_synapse = synapse.copy()
+            if skip:
+                miner_synapse.md_inputs = {}
+            if self.config.neuron.incremental_md_output:
+                miner_synapse.md_output_offsets = protein.get_md_output_offsets(
+                    hotkey=axon.hotkey
+                )
+            miner_synapses.append(miner_synapse)
+
+        miner_responses = await asyncio.gather(
+            *[
+                self.dendrite.forward(
+                    axons=[axon],
+                    synapse=miner_synapse,
+                    timeout=timeout,
+                    deserialize=True,
+                )
+                for axon, miner_synapse in zip(axons, miner_synapses)
+            ]
+        )
+        responses: List[JobSubmissionSynapse] = list(
+            chain.from_iterable(miner_responses)
+        )
+    else:
+        responses: List[JobSubmissionSynapse] = await self.dendrite.forward(
+            axons=axons,
+            synapse=synapse,
+            timeout=timeout,
+            deserialize=True,  # decodes the bytestream response inside of md_outputs.
+        )
+
     response_info = get_response_info(responses=responses)
 
+    # Miners that do not report holding the inputs (e.g. they restarted, or do not know about digests) get them next time.
+    protein.save_md_inputs_held(
+        {
+            axon.hotkey: resp.md_inputs_held
+            for axon, resp in zip(axons, responses)
+            if resp.md_inputs_held is not None
+        }
+    )
+
     # There are hotkeys that have decided to stop serving. We need to remove them from the store.
     responses_serving = []
     active_uids = []
@@ -83,16 +160,34 @@ def run_step(
         "step_length": time.time() - start_time,
         "uids": active_uids,
         "energies": [],
+        "md_inputs_bytes_saved": md_inputs_bytes_saved,
         **response_info,
     }
 
     if len(responses_serving) == 0:
         bt.logging.warning(f"❗ No miners serving pdb_id {synapse.pdb_id}... Making job inactive. ❗")
+        for resp in responses:
+            remove_spool_files(resp.md_output)
         return event
 
-    energies, energy_event = get_energies(
-        protein=protein, responses=responses_serving, uids=active_uids
-    )
+    try:
+        async with self.lock:
+            # The spans of the verification are recorded for the job of this task.
+            energies, energy_event = await self.loop.run_in_executor(
+                None,
+                contextvars.copy_context().run,
+                functools.partial(
+                    get_energies,
+                    protein=protein,
+                    responses=responses_serving,
+                    uids=active_uids,
+                    pool=self.verification_pool,
+                ),
+            )
+    finally:
+        # Spooled files that were not saved into a miner data directory (e.g. rejected outputs) are removed.
+        for resp in responses:
+            remove_spool_files(resp.md_output)
 
     # Log the step event.
     event.update(
@@ -139,6 +234,7 @@ def create_new_challenge(self, exclude: List) -> Dict:
     Returns:
         Dict: event dictionary containing the results of the hyperparameter search
     """
+    exclude = set(exclude)  # the store holds every pdb that was ever used.
     while True:
         forward_start_time = time.time()
 
@@ -149,7 +245,8 @@ def create_new_challenge(self, exclude: List) -> Dict:
 
         # Perform a hyperparameter search until we find a valid configuration for the pdb
         bt.logging.warning(f"Attempting to prepare challenge for pdb {pdb_id}")
-        event = try_prepare_challenge(config=self.config, pdb_id=pdb_id)
+        with trace_job(pdb_id):
+            event = try_prepare_challenge(config=self.config, pdb_id=pdb_id)
 
         if event.get("validator_search_status") == True:
             return event
@@ -158,55 +255,145 @@ def create_new_challenge(self, exclude: List) -> Dict:
             event["hp_search_time"] = time.time() - forward_start_time
 
             # only log the event if the simulation was not successful
-            log_event(self, event)
+            with trace_job(pdb_id):
+                log_event(self, event)
             bt.logging.error(
                 f"❌❌ All hyperparameter combinations failed for pdb_id {pdb_id}.. Skipping! ❌❌"
             )
-            exclude.append(pdb_id)
+            exclude.add(pdb_id)
+
+
+def prepare_hyperparameters(
+    config, pdb_id: str, hps: Dict, stop_event: threading.Event
+) -> Tuple[Protein, Dict]:
+    """Sets up the simulation for a single combination of hyperparameters in its own scratch
+    directory, so that several combinations for the same pdb can be prepared at once.
+    The scratch directory is removed if the preparation fails or is cancelled.
+
+    Returns:
+        Tuple[Protein, Dict]: the prepared protein (None if it failed) and the timing information of the combination.
+    """
+    start_time = time.time()
+    protein = Protein(pdb_id=pdb_id, config=config.protein, **hps)
+    scratch_directory = os.path.join(
+        protein.pdb_directory, f"scratch_{hps['ff']}_{hps['box']}_{hps['water']}"
+    )
+    protein.setup_filepaths(validator_directory=scratch_directory)
+
+    try:
+        protein.setup_simulation(stop_event=stop_event)
+        status = "success"
+    except CommandCancelled:
+        status = "cancelled"
+    except Exception as E:
+        bt.logging.warning(f"Hyperparameters {hps} failed for pdb {pdb_id}: {E}")
+        status = "failed"
+
+    command_time = sum(timing["wall_time"] for timing in protein.command_timings)
+    if status != "success":
+        protein = None
+        if os.path.exists(scratch_directory):
+            shutil.rmtree(scratch_directory)
+
+    return protein, {
+        **hps,
+        "status": status,
+        "time": time.time() - start_time,
+        "command_time": command_time,
+    }
 
 
 def try_prepare_challenge(config, pdb_id: str) -> Dict:
     """Attempts to setup a simulation environment for the specific pdb & config
     Uses a stochastic sampler to find hyperparameters that are compatible with the protein
+
+    Up to config.protein.hp_search_workers combinations are prepared at the same time in
+    isolated scratch directories. The first combination that succeeds is used, and the
+    remaining ones are cancelled and their directories removed.
     """
 
     exclude_in_hp_search = parse_config(config)
     hp_sampler = HyperParameters(exclude=exclude_in_hp_search)
 
-    bt.logging.info(f"Searching parameter space for pdb {pdb_id}")
-    for tries in tqdm(
-        range(hp_sampler.TOTAL_COMBINATIONS), total=hp_sampler.TOTAL_COMBINATIONS
-    ):
-        hp_sampler_time = time.time()
-
-        event = {"hp_tries": tries}
-        try:
-            sampled_combination: Dict = hp_sampler.sample_hyperparameters()
-            hps = {
+    combinations = []
+    for _ in range(hp_sampler.TOTAL_COMBINATIONS):
+        sampled_combination: Dict = hp_sampler.sample_hyperparameters()
+        combinations.append(
+            {
                 "ff": config.protein.ff or sampled_combination["FF"],
                 "water": config.protein.water or sampled_combination["WATER"],
                 "box": config.protein.box or sampled_combination["BOX"],
                 # "BOX_DISTANCE": sampled_combination["BOX_DISTANCE"], #TODO: Add this to the downstream logic.
             }
+        )
+
+    bt.logging.info(
+        f"Searching parameter space for pdb {pdb_id} with {config.protein.hp_search_workers} workers"
+    )
+    event = {"pdb_id": pdb_id, "validator_search_status": False, "hp_search": []}
+    protein = None
+    stop_event = threading.Event()
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.protein.hp_search_workers
+    ) as executor:
+        # Each combination records its spans for the pdb, in its own copy of the context.
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                prepare_hyperparameters,
+                config=config,
+                pdb_id=pdb_id,
+                hps=hps,
+                stop_event=stop_event,
+            )
+            for hps in combinations
+        ]
+
+        for future in tqdm(
+            concurrent.futures.as_completed(futures), total=len(futures)
+        ):
+            if future.cancelled():
+                continue
+
+            result, hp_event = future.result()
+            event["hp_search"].append(hp_event)
+
+            if result is None:
+                continue
+
+            if protein is not None:
+                # Another combination finished first, so this one is not needed.
+                shutil.rmtree(result.validator_directory)
+                continue
+
+            protein = result
+            event.update(
+                {key: hp_event[key] for key in ("ff", "water", "box")}
+            )  # add the dictionary of hyperparameters to the event
+            event["hp_sample_time"] = hp_event["time"]
+
+            # Stop the remaining combinations, they are no longer needed.
+            stop_event.set()
+            for other in futures:
+                other.cancel()
+
+    # Combinations that were cancelled once another one succeeded were not tried.
+    event["hp_tries"] = sum(hp["status"] != "cancelled" for hp in event["hp_search"])
+
+    if protein is None:
+        if len(combinations) > 0:
+            event.update(combinations[-1])
+        return event
+
+    # The winning combination becomes the validator directory of the pdb.
+    protein.move_validator_directory(os.path.join(protein.pdb_directory, "validator"))
 
-            protein = Protein(pdb_id=pdb_id, config=config.protein, **hps)
-            protein.setup_simulation()
-
-        except Exception as E:
-            event["validator_search_status"] = False
-
-        finally:
-            event["pdb_id"] = pdb_id
-            event.update(hps)  # add the dictionary of hyperparameters to the event
-            event["hp_sample_time"] = time.time() - hp_sampler_time
-            event["pdb_complexity"] = [dict(protein.pdb_complexity)]
-            event["init_energy"] = protein.init_energy
-            event["epsilon"] = protein.epsilon
-
-            if "validator_search_status" not in event:
-                bt.logging.warning("✅✅ Simulation ran successfully! ✅✅")
-                event["validator_search_status"] = True  # simulation passed!
-                # break out of the loop if the simulation was successful
-                break
+    bt.logging.warning("✅✅ Simulation ran successfully! ✅✅")
+    event["validator_search_status"] = True  # simulation passed!
+    event["pdb_complexity"] = [dict(protein.pdb_complexity)]
+    event["init_energy"] = protein.init_energy
+    event["epsilon"] = protein.epsilon
+    event["command_timings"] = protein.command_timings
 
     return event
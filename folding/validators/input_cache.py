@@ -0,0 +1,85 @@
+"""Cache of the input files (md_inputs) of the jobs of the validator.
+
+A Protein is built for a job at every query, and the input files of a job do not change once
+setup_simulation is done. Bundles of input files are kept by their content digest, and jobs map
+(pdb_id, ff, box, water) to the digest of their bundle. A cached bundle is only used while the
+files have the same size and modification time as when they were read, so input files that are
+generated again (e.g. a new job for the same pdb_id) are read again. Bundles are evicted least
+recently used first, once they hold more than max_bytes in total.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from folding.utils.incremental import inputs_digest
+
+
+def files_state(paths: List[str]) -> Optional[Tuple]:
+    """Path, size and modification time of each file, or None if one of them is missing."""
+    state = []
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        state.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(state)
+
+
+class InputBundleCache:
+    """Input files of jobs, up to max_bytes in total, addressed by their content digest.
+
+    Args:
+        max_bytes (int): total size of the bundles that are kept.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._bundles: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._jobs: Dict[Tuple, Tuple[Tuple, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: Tuple, read: Callable[[], Tuple[Dict[str, str], List[str]]]
+    ) -> Tuple[Dict[str, str], str]:
+        """Returns the input files of the job key, and their digest.
+
+        Args:
+            key (Tuple): (pdb_id, ff, box, water) of the job.
+            read (Callable): reads the input files, and returns them along with their paths.
+        """
+        with self._lock:
+            cached = self._jobs.get(key)
+            if cached is not None and cached[1] in self._bundles:
+                state, digest = cached
+                if files_state([path for path, _, _ in state]) == state:
+                    self.hits += 1
+                    self._bundles.move_to_end(digest)
+                    return dict(self._bundles[digest]), digest
+
+        self.misses += 1
+        files, paths = read()
+        state = files_state(paths)
+        digest = inputs_digest(files)
+        size = sum(map(len, files.values()))
+        if state is None or size > self.max_bytes:
+            return files, digest
+
+        with self._lock:
+            self._jobs[key] = (state, digest)
+            if digest not in self._bundles:
+                self._bundles[digest] = dict(files)
+                self.nbytes += size
+            self._bundles.move_to_end(digest)
+
+            while self.nbytes > self.max_bytes:
+                evicted, bundle = self._bundles.popitem(last=False)
+                self.nbytes -= sum(map(len, bundle.values()))
+                for job in [k for k, v in self._jobs.items() if v[1] == evicted]:
+                    del self._jobs[job]
+        return files, digest
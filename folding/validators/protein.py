@@ -1,8 +1,11 @@
 import os
 import glob
+import json
 import re
+import time
 import random
 import shutil
+import threading
 from typing import List, Dict
 from pathlib import Path
 from collections import defaultdict
@@ -16,22 +19,36 @@ from folding.utils.ops import (
     run_cmd_commands,
     check_if_directory_exists,
     gro_hash,
+    cached_gro_hash,
     load_pdb_ids,
     calc_potential_from_edr,
+    get_energy_from_edr,
     select_random_pdb_id,
     check_and_download_pdbs,
     get_last_step_time,
 )
 from folding.store import Job
+from folding.utils.edr import read_edr
+from folding.utils.xtc import XTCReader, XTCFormatError, write_gro_frame
+from folding.utils.commands import MAX_OUTPUT_BYTES
+from folding.utils.tracing import traced
+from folding.utils.incremental import append_file, get_file_offsets, inputs_digest
+from folding.utils.spool import SpoolFile
 
 # root level directory for the project (I HATE THIS)
 ROOT_DIR = Path(__file__).resolve().parents[2]
 
+PDB_DOWNLOAD_LOCK = threading.Lock()
+MD_INPUTS_HELD_FILE = "md_inputs_held.json"
+
 
 @dataclass
 class Protein:
     PDB_RECORDS = ("ATOM", "ANISOU", "REMARK", "HETATM", "CONECT")
 
+    # If set (by the validator), the md_inputs of jobs are read from this InputBundleCache.
+    md_inputs_cache = None
+
     @property
     def name(self):
         return self.protein_pdb.split(".")[0]
@@ -68,26 +85,67 @@ class Protein:
             "topol*",
         ]  # capture all possible topol or posre chains
 
-        self.md_inputs = (
-            self.read_and_return_files(filenames=self.other_files + self.mdp_files)
-            if load_md_inputs
-            else {}
-        )
+        self.md_inputs = self.load_md_inputs() if load_md_inputs else {}
 
         # set to an arbitrarilly high number to ensure that the first miner is always accepted.
         self.init_energy = 0
         self.pdb_complexity = defaultdict(int)
         self.epsilon = epsilon
 
-    def setup_filepaths(self):
+        # Timings of the gromacs commands run for this protein, added to the event logs.
+        self.command_timings = []
+
+        # Time (time.monotonic) by which all commands have to be done, set while a miner is verified.
+        self.deadline = None
+
+    def setup_filepaths(self, validator_directory: str = None):
+        """Set the locations of the pdb and validator files.
+
+        Args:
+            validator_directory (str, optional): directory where the simulation files are generated.
+                Defaults to the validator folder inside of the pdb directory.
+        """
         self.pdb_file = f"{self.pdb_id}.pdb"
         self.pdb_directory = os.path.join(self.base_directory, self.pdb_id)
         self.pdb_location = os.path.join(self.pdb_directory, self.pdb_file)
 
-        self.validator_directory = os.path.join(self.pdb_directory, "validator")
+        self.validator_directory = validator_directory or os.path.join(
+            self.pdb_directory, "validator"
+        )
         self.gro_path = os.path.join(self.validator_directory, "em.gro")
         self.topol_path = os.path.join(self.validator_directory, "topol.top")
 
+    def run_commands(
+        self, commands: List[str], cwd: str, stop_event: threading.Event = None
+    ):
+        """Runs commands with the timeout and output limits of the config, and records their timings.
+
+        Each command is allowed the cmd_timeout of the config, and at most the time left until the
+        deadline if it is set.
+
+        Args:
+            commands (List[str]): commands to run, see run_cmd_commands.
+            cwd (str): working directory of the commands.
+            stop_event (threading.Event, optional): If set, the running command is cancelled. Defaults to None.
+        """
+        timeout = getattr(self.config, "cmd_timeout", None)
+        if self.deadline is not None:
+            remaining = max(0.0, self.deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        return run_cmd_commands(
+            commands=commands,
+            suppress_cmd_output=self.config.suppress_cmd_output,
+            verbose=self.config.verbose,
+            cwd=cwd,
+            stop_event=stop_event,
+            timeout=timeout,
+            max_output_bytes=getattr(
+                self.config, "cmd_max_output_bytes", MAX_OUTPUT_BYTES
+            ),
+            timings=self.command_timings,
+        )
+
     @staticmethod
     def from_job(job: Job, config: Dict):
         # TODO: This must be called after the protein has already been downloaded etc.
@@ -140,6 +198,11 @@ class Protein:
         self.pdb_file_cleaned = f"{self.pdb_id}_protein.pdb"
 
     def setup_pdb_directory(self):
+        # The same pdb can be prepared from several threads at once, so only one of them downloads it.
+        with PDB_DOWNLOAD_LOCK:
+            self._setup_pdb_directory()
+
+    def _setup_pdb_directory(self):
         # if directory doesn't exist, download the pdb file and save it to the directory
         if not os.path.exists(self.pdb_directory):
             os.makedirs(self.pdb_directory)
@@ -185,13 +248,32 @@ class Protein:
                     continue
         return files_to_return
 
-    def setup_simulation(self):
+    def load_md_inputs(self) -> Dict:
+        """Read the input files that are sent to the miners, from md_inputs_cache if it is set."""
+        filenames = self.other_files + self.mdp_files
+        if self.md_inputs_cache is None:
+            return self.read_and_return_files(filenames=filenames)
+
+        def read():
+            files = self.read_and_return_files(filenames=filenames)
+            return files, [os.path.join(self.validator_directory, f) for f in files]
+
+        files, _ = self.md_inputs_cache.get(
+            key=(self.pdb_id, self.ff, self.box, self.water), read=read
+        )
+        return files
+
+    @traced()
+    def setup_simulation(self, stop_event: threading.Event = None):
         """forward method defines the following:
         1. gather the pdb_id and setup the namings.
         2. setup the pdb directory and download the pdb file if it doesn't exist.
         3. check for missing files and generate the input files if they are missing.
         4. edit the necessary config files and add them to the synapse object self.md_inputs[file] = content
         4. save the files to the validator directory for record keeping.
+
+        Args:
+            stop_event (threading.Event, optional): cancels the generation of the input files when set. Defaults to None.
         """
         bt.logging.info(
             f"Launching {self.pdb_id} Protein Job with the following configuration\nff : {self.ff}\nbox : {self.box}\nwater : {self.water}"
@@ -207,7 +289,7 @@ class Protein:
         missing_files = self.check_for_missing_files(required_files=required_files)
 
         if missing_files is not None:
-            self.generate_input_files()
+            self.generate_input_files(stop_event=stop_event)
 
         # Create a validator directory to store the files
         check_if_directory_exists(output_directory=self.validator_directory)
@@ -235,6 +317,9 @@ class Protein:
             write_mode="w",
         )
 
+        # The reference hash is computed once here, and reused for every miner and step of the job.
+        cached_gro_hash(gro_path=self.gro_path)
+
         self.remaining_steps = []
         self.pdb_complexity = Protein._get_pdb_complexity(self.pdb_location)
         self.init_energy = calc_potential_from_edr(
@@ -278,31 +363,47 @@ class Protein:
 
             if os.path.exists(file_path):
                 commands.append(
-                    f"cp {file_path} {self.pdb_directory}/{config_name}.mdp"
+                    f"cp {file_path} {self.validator_directory}/{config_name}.mdp"
                 )
             else:
                 # If the file with the _ff suffix doesn't exist, remove it from the base filepath.
                 path = re.sub(r"_" + re.escape(ff_base), "", file_path)
-                commands.append(f"cp {path} {self.pdb_directory}/{config_name}.mdp")
+                commands.append(
+                    f"cp {path} {self.validator_directory}/{config_name}.mdp"
+                )
 
         return commands
 
     # Function to generate GROMACS input files
-    def generate_input_files(self):
-        bt.logging.info(f"Changing path to {self.pdb_directory}")
-        os.chdir(self.pdb_directory)
+    def generate_input_files(self, stop_event: threading.Event = None):
+        """Generate the GROMACS input files for the protein.
+
+        All commands are run with the validator directory as their working directory and refer to the
+        pdb files by their full path, so the process working directory is never changed. This allows
+        several proteins to be prepared at the same time from different threads.
 
+        Args:
+            stop_event (threading.Event, optional): kills the running command and skips the rest when set. Defaults to None.
+        """
         bt.logging.info(
             f"pdb file is set to: {self.pdb_file}, and it is located at {self.pdb_location}"
         )
 
+        # All files except the pdb files are written to the validator folder
+        check_if_directory_exists(output_directory=self.validator_directory)
+
+        # The cleaned pdb files are kept with the rest of the generated files, so that different
+        # hyperparameters for the same pdb can be generated side by side.
+        pdb_file_tmp = os.path.join(self.validator_directory, self.pdb_file_tmp)
+        pdb_file_cleaned = os.path.join(self.validator_directory, self.pdb_file_cleaned)
+
         commands = self.check_configuration_file_commands()
 
         # Commands to generate GROMACS input files
         commands += [
-            f"grep -v HETATM {self.pdb_file} > {self.pdb_file_tmp}",  # remove lines with HETATM
-            f"grep -v CONECT {self.pdb_file_tmp} > {self.pdb_file_cleaned}",  # remove lines with CONECT
-            f"gmx pdb2gmx -f {self.pdb_file_cleaned} -ff {self.ff} -o processed.gro -water {self.water}",  # Input the file into GROMACS and get three output files: topology, position restraint, and a post-processed structure file
+            f"grep -v HETATM {self.pdb_location} > {pdb_file_tmp}",  # remove lines with HETATM
+            f"grep -v CONECT {pdb_file_tmp} > {pdb_file_cleaned}",  # remove lines with CONECT
+            f"gmx pdb2gmx -f {pdb_file_cleaned} -ff {self.ff} -o processed.gro -water {self.water}",  # Input the file into GROMACS and get three output files: topology, position restraint, and a post-processed structure file
             f"gmx editconf -f processed.gro -o newbox.gro -c -d 1.0 -bt {self.box}",  # Build the "box" to run our simulation of one protein molecule
             "gmx solvate -cp newbox.gro -cs spc216.gro -o solvated.gro -p topol.top",
             "touch ions.mdp",  # Create a file to add ions to the system
@@ -312,26 +413,27 @@ class Protein:
 
         # Validator does the first step of the energy minimization
         commands += [
-            f"gmx grompp -f {self.pdb_directory}/emin.mdp -c solv_ions.gro -p topol.top -o em.tpr",
+            f"gmx grompp -f {self.validator_directory}/emin.mdp -c solv_ions.gro -p topol.top -o em.tpr",
             "gmx mdrun -v -deffnm em",
         ]
 
-        run_cmd_commands(
-            commands=commands,
-            suppress_cmd_output=self.config.suppress_cmd_output,
-            verbose=self.config.verbose,
+        self.run_commands(
+            commands=commands, cwd=self.validator_directory, stop_event=stop_event
         )
 
-        # Here we are going to change the path to a validator folder, and move ALL the files except the pdb file
-        check_if_directory_exists(output_directory=self.validator_directory)
-        # Move all files
-        cmd = f'find . -maxdepth 1 -type f ! -name "*.pdb" -exec mv {{}} {self.validator_directory}/ \;'
-        bt.logging.debug(f"Moving all files except pdb to {self.validator_directory}")
-        os.system(cmd)
-
         # We want to catch any errors that occur in the above steps and then return the error to the user
         return True
 
+    def move_validator_directory(self, validator_directory: str):
+        """Move all of the generated simulation files to a new validator directory, replacing
+        anything that is already there, and point the protein at the new location.
+        """
+        if os.path.exists(validator_directory):
+            shutil.rmtree(validator_directory)
+
+        shutil.move(self.validator_directory, validator_directory)
+        self.setup_filepaths(validator_directory=validator_directory)
+
     def gen_seed(self):
         """Generate a random seed"""
         return random.randint(1000, 999999)
@@ -397,7 +499,11 @@ class Protein:
             self.md_inputs[file] = content
 
     def save_files(
-        self, files: Dict, output_directory: str, write_mode: str = "wb"
+        self,
+        files: Dict,
+        output_directory: str,
+        write_mode: str = "wb",
+        offsets: Dict[str, int] = None,
     ) -> Dict:
         """Save the simulation files generated on the validator side to a desired output directory.
 
@@ -405,6 +511,10 @@ class Protein:
             files (Dict): Dictionary mapping between filename and content
             output_directory (str)
             write_mode (str, optional): How the file should be written. Defaults to "wb".
+            offsets (Dict[str, int], optional): files whose content was appended at these offsets,
+                and is written onto the existing copy instead of replacing it.
+
+        The content of a file is either bytes, or a SpoolFile that is moved into the output directory.
 
         Returns:
             _type_: _description_
@@ -415,6 +525,18 @@ class Protein:
         filetypes = {}
         for filename, content in files.items():
             filetypes[filename.split(".")[-1]] = filename
+            if offsets and filename in offsets:
+                append_file(
+                    os.path.join(output_directory, filename),
+                    offset=offsets[filename],
+                    content=content,
+                )
+                continue
+
+            if isinstance(content, SpoolFile):
+                content.move_to(os.path.join(output_directory, filename))
+                continue
+
             # loop over all of the output files and save to local disk
             with open(os.path.join(output_directory, filename), write_mode) as f:
                 f.write(content)
@@ -430,6 +552,34 @@ class Protein:
     def get_miner_data_directory(self, hotkey: str):
         self.miner_data_directory = os.path.join(self.validator_directory, hotkey[:8])
 
+    def get_md_output_offsets(self, hotkey: str) -> Dict[str, Dict]:
+        """Size and tail digest of the files of a miner that the validator already holds,
+        so that the miner only sends what was appended to them or changed.
+        """
+        return get_file_offsets(os.path.join(self.validator_directory, hotkey[:8]))
+
+    def get_md_inputs_digest(self) -> str:
+        return inputs_digest(self.md_inputs)
+
+    def get_md_inputs_held(self) -> Dict[str, str]:
+        """Digest of the md_inputs that each miner reported holding at the last query, by hotkey.
+        Miners without an entry have not been queried yet, and are sent the full inputs.
+        """
+        try:
+            with open(os.path.join(self.validator_directory, MD_INPUTS_HELD_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_md_inputs_held(self, md_inputs_held: Dict[str, str]):
+        """Saves the digests of get_md_inputs_held. They are removed along with the pdb directory."""
+        check_if_directory_exists(output_directory=self.validator_directory)
+        with open(
+            os.path.join(self.validator_directory, MD_INPUTS_HELD_FILE), "w"
+        ) as f:
+            json.dump(md_inputs_held, f)
+
+    @traced()
     def compute_intermediate_gro(
         self,
         output_directory: str,
@@ -440,6 +590,10 @@ class Protein:
         Compute the intermediate gro file from the xtc and tpr file from the miner.
         We do this because we need to ensure that the miners are running the correct protein.
 
+        The frame is read from the xtc in-process and written with the atom names of the validator's
+        em.gro. If that is not possible (e.g. the frame is missing or the number of atoms differs),
+        gmx trjconv is used instead.
+
         Args:
             md_output (Dict): dictionary of information from the miner.
         """
@@ -451,19 +605,34 @@ class Protein:
         tpr_file = os.path.join(output_directory, md_outputs_exts["tpr"])
         xtc_file = os.path.join(output_directory, md_outputs_exts["xtc"])
 
+        try:
+            # The frame index is kept in the miner data directory, so later queries only scan new frames.
+            reader = XTCReader(xtc_file, index_path=f"{xtc_file}.index")
+            index = reader.find_frame(time=simulation_step_time)
+            if index is None:
+                raise XTCFormatError(f"No frame at time {simulation_step_time}")
+
+            write_gro_frame(
+                gro_path=gro_file_location,
+                reference_gro_path=self.gro_path,
+                frame=reader.read_frame(index),
+            )
+            return gro_file_location
+        except Exception as e:
+            bt.logging.warning(
+                f"Failed to read {xtc_file!r} in-process with error: {e}. Falling back to gmx trjconv."
+            )
+
         command = [
             f"echo System | gmx trjconv -s {tpr_file} -f {xtc_file} -o {gro_file_location} -nobackup -b {simulation_step_time} -e {simulation_step_time}"
         ]
 
         bt.logging.warning(f"Computing an intermediate gro...")
-        run_cmd_commands(
-            commands=command,
-            suppress_cmd_output=self.config.suppress_cmd_output,
-            verbose=self.config.verbose,
-        )
+        self.run_commands(commands=command, cwd=output_directory)
 
         return gro_file_location
 
+    @traced()
     def rerun(self, output_directory: str, gro_file_location: str):
         """Rerun method is to rerun a step of a miner simulation to ensure that
         the miner is running the correct protein.
@@ -485,19 +654,22 @@ class Protein:
             f"gmx grompp -f {rerun_mdp} -c {gro_file_location} -p {topol_path} -o {tpr_path}",
             f"gmx mdrun -s {tpr_path} -rerun {gro_file_location} -deffnm {output_directory}/rerun_energy",  # -s specifies the file.
         ]
-        run_cmd_commands(
-            commands=commands,
-            suppress_cmd_output=self.config.suppress_cmd_output,
-            verbose=self.config.verbose,
-        )
+        self.run_commands(commands=commands, cwd=output_directory)
 
-    def process_md_output(self, md_output: Dict, hotkey: str) -> bool:
+    @traced()
+    def process_md_output(
+        self, md_output: Dict, hotkey: str, md_output_appended: Dict = None
+    ) -> bool:
         """
         1. Check md_output for the required files, if unsuccessful return False
         2. Save files if above is valid
         3. Check the hash of the .gro file to ensure miners are running the correct protein.
         4.
+
+        Files in md_output_appended only hold what the miner appended since the last query, and
+        are appended to the copy in the miner data directory.
         """
+        md_output_appended = md_output_appended or {}
 
         required_files_extensions = ["xtc", "tpr", "log"]
 
@@ -505,7 +677,7 @@ class Protein:
         md_outputs_exts = {
             k.split(".")[-1]: k
             for k, v in md_output.items()
-            if len(v) > 0 and "center" not in k
+            if (len(v) > 0 or k in md_output_appended) and "center" not in k
         }
 
         if len(md_output.keys()) == 0:
@@ -525,6 +697,7 @@ class Protein:
         self.save_files(
             files=md_output,
             output_directory=self.miner_data_directory,
+            offsets=md_output_appended,
         )
 
         last_miner_simulation_step_time = get_last_step_time(
@@ -539,7 +712,8 @@ class Protein:
         )
 
         # Check that the md_output contains the right protein through gro_hash
-        if gro_hash(gro_path=self.gro_path) != gro_hash(gro_path=gro_file_location):
+        validator_gro_hash = cached_gro_hash(gro_path=self.gro_path)
+        if validator_gro_hash != gro_hash(gro_path=gro_file_location):
             bt.logging.warning(
                 f"The hash for .gro file from hotkey {hotkey} is incorrect, so reward is zero!"
             )
@@ -555,6 +729,7 @@ class Protein:
         )
         return True
 
+    @traced()
     def is_run_valid(self, energy: float, hotkey: str):
         self.get_miner_data_directory(hotkey=hotkey)
         gro_file_location = os.path.join(self.miner_data_directory, "intermediate.gro")
@@ -573,24 +748,16 @@ class Protein:
             f"gmx mdrun -s {tpr_path} -deffnm {self.miner_data_directory}/check -ntmpi 1 -nsteps 10",
         ]
 
-        # computing the energy after the 10 step production run
-        commands += [
-            f"echo Potential | gmx energy -f {self.miner_data_directory}/check.edr -o {self.miner_data_directory}/check.xvg"
-        ]
+        self.run_commands(commands=commands, cwd=self.miner_data_directory)
 
-        run_cmd_commands(
-            commands=commands,
-            suppress_cmd_output=self.config.suppress_cmd_output,
-            verbose=self.config.verbose,
-        )
-        df_check = pd.read_csv(
-            f"{self.miner_data_directory}/check.xvg",
-            skiprows=24,
-            delim_whitespace=True,
-            names=["Time", "Energy"],
+        # computing the energy after the 10 step production run
+        df_check = get_energy_from_edr(
+            edr_file=os.path.join(self.miner_data_directory, "check.edr"),
+            data_type="Potential",
+            last_only=True,
         )
 
-        check_energy = df_check["Energy"].iloc[-1]
+        check_energy = df_check["energy"].iloc[-1]
         percentage_change = abs(((check_energy - energy) / energy))
         cmd = f"rm {self.miner_data_directory}/check* "
         os.system(cmd)
@@ -598,6 +765,7 @@ class Protein:
             return False, check_energy
         return True, check_energy
 
+    @traced()
     def get_energy(
         self,
         data_type: str,
@@ -608,14 +776,24 @@ class Protein:
         if output_path is None:
             output_path = self.miner_data_directory
 
+        edr_file = os.path.join(output_path, "rerun_energy.edr")
+        try:
+            data = read_edr(edr_file, terms=[data_type])
+            return pd.DataFrame({"step": data["time"], "energy": data[data_type]})
+        except Exception as e:
+            bt.logging.warning(
+                f"Failed to read {edr_file!r} in-process with error: {e}. Falling back to {base_command}."
+            )
+
         xvg_name = "rerun_energy_extracted.xvg"
         output_data_location = os.path.join(output_path, xvg_name)
         command = [
             f"printf '{data_type}\n0\n' | {base_command} -f {output_path}/rerun_energy.edr -o {output_data_location} {xvg_command}"
         ]
-        run_cmd_commands(command)
+        self.run_commands(commands=command, cwd=output_path)
         return self.extract(filepath=output_data_location, names=["step", "energy"])
 
+    @traced()
     def get_rmsd(self, output_path: str = None, xvg_command: str = "-xvg none"):
         if output_path is None:
             output_path = self.miner_data_directory
@@ -625,7 +803,7 @@ class Protein:
         command = [
             f"echo '4 4' | gmx rms -s {self.validator_directory}/em.tpr -f {output_path}/rerun_energy.trr -o {output_data_location} -tu ns {xvg_command}"
         ]
-        run_cmd_commands(command)
+        self.run_commands(commands=command, cwd=output_path)
 
         return self.extract(filepath=output_data_location, names=["step", "rmsd"])
 
@@ -1,18 +1,185 @@
-from typing import List
+import os
+import math
+import time
+import signal
+import multiprocessing
+import concurrent.futures
+from typing import List, Dict, Optional, Tuple
 
 import bittensor as bt
 import numpy as np
 
 from folding.protocol import JobSubmissionSynapse
 from folding.validators.protein import Protein
+from folding.utils.tracing import Span, traced, tracer
+
+
+@traced()
+def verify_miner_output(
+    protein: Protein,
+    md_output: Dict,
+    hotkey: str,
+    status_code: int,
+    uid: int,
+    md_output_appended: Dict = None,
+) -> Optional[Dict]:
+    """Verifies the md_output of a single miner. All of the files are written to and
+    computed in the miner data directory of the hotkey, so several miners can be checked
+    at the same time in different processes.
+
+    Returns:
+        Optional[Dict]: energy, rmsd and validity information for the miner, or None if the output is rejected.
+    """
+    protein.command_timings = []  # only the commands of this miner are reported.
+
+    # Ensures that the md_outputs from the miners are parsed correctly
+    if not protein.process_md_output(
+        md_output=md_output, hotkey=hotkey, md_output_appended=md_output_appended
+    ):
+        return None
+
+    if status_code != 200:
+        bt.logging.info(f"uid {uid} responded with status code {status_code}")
+        return None
+
+    energy = protein.get_energy(data_type="Potential").iloc[-1]["energy"]
+    rmsd = protein.get_rmsd().iloc[-1]["rmsd"]
+
+    if energy == 0:
+        return None
+
+    is_valid, checked_energy = protein.is_run_valid(energy, hotkey)
+
+    return {
+        "energy": energy,
+        "is_valid": is_valid,
+        "checked_energy": float(checked_energy),
+        "reported_energy": float(energy),
+        "rmsd": float(rmsd),
+        "command_timings": protein.command_timings,
+    }
+
+
+def verify_miner_output_in_worker(
+    timeout: float = None, **kwargs
+) -> Tuple[Optional[Dict], List[Span]]:
+    """Runs verify_miner_output in a pool process, and returns the spans that were recorded
+    in the process together with the result, so they can be logged by the validator.
+
+    The gromacs commands of the task are killed once it has run for timeout seconds.
+    """
+    tracer.drain()  # spans left by a task that failed.
+    if timeout is not None:
+        kwargs["protein"].deadline = time.monotonic() + timeout
+    return verify_miner_output(**kwargs), tracer.drain()
+
+
+def register_worker(worker_pids):
+    """Initializer of the pool processes, which reports their pid so they can be killed."""
+    worker_pids.put(os.getpid())
+
+
+class VerificationPool:
+    """Process pool that verifies the outputs of several miners in parallel.
+
+    Each miner is verified in its own process and in its own miner data directory, and the
+    results are gathered back in uid order. The commands of a verification are killed once it
+    took longer than the timeout. If a task still overruns, the processes of the pool are killed
+    and a new pool is started, so that later steps do not queue behind it.
+
+    The processes are started from a forkserver rather than forked from the validator, whose
+    threads (challenge buffer, logging, asyncio loop) may hold locks at the time of the fork.
+
+    Args:
+        max_workers (int): number of processes used to verify miner outputs.
+        timeout (float): time (seconds) that a single miner verification is allowed to take.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        mp_context = multiprocessing.get_context("forkserver")
+        # The forkserver imports the verification code once, so new processes start quickly.
+        mp_context.set_forkserver_preload([__name__])
+        self.worker_pids = mp_context.SimpleQueue()
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp_context,
+            initializer=register_worker,
+            initargs=(self.worker_pids,),
+        )
+
+    def restart(self):
+        """Kills the processes of the pool, which can be stuck in a task, and starts a new pool."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while not self.worker_pids.empty():
+            try:
+                os.kill(self.worker_pids.get(), signal.SIGKILL)
+            except ProcessLookupError:
+                pass  # the process already exited.
+        self.executor = self._create_executor()
+
+    def run(self, protein: Protein, tasks: List[Dict]) -> List[Optional[Dict]]:
+        """Submits all verification tasks and waits for them, returning the results in the order of the tasks.
+        Tasks that fail or do not finish in time return None.
+        """
+        futures = [
+            self.executor.submit(
+                verify_miner_output_in_worker,
+                timeout=self.timeout,
+                protein=protein,
+                **task,
+            )
+            for task in tasks
+        ]
+
+        # Verifications run in waves of max_workers, so each wave gets the per-miner timeout.
+        waves = math.ceil(len(futures) / self.max_workers)
+        _, not_done = concurrent.futures.wait(futures, timeout=self.timeout * waves)
+
+        if not_done:
+            self.restart()
+
+        results = []
+        for task, future in zip(tasks, futures):
+            if future in not_done:
+                bt.logging.error(
+                    f"Verification of miner data for uid {task['uid']} timed out after {self.timeout}s"
+                )
+                results.append(None)
+                continue
+
+            try:
+                result, spans = future.result()
+                tracer.add(spans)
+                results.append(result)
+            except Exception as E:
+                bt.logging.error(
+                    f"Failed to parse miner data for uid {task['uid']} with error: {E}"
+                )
+                results.append(None)
+
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
 
 
 def get_energies(
-    protein: Protein, responses: List[JobSubmissionSynapse], uids: List[int]
+    protein: Protein,
+    responses: List[JobSubmissionSynapse],
+    uids: List[int],
+    pool: VerificationPool = None,
 ):
     """Takes all the data from reponse synapses, applies the reward pipeline, and aggregates the rewards
     into a single torch.FloatTensor. Also aggregates the RMSDs for logging.
 
+    Args:
+        pool (VerificationPool, optional): pool used to verify the miners in parallel. If None, miners are verified one after another.
+
     Returns:
         tuple:
             torch.FloatTensor: A tensor of rewards for each miner.
@@ -23,39 +190,44 @@ def get_energies(
     event["checked_energy"] = [0] * len(uids)
     event["reported_energy"] = [0] * len(uids)
     event["rmsds"] = [0] * len(uids)
+    event["command_timings"] = [[] for _ in uids]
     energies = np.zeros(len(uids))
-    for i, (uid, resp) in enumerate(zip(uids, responses)):
-        # Ensures that the md_outputs from the miners are parsed correctly
-        try:
-            if not protein.process_md_output(
-                md_output=resp.md_output, hotkey=resp.axon.hotkey
-            ):
-                continue
 
-            if resp.dendrite.status_code != 200:
-                bt.logging.info(
-                    f"uid {uid} responded with status code {resp.dendrite.status_code}"
-                )
-                continue
-            energy = protein.get_energy(data_type="Potential").iloc[-1]["energy"]
-            rmsd = protein.get_rmsd().iloc[-1]["rmsd"]
+    tasks = [
+        {
+            "md_output": resp.md_output,
+            "md_output_appended": resp.md_output_appended,
+            "hotkey": resp.axon.hotkey,
+            "status_code": resp.dendrite.status_code,
+            "uid": uid,
+        }
+        for uid, resp in zip(uids, responses)
+    ]
 
-            if energy == 0:
-                continue
+    if pool is not None:
+        results = pool.run(protein=protein, tasks=tasks)
+    else:
+        results = []
+        for task in tasks:
+            try:
+                results.append(verify_miner_output(protein=protein, **task))
+            except Exception as E:
+                # If any of the above methods have an error, we will catch here.
+                bt.logging.error(
+                    f"Failed to parse miner data for uid {task['uid']} with error: {E}"
+                )
+                results.append(None)
 
-            is_valid, checked_energy = protein.is_run_valid(energy, resp.axon.hotkey)
-            energies[i] = energy if is_valid else 0
+    for i, result in enumerate(results):
+        if result is None:
+            continue
 
-            event["is_valid"][i] = is_valid
-            event["checked_energy"][i] = float(checked_energy)
-            event["reported_energy"][i] = float(energy)
-            event["rmsds"][i] = float(rmsd)
+        energies[i] = result["energy"] if result["is_valid"] else 0
 
-        except Exception as E:
-            # If any of the above methods have an error, we will catch here.
-            bt.logging.error(
-                f"Failed to parse miner data for uid {uid} with error: {E}"
-            )
-            continue
+        event["is_valid"][i] = result["is_valid"]
+        event["checked_energy"][i] = result["checked_energy"]
+        event["reported_energy"][i] = result["reported_energy"]
+        event["rmsds"][i] = result["rmsd"]
+        event["command_timings"][i] = result["command_timings"]
 
     return energies, event
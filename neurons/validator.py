@@ -18,6 +18,7 @@
 import os
 import re
 import time
+import shutil
 import random
 import numpy as np
 from typing import Dict, List, Tuple, Optional
@@ -27,11 +28,20 @@ import torch
 import pandas as pd
 import bittensor as bt
 
-from folding.store import PandasJobStore
+from folding.store import SQLiteJobStore, DB_DIR
 from folding.utils.uids import get_random_uids
 from folding.rewards.reward_pipeline import reward_pipeline
-from folding.validators.forward import create_new_challenge, run_step, run_ping_step
+from folding.protocol import JobSubmissionSynapse
+from folding.validators.forward import (
+    ROOT_DIR,
+    create_new_challenge,
+    run_step,
+    run_ping_step,
+)
 from folding.validators.protein import Protein
+from folding.validators.input_cache import InputBundleCache
+from folding.validators.reward import VerificationPool
+from folding.validators.challenge_buffer import ChallengeBuffer
 
 # import base validator class which takes care of most of the boilerplate
 from folding.store import Job
@@ -51,10 +61,42 @@ class Validator(BaseValidatorNeuron):
 
         self.load_state()
 
-        # TODO: Change the store to SQLiteJobStore if you want to use SQLite
-        self.store = PandasJobStore()
+        # Jobs from an existing protein_jobs.csv are migrated into the database on first start.
+        self.store = SQLiteJobStore(db_path=self.config.neuron.db_path or DB_DIR)
         self.mdrun_args = self.parse_mdrun_args()
 
+        # The input files of jobs are kept in memory, instead of being read at every query.
+        if self.config.neuron.md_inputs_cache_mb > 0:
+            Protein.md_inputs_cache = InputBundleCache(
+                max_bytes=self.config.neuron.md_inputs_cache_mb * 1024**2
+            )
+
+        # Compressed miner files are rejected once they expand past this size.
+        JobSubmissionSynapse.max_md_output_size = (
+            self.config.neuron.max_md_output_mb * 1024**2
+        )
+
+        # Miner files are decoded to disk as they arrive. Files left by a previous run are removed.
+        if self.config.neuron.spool_md_output:
+            spool_directory = os.path.join(ROOT_DIR, "data", "spool")
+            shutil.rmtree(spool_directory, ignore_errors=True)
+            JobSubmissionSynapse.spool_directory = spool_directory
+
+        # Miner outputs are verified in parallel, each in its own process.
+        self.verification_pool = VerificationPool(
+            max_workers=self.config.neuron.verification_workers,
+            timeout=self.config.neuron.verification_timeout,
+        )
+
+        # Challenges are prepared ahead of time in a background thread, so that new jobs can be created without waiting on GROMACS.
+        self.challenge_buffer = None
+        if self.config.neuron.challenge_buffer_size > 0:
+            self.challenge_buffer = ChallengeBuffer(
+                validator=self,
+                depth=self.config.neuron.challenge_buffer_size,
+                path=os.path.join(self.store.db_path, "prepared_challenges.json"),
+            )
+
         # Sample all the uids on the network, and return only the uids that are non-valis.
         bt.logging.info("Determining all miner uids...⏳")
         self.all_miner_uids: List = get_random_uids(
@@ -62,6 +104,9 @@ class Validator(BaseValidatorNeuron):
         ).tolist()
         self.wandb_run_start = None
 
+        if self.challenge_buffer is not None:
+            self.challenge_buffer.start()
+
     def parse_mdrun_args(self) -> str:
         mdrun_args = ""
 
@@ -96,7 +141,7 @@ class Validator(BaseValidatorNeuron):
             and self.metagraph.axons[self.metagraph.hotkeys.index(hotkey)].is_serving
         ]
 
-    def forward(self, job: Job) -> dict:
+    async def forward(self, job: Job) -> dict:
         """Carries out a query to the miners to check their progress on a given job (pdb) and updates the job status based on the results.
 
         Validator forward pass. Consists of:
@@ -116,7 +161,7 @@ class Validator(BaseValidatorNeuron):
         # query the miners and get the rewards for their responses
         # Check check_uid_availability to ensure that the hotkeys are valid and active
         bt.logging.info("⏰ Waiting for miner responses ⏰")
-        return run_step(
+        return await run_step(
             self,
             protein=protein,
             uids=uids,
@@ -126,7 +171,22 @@ class Validator(BaseValidatorNeuron):
 
     def get_pdbs_to_exclude(self) -> List[str]:
         # Set of pdbs that are currently in the process of running + old submitted simulations.
-        return list(self.store._db.index)
+        return self.store.get_all_pdbs()
+
+    def get_challenge(self, exclude: List[str]) -> Optional[Dict]:
+        """Returns a prepared challenge from the challenge buffer. If the buffer is disabled, a new
+        challenge is prepared right away.
+
+        Args:
+            exclude (List[str]): pdbs that should not be used for the new challenge.
+
+        Returns:
+            Optional[Dict]: event of the prepared challenge, or None if no prepared challenge is available.
+        """
+        if self.challenge_buffer is None:
+            return create_new_challenge(self, exclude=exclude)
+
+        return self.challenge_buffer.pop()
 
     def ping_all_miners(
         self,
@@ -189,6 +249,12 @@ class Validator(BaseValidatorNeuron):
         for ii in range(k):
             bt.logging.info(f"Adding job: {ii+1}/{k}")
 
+            if self.challenge_buffer is not None and len(self.challenge_buffer) == 0:
+                bt.logging.warning(
+                    "No prepared challenges available yet... Skipping until the challenge buffer is filled"
+                )
+                break
+
             # This will change on each loop since we are submitting a new pdb to the batch of miners
             exclude_pdbs = self.get_pdbs_to_exclude()
 
@@ -209,8 +275,12 @@ class Validator(BaseValidatorNeuron):
 
             if len(valid_uids) == self.config.neuron.sample_size:
                 # With the above logic, we know we have a valid set of uids.
-                # selects a new pdb, downloads data, preprocesses and gets hyperparams.
-                job_event: Dict = create_new_challenge(self, exclude=exclude_pdbs)
+                # takes a prepared challenge (pdb that is downloaded, preprocessed and has hyperparams).
+                job_event: Dict = self.get_challenge(exclude=exclude_pdbs)
+                if job_event is None:
+                    bt.logging.warning("No prepared challenges available... Skipping")
+                    break
+
                 job_event["uid_search_time"] = uid_search_time
 
                 selected_hotkeys = [self.metagraph.hotkeys[uid] for uid in valid_uids]
@@ -0,0 +1,48 @@
+import os
+import pytest
+
+from benchmarks.core import run_benchmarks, save_results, load_results
+from benchmarks.compare import compare_results
+import benchmarks.cases  # registers the benchmarks
+
+
+def make_results(times: dict) -> dict:
+    return {
+        "metadata": {"version": "0.0.0", "commit": None},
+        "results": [
+            (
+                {"key": key, "best": time, "median": time}
+                if time is not None
+                else {"key": key, "skipped": "gmx is not installed"}
+            )
+            for key, time in times.items()
+        ],
+    }
+
+
+def test_compare_results():
+    baseline = make_results({"a": 1.0, "b": 1.0, "c": 1.0, "d": None, "e": 1.0})
+    current = make_results({"a": 1.5, "b": 0.5, "c": 1.05, "d": 1.0, "f": 1.0})
+
+    comparisons = {c["key"]: c for c in compare_results(baseline, current)}
+
+    assert set(comparisons) == {"a", "b", "c"}
+    assert comparisons["a"]["status"] == "slower"
+    assert comparisons["a"]["change"] == pytest.approx(0.5)
+    assert comparisons["b"]["status"] == "faster"
+    assert comparisons["c"]["status"] == "same"
+
+
+def test_run_quick_benchmarks(tmp_path):
+    results = run_benchmarks(names=["gro_hash", "store.update"], quick=True, repeats=2)
+
+    path = os.path.join(tmp_path, "results.json")
+    save_results(path, results)
+    results = load_results(path)
+
+    assert [result["key"] for result in results["results"]] == [
+        "gro_hash[n_atoms=10000]",
+        "store.update[n_jobs=100,store=pandas]",
+    ]
+    assert all(result["best"] > 0 for result in results["results"])
+    assert all(c["status"] == "same" for c in compare_results(results, results))
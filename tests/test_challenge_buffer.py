@@ -0,0 +1,81 @@
+import os
+import time
+import shutil
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.validators.protein import Protein
+from folding.validators.challenge_buffer import ChallengeBuffer
+
+ROOT_PATH = Path(__file__).parent
+DB_PATH = os.path.join(ROOT_PATH, "mock_data")
+BUFFER_PATH = os.path.join(DB_PATH, "prepared_challenges.json")
+PDBS = ["test_buffer_1", "test_buffer_2"]
+
+CONFIG = SimpleNamespace(protein=SimpleNamespace(pdb_id=None))
+
+
+def make_event(pdb_id: str):
+    return {
+        "pdb_id": pdb_id,
+        "ff": "charmm27",
+        "box": "cubic",
+        "water": "tip3p",
+        "prepared_at": time.time(),
+    }
+
+
+def prepare_files(pdb_id: str):
+    protein = Protein(pdb_id=pdb_id, ff="charmm27", box="cubic", config=CONFIG.protein)
+    os.makedirs(protein.validator_directory, exist_ok=True)
+    open(protein.gro_path, "w").close()
+    return protein
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+    for pdb_id in PDBS:
+        protein = Protein(
+            pdb_id=pdb_id, ff="charmm27", box="cubic", config=CONFIG.protein
+        )
+        if os.path.exists(protein.pdb_directory):
+            shutil.rmtree(protein.pdb_directory)
+    if os.path.exists(DB_PATH):
+        shutil.rmtree(DB_PATH)
+
+
+def test_buffer_survives_restart():
+    validator = SimpleNamespace(config=CONFIG)
+    buffer = ChallengeBuffer(validator=validator, depth=2, path=BUFFER_PATH)
+
+    for pdb_id in PDBS:
+        prepare_files(pdb_id)
+        buffer.put(make_event(pdb_id))
+
+    # A new buffer (after a restart) loads the prepared challenges from disk.
+    buffer = ChallengeBuffer(validator=validator, depth=2, path=BUFFER_PATH)
+    assert buffer.pdbs == PDBS
+
+    event = buffer.pop()
+    assert event["pdb_id"] == PDBS[0]
+    assert "challenge_buffer_time" in event
+
+    buffer = ChallengeBuffer(validator=validator, depth=2, path=BUFFER_PATH)
+    assert buffer.pdbs == PDBS[1:]
+
+
+def test_buffer_skips_challenges_without_files():
+    validator = SimpleNamespace(config=CONFIG)
+    buffer = ChallengeBuffer(validator=validator, depth=2, path=BUFFER_PATH)
+
+    protein = prepare_files(PDBS[0])
+    prepare_files(PDBS[1])
+    for pdb_id in PDBS:
+        buffer.put(make_event(pdb_id))
+
+    shutil.rmtree(protein.pdb_directory)
+
+    assert buffer.pop()["pdb_id"] == PDBS[1]
+    assert buffer.pop() is None
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import shutil
+import pytest
+import subprocess
+from pathlib import Path
+
+from folding.utils.ops import run_cmd_commands
+from folding.utils.commands import parse_command, run_command
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_commands")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+@pytest.mark.parametrize(
+    "cmd, args, stdin",
+    [
+        ("gmx mdrun -v -deffnm em", ["gmx", "mdrun", "-v", "-deffnm", "em"], None),
+        (["gmx", "mdrun", "-deffnm", "a b"], ["gmx", "mdrun", "-deffnm", "a b"], None),
+        (
+            'echo "SOL" | gmx genion -s ions.tpr -neutral',
+            ["gmx", "genion", "-s", "ions.tpr", "-neutral"],
+            b"SOL\n",
+        ),
+        ("echo '4 4' | gmx rms -tu ns", ["gmx", "rms", "-tu", "ns"], b"4 4\n"),
+        (
+            "printf 'Potential\n0\n' | gmx energy -f em.edr",
+            ["gmx", "energy", "-f", "em.edr"],
+            b"Potential\n0\n",
+        ),
+    ],
+)
+def test_parse_command(cmd, args, stdin):
+    assert parse_command(cmd) == (args, stdin)
+
+
+@pytest.mark.parametrize(
+    "cmd",
+    [
+        "grep -v HETATM a.pdb > b.pdb",
+        "! echo 'Potential' | gmx energy -f a.edr",
+        "echo '1\\n1\\n' | gmx trjconv -center",  # dash interprets the escapes
+        "printf '%s\\n' Potential | gmx energy",
+        "rm check*",
+    ],
+)
+def test_parse_command_needs_shell(cmd):
+    assert parse_command(cmd) == (["/bin/sh", "-c", cmd], None)
+
+
+def test_piped_input_is_written_to_stdin():
+    result = run_command("echo 'a b' | cat")
+    assert result.args == ["cat"]
+    assert result.stdout == b"a b\n"
+
+
+def test_output_is_capped():
+    result = run_command(
+        [sys.executable, "-c", "print('x' * 100000, end=''); print('end', end='')"],
+        max_output_bytes=1000,
+    )
+    assert result.truncated
+    assert len(result.stdout) == 1000 and result.stdout.endswith(b"xend")
+
+
+def test_resource_usage_is_measured():
+    result = run_command(
+        [
+            sys.executable,
+            "-c",
+            "import time\nx = bytearray(100 * 1024 * 1024)\nt = time.process_time()\nwhile time.process_time() - t < 0.2: pass",
+        ]
+    )
+    assert result.cpu_time >= 0.2
+    assert result.wall_time >= result.cpu_time * 0.5
+    assert result.max_rss > 100 * 1024  # kB
+
+
+def test_command_times_out():
+    start_time = time.time()
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        run_command("sleep 30", timeout=0.5)
+
+    assert time.time() - start_time < 10
+    assert e.value.result.timed_out
+
+
+def test_failed_commands():
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run_command("ls not_a_file", cwd=OUTPUT_PATH)
+    assert e.value.returncode != 0
+    assert b"not_a_file" in e.value.stderr
+
+    # A missing program fails like it does in the shell.
+    result = run_command("not_a_program --help", check=False)
+    assert result.returncode == 127
+
+
+def test_run_cmd_commands_records_timings():
+    timings = []
+    results = run_cmd_commands(
+        commands=["touch a.txt", "cp a.txt b.txt"], cwd=OUTPUT_PATH, timings=timings
+    )
+
+    assert os.path.exists(os.path.join(OUTPUT_PATH, "b.txt"))
+    assert [result.returncode for result in results] == [0, 0]
+    assert [timing["cmd"] for timing in timings] == ["touch a.txt", "cp a.txt b.txt"]
+
+    with pytest.raises(subprocess.CalledProcessError):
+        run_cmd_commands(commands=["false", "true"], timings=timings)
+    assert timings[-1]["cmd"] == "false" and timings[-1]["returncode"] == 1
@@ -0,0 +1,180 @@
+import os
+import base64
+import shutil
+import pytest
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from folding.protocol import JobSubmissionSynapse
+from folding.miners.folding_miner import attach_files
+from folding.utils.compression import (
+    available_encodings,
+    choose_encoding,
+    compress,
+    decompress,
+    encode_file,
+    iter_decompress,
+)
+from benchmarks.fixtures import write_md_log
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_compression")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def write_md_output(directory: str):
+    """Writes a log, which compresses well, and a random tpr, which does not."""
+    log_path = os.path.join(directory, "md_0_1.log")
+    write_md_log(log_path, n_steps=5_000_000)
+    tpr_path = os.path.join(directory, "md_0_1.tpr")
+    with open(tpr_path, "wb") as f:
+        f.write(np.random.default_rng(0).bytes(100_000))
+    return [log_path, tpr_path]
+
+
+def test_choose_encoding():
+    assert choose_encoding(None) is None
+    assert choose_encoding([]) is None
+    assert choose_encoding(["brotli"]) is None
+    assert choose_encoding(["brotli", "gzip"]) == "gzip"
+    assert choose_encoding(available_encodings()) == available_encodings()[0]
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_compress(encoding):
+    log_path, _ = write_md_output(OUTPUT_PATH)
+    with open(log_path, "rb") as f:
+        content = f.read()
+
+    compressed = compress(content, encoding)
+    assert len(compressed) < len(content) / 5
+    assert decompress(compressed, encoding) == content
+
+
+@pytest.mark.parametrize("encoding", [None] + available_encodings())
+@pytest.mark.parametrize("chunk_size", [1000, 1024**2])
+@pytest.mark.parametrize("offset", [0, 1, 12345])
+def test_encode_file(encoding, chunk_size, offset):
+    log_path, tpr_path = write_md_output(OUTPUT_PATH)
+    for path in (log_path, tpr_path):
+        with open(path, "rb") as f:
+            content = f.read()[offset:]
+
+        encoded, size = encode_file(
+            path, encoding=encoding, chunk_size=chunk_size, offset=offset
+        )
+        assert size == len(content)
+        decoded = base64.b64decode(encoded)
+        assert (decompress(decoded, encoding) if encoding else decoded) == content
+
+
+def test_encode_empty_file():
+    path = os.path.join(OUTPUT_PATH, "md_0_1.cpt")
+    open(path, "wb").close()
+    assert encode_file(path) == (b"", 0)
+    assert encode_file(path, offset=10) == (b"", 0)
+    assert base64.b64decode(encode_file(path, encoding="gzip")[0]) == compress(
+        b"", "gzip"
+    )
+
+
+def test_encode_file_memory_is_bounded():
+    path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    with open(path, "wb") as f:
+        f.write(os.urandom(20 * 1024**2))
+
+    tracemalloc.start()
+    encoded, _ = encode_file(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Only the base64 output (with the spare room of its buffer) and a few chunks are held in memory.
+    assert peak < len(encoded) * 1.25 + 4 * 1024**2
+
+
+def make_synapse(encodings):
+    synapse = JobSubmissionSynapse(
+        pdb_id="1ubq", md_inputs={}, md_output_encodings=encodings
+    )
+    synapse.md_output = {}
+    synapse.axon = SimpleNamespace(hotkey="5Miner")
+    return synapse
+
+
+def send(synapse):
+    """The synapse is sent as json, in which the base64 files are strings."""
+    synapse.md_output = {k: v.decode() for k, v in synapse.md_output.items()}
+    return synapse
+
+
+@pytest.mark.parametrize("encodings", [[], ["gzip"], available_encodings()])
+def test_md_output_round_trip(encodings):
+    files = write_md_output(OUTPUT_PATH)
+    expected = {}
+    for path in files:
+        with open(path, "rb") as f:
+            expected[os.path.basename(path)] = f.read()
+
+    synapse = send(attach_files(files, make_synapse(encodings)))
+    assert synapse.md_output_encoding == choose_encoding(encodings)
+    assert synapse.md_output_sizes == {k: len(v) for k, v in expected.items()}
+
+    synapse.deserialize()
+    assert synapse.md_output == expected
+
+    transfer_size = sum(synapse.md_output_transfer_sizes.values())
+    raw_size = sum(map(len, expected.values()))
+    if len(encodings) == 0:
+        assert transfer_size > raw_size * 4 / 3 - 10  # base64 only
+    else:
+        assert transfer_size < raw_size
+
+
+def test_unknown_encoding_is_rejected():
+    synapse = send(attach_files(write_md_output(OUTPUT_PATH), make_synapse(["gzip"])))
+    synapse.md_output_encoding = "brotli"
+    synapse.deserialize()
+    assert all(v is None for v in synapse.md_output.values())
+
+
+@pytest.mark.parametrize("encoding", available_encodings())
+def test_decompression_is_bounded(encoding):
+    bomb = compress(b"\0" * 100 * 1024**2, encoding)
+    assert len(bomb) < 1024**2
+
+    tracemalloc.start()
+    with pytest.raises(ValueError):
+        decompress(bomb, encoding, max_size=10 * 1024**2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 16 * 1024**2
+
+    chunks = list(iter_decompress([bomb[:100], bomb[100:]], encoding, chunk_size=1000))
+    assert max(map(len, chunks)) <= 1000
+    assert sum(map(len, chunks)) == 100 * 1024**2
+
+
+def test_md_output_larger_than_declared_is_rejected():
+    synapse = send(attach_files(write_md_output(OUTPUT_PATH), make_synapse(["gzip"])))
+    synapse.md_output_sizes["md_0_1.log"] -= 1
+    synapse.deserialize()
+    assert synapse.md_output["md_0_1.log"] is None
+    assert synapse.md_output["md_0_1.tpr"] is not None
+
+
+def test_md_output_larger_than_max_size_is_rejected(monkeypatch):
+    monkeypatch.setattr(JobSubmissionSynapse, "max_md_output_size", 100_000)
+    synapse = send(attach_files(write_md_output(OUTPUT_PATH), make_synapse(["gzip"])))
+    synapse.md_output_sizes = None
+    synapse.deserialize()
+    assert synapse.md_output["md_0_1.log"] is None
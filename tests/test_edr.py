@@ -0,0 +1,150 @@
+import os
+import shutil
+import struct
+import pytest
+import numpy as np
+from pathlib import Path
+
+from folding.utils.edr import read_edr, EDRFormatError
+from folding.utils.ops import get_energy_from_edr, calc_potential_from_edr
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_edr")
+
+NAMES = ["Bond", "Angle", "Potential", "Pressure"]
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def write_string(value: str) -> bytes:
+    """Writes a string like gmx_fio_do_string: its size with the null terminator, then the XDR string."""
+    data = value.encode()
+    padding = (4 - len(data) % 4) % 4
+    return struct.pack(">ii", len(data) + 1, len(data)) + data + b"\0" * padding
+
+
+def write_edr(
+    path: str, energies: np.ndarray, real: str = ">f", nsum: int = 0, block=None
+):
+    """Writes an edr file in the same layout as GROMACS (file version 5).
+
+    Args:
+        energies (np.ndarray): energies with shape (n_frames, n_terms)
+        real (str): struct format of reals, >f for single and >d for double precision
+        nsum (int): if > 0, averages and sums are written after each energy
+        block (np.ndarray, optional): doubles written as a block after the energies of each frame
+    """
+    data = struct.pack(">iii", -55555, 5, len(NAMES))
+    for name in NAMES:
+        data += write_string(name) + write_string("kJ/mol")
+
+    for i, frame in enumerate(energies):
+        nblock = 0 if block is None else 1
+        data += struct.pack(real, -2e10)
+        data += struct.pack(">ii", -7777777, 5)
+        data += struct.pack(">dqiqd", i * 2.0, i * 1000, nsum, 1000, 0.002)
+        data += struct.pack(">iii", len(frame), 0, nblock)
+        if block is not None:
+            data += struct.pack(">iiii", 0, 1, 2, len(block))  # id, nsub, double, nr
+        data += struct.pack(">iii", 0, 0, 0)
+
+        for value in frame:
+            data += struct.pack(real, value)
+            if nsum > 0:
+                data += struct.pack(real + real[-1], value / 2, value * nsum)
+
+        if block is not None:
+            data += struct.pack(f">{len(block)}d", *block)
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_energies(n_frames: int) -> np.ndarray:
+    return (
+        np.arange(n_frames * len(NAMES), dtype=np.float64).reshape(n_frames, len(NAMES))
+        * -1.5
+    )
+
+
+@pytest.mark.parametrize("real", [">f", ">d"])
+@pytest.mark.parametrize("nsum", [0, 10])
+@pytest.mark.parametrize("block", [None, np.array([1.0, 2.0, 3.0])])
+def test_read_edr(real, nsum, block):
+    edr_path = os.path.join(OUTPUT_PATH, "em.edr")
+    energies = make_energies(n_frames=5)
+    write_edr(edr_path, energies=energies, real=real, nsum=nsum, block=block)
+
+    data = read_edr(edr_path)
+
+    assert data["time"].tolist() == [0.0, 2.0, 4.0, 6.0, 8.0]
+    assert data["step"].tolist() == [0, 1000, 2000, 3000, 4000]
+    for j, name in enumerate(NAMES):
+        np.testing.assert_allclose(data[name], energies[:, j])
+
+    last = read_edr(edr_path, terms=["Potential"], last_only=True)
+    assert last["Potential"].tolist() == [energies[-1, 2]]
+    assert "Bond" not in last
+
+
+def test_incomplete_last_frame_is_ignored():
+    edr_path = os.path.join(OUTPUT_PATH, "md_0_1.edr")
+    write_edr(edr_path, energies=make_energies(n_frames=3))
+
+    # Simulate a frame that is still being written by mdrun.
+    with open(edr_path, "rb+") as f:
+        f.truncate(os.path.getsize(edr_path) - 6)
+
+    data = read_edr(edr_path, terms=["Potential"])
+    assert len(data["Potential"]) == 2
+
+
+def test_read_edr_fails_on_other_files():
+    path = os.path.join(OUTPUT_PATH, "not_an_edr.edr")
+    with open(path, "w") as f:
+        f.write("this is not an edr file")
+
+    with pytest.raises(EDRFormatError):
+        read_edr(path)
+
+    write_edr(path, energies=make_energies(n_frames=1))
+    with pytest.raises(KeyError):
+        read_edr(path, terms=["Kinetic En."])
+
+    # Strings written with a single length, without the size that GROMACS writes before them.
+    with open(path, "wb") as f:
+        f.write(struct.pack(">iii", -55555, 5, 1))
+        f.write(struct.pack(">i", 4) + b"Bond" + struct.pack(">i", 6) + b"kJ/mol\0\0")
+    with pytest.raises(EDRFormatError):
+        read_edr(path)
+
+
+def test_calc_potential_from_edr():
+    energies = make_energies(n_frames=4)
+    write_edr(os.path.join(OUTPUT_PATH, "em.edr"), energies=energies)
+
+    potential = calc_potential_from_edr(output_dir=OUTPUT_PATH, edr_name="em.edr")
+    assert potential == energies[-1, 2]
+
+
+@pytest.mark.skipif(shutil.which("gmx") is None, reason="gmx is not installed")
+def test_read_edr_matches_gmx_energy():
+    edr_path = os.path.join(OUTPUT_PATH, "em.edr")
+    write_edr(edr_path, energies=make_energies(n_frames=5), nsum=10)
+
+    df = get_energy_from_edr(edr_path, data_type="Potential")
+
+    xvg_path = os.path.join(OUTPUT_PATH, "em.xvg")
+    os.system(
+        f"printf 'Potential\\n0\\n' | gmx energy -f {edr_path} -o {xvg_path} -xvg none -nobackup"
+    )
+    expected = np.loadtxt(xvg_path)
+
+    np.testing.assert_allclose(df["time"], expected[:, 0])
+    np.testing.assert_allclose(df["energy"], expected[:, 1], rtol=1e-6)
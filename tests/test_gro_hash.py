@@ -1,17 +1,20 @@
 import pytest
 
 import os
+import json
+import shutil
 from pathlib import Path
-from folding.utils.ops import gro_hash
+from benchmarks.fixtures import (
+    VALIDATOR_GRO_FILE,
+    MINER_GRO_FILE,
+    MINER_GRO_FILE_CORRUPT,
+    legacy_gro_hash,
+    write_large_gro_file,
+)
+from folding.utils.ops import gro_hash, cached_gro_hash
 
 ROOT_PATH = Path(__file__).parent
 
-MINER_GRO_FILE = os.path.join(ROOT_PATH, "fixtures/gro_files/md_0_1.gro")
-MINER_GRO_FILE_CORRUPT = os.path.join(
-    ROOT_PATH, "fixtures/gro_files/md_0_1_altered.gro"
-)
-VALIDATOR_GRO_FILE = os.path.join(ROOT_PATH, "fixtures/gro_files/em.gro")
-
 
 def test_gro_hash():
     validator_hash = gro_hash(gro_path=VALIDATOR_GRO_FILE)
@@ -25,3 +28,38 @@ def test_gro_hash():
     assert (
         validator_hash != miner_hash_corrupt
     ), "validator gro hash and corrupt miner gro hash are the same"
+
+
+@pytest.mark.parametrize(
+    "gro_path", [VALIDATOR_GRO_FILE, MINER_GRO_FILE, MINER_GRO_FILE_CORRUPT]
+)
+def test_gro_hash_matches_legacy_hash(gro_path):
+    assert gro_hash(gro_path=gro_path) == legacy_gro_hash(gro_path=gro_path)
+
+
+def test_gro_hash_matches_legacy_hash_for_large_files(tmp_path):
+    gro_path = os.path.join(tmp_path, "large.gro")
+    write_large_gro_file(gro_path, n_atoms=150_000)
+
+    assert gro_hash(gro_path=gro_path) == legacy_gro_hash(gro_path=gro_path)
+
+
+def test_cached_gro_hash_is_invalidated_when_file_changes(tmp_path):
+    gro_path = os.path.join(tmp_path, "em.gro")
+    shutil.copy(VALIDATOR_GRO_FILE, gro_path)
+
+    assert cached_gro_hash(gro_path=gro_path) == gro_hash(gro_path=VALIDATOR_GRO_FILE)
+    assert os.path.exists(f"{gro_path}.hash")
+
+    # The cached hash is returned as long as the file is unchanged.
+    with open(f"{gro_path}.hash", "r") as f:
+        cache = json.load(f)
+    cache["hash"] = "cached"
+    with open(f"{gro_path}.hash", "w") as f:
+        json.dump(cache, f)
+    assert cached_gro_hash(gro_path=gro_path) == "cached"
+
+    shutil.copy(MINER_GRO_FILE_CORRUPT, gro_path)
+    assert cached_gro_hash(gro_path=gro_path) == gro_hash(
+        gro_path=MINER_GRO_FILE_CORRUPT
+    )
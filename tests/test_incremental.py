@@ -0,0 +1,210 @@
+import os
+import shutil
+import pytest
+import concurrent.futures
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.protocol import JobSubmissionSynapse
+from folding.miners.folding_miner import attach_files
+from folding.validators.protein import Protein
+from folding.utils.incremental import (
+    DIGEST_BYTES,
+    SentFiles,
+    append_file,
+    get_append_offset,
+    get_file_offsets,
+)
+from benchmarks.fixtures import write_md_log
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_incremental")
+MINER_PATH = os.path.join(OUTPUT_PATH, "miner")
+VALIDATOR_PATH = os.path.join(OUTPUT_PATH, "validator")
+HOTKEY = "5MinerHotkey"
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(MINER_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def make_protein() -> Protein:
+    protein = Protein(
+        pdb_id="1ubq",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.setup_filepaths(validator_directory=VALIDATOR_PATH)
+    protein.get_miner_data_directory(hotkey=HOTKEY)
+    return protein
+
+
+def write_miner_files(n_steps: int, tpr: bytes = b"tpr"):
+    write_md_log(os.path.join(MINER_PATH, "md_0_1.log"), n_steps=n_steps)
+    with open(os.path.join(MINER_PATH, "md_0_1.tpr"), "wb") as f:
+        f.write(tpr)
+    return [os.path.join(MINER_PATH, name) for name in ("md_0_1.log", "md_0_1.tpr")]
+
+
+def query(
+    protein: Protein, sent_files: SentFiles = None, validator: str = "5Validator"
+) -> JobSubmissionSynapse:
+    """Sends the offsets of the validator to the miner, and saves the response like the validator does."""
+    synapse = JobSubmissionSynapse(
+        pdb_id="1ubq",
+        md_inputs={},
+        md_output_offsets=protein.get_md_output_offsets(hotkey=HOTKEY),
+    )
+    synapse.md_output = {}
+    synapse.axon = SimpleNamespace(hotkey=HOTKEY)
+    synapse.dendrite = SimpleNamespace(hotkey=validator)
+
+    synapse = attach_files(
+        [os.path.join(MINER_PATH, name) for name in sorted(os.listdir(MINER_PATH))],
+        synapse,
+        sent_files=sent_files,
+    )
+    synapse.md_output = {k: v.decode() for k, v in synapse.md_output.items()}
+    synapse.deserialize()
+
+    protein.save_files(
+        files=synapse.md_output,
+        output_directory=protein.miner_data_directory,
+        offsets=synapse.md_output_appended,
+    )
+    return synapse
+
+
+def assert_same_files():
+    for name in os.listdir(MINER_PATH):
+        with open(os.path.join(MINER_PATH, name), "rb") as f:
+            expected = f.read()
+        with open(os.path.join(VALIDATOR_PATH, HOTKEY[:8], name), "rb") as f:
+            assert f.read() == expected, name
+
+
+def test_only_appended_bytes_are_sent():
+    protein = make_protein()
+    write_miner_files(n_steps=500_000)
+
+    # The validator has no files of the miner yet, so everything is sent.
+    synapse = query(protein)
+    assert synapse.md_output_appended == {}
+    assert_same_files()
+
+    log_size = os.path.getsize(os.path.join(MINER_PATH, "md_0_1.log"))
+    write_miner_files(n_steps=600_000, tpr=b"new tpr")
+
+    synapse = query(protein)
+    assert synapse.md_output_appended == {"md_0_1.log": log_size}
+    assert len(synapse.md_output["md_0_1.log"]) == (
+        os.path.getsize(os.path.join(MINER_PATH, "md_0_1.log")) - log_size
+    )
+    assert (
+        synapse.md_output["md_0_1.tpr"] == b"new tpr"
+    )  # tpr files are always sent in full.
+    assert_same_files()
+
+    # Nothing was appended since the last query.
+    synapse = query(protein)
+    assert synapse.md_output["md_0_1.log"] == b""
+    assert_same_files()
+
+
+def test_full_file_is_sent_if_the_miner_restarted():
+    protein = make_protein()
+    write_miner_files(n_steps=500_000)
+    query(protein)
+
+    # The miner restarted its simulation, and its log is now longer but different.
+    with open(os.path.join(MINER_PATH, "md_0_1.log"), "wb") as f:
+        f.write(b"restarted\n" * 100_000)
+
+    synapse = query(protein)
+    assert synapse.md_output_appended == {}
+    assert_same_files()
+
+
+def test_unchanged_files_are_not_sent_again():
+    protein = make_protein()
+    sent_files = SentFiles()
+    tpr_path = write_miner_files(n_steps=500_000, tpr=b"tpr" * 1000)[1]
+
+    synapse = query(protein, sent_files=sent_files)
+    assert len(synapse.md_output["md_0_1.tpr"]) == 3000
+
+    synapse = query(protein, sent_files=sent_files)
+    assert synapse.md_output["md_0_1.tpr"] == b""
+    assert synapse.md_output_appended["md_0_1.tpr"] == 3000
+    assert_same_files()
+
+    # The cache is kept per validator.
+    other = make_protein()
+    other.setup_filepaths(validator_directory=os.path.join(OUTPUT_PATH, "other"))
+    other.get_miner_data_directory(hotkey=HOTKEY)
+    synapse = query(other, sent_files=sent_files, validator="5OtherValidator")
+    assert len(synapse.md_output["md_0_1.tpr"]) == 3000
+
+    # A rewritten file of the same size is sent again.
+    with open(tpr_path, "wb") as f:
+        f.write(b"TPR" * 1000)
+    os.utime(tpr_path, ns=(0, 0))
+    synapse = query(protein, sent_files=sent_files)
+    assert synapse.md_output["md_0_1.tpr"] == b"TPR" * 1000
+    assert_same_files()
+
+    # So is a file that the validator no longer holds.
+    os.remove(os.path.join(VALIDATOR_PATH, HOTKEY[:8], "md_0_1.tpr"))
+    synapse = query(protein, sent_files=sent_files)
+    assert synapse.md_output["md_0_1.tpr"] == b"TPR" * 1000
+    assert_same_files()
+
+
+def test_sent_files_are_bounded():
+    sent_files = SentFiles(max_size=2)
+    stat = os.stat(write_miner_files(n_steps=10)[1])
+    for validator in ("a", "b", "c"):
+        sent_files.add(validator, "md_0_1.tpr", stat)
+    assert len(sent_files) == 2
+
+    # The axon handlers of the miner add files from several threads.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda i: sent_files.add(f"validator-{i}", "md_0_1.tpr", stat),
+                range(1000),
+            )
+        )
+    assert len(sent_files) == 2
+
+
+def test_get_append_offset():
+    path = os.path.join(MINER_PATH, "md_0_1.xtc")
+    with open(path, "wb") as f:
+        f.write(os.urandom(DIGEST_BYTES + 1000))
+    offsets = get_file_offsets(MINER_PATH)
+
+    with open(path, "ab") as f:
+        f.write(b"appended")
+    assert get_append_offset(path, offsets["md_0_1.xtc"]) == DIGEST_BYTES + 1000
+
+    assert get_append_offset(path, None) == 0
+    assert get_append_offset(path, {"size": "corrupt"}) == 0
+    assert get_append_offset(path, {**offsets["md_0_1.xtc"], "size": 10**9}) == 0
+    assert get_append_offset(path, {**offsets["md_0_1.xtc"], "digest": "0" * 32}) == 0
+
+
+def test_append_file_without_local_copy():
+    with pytest.raises(ValueError):
+        append_file(os.path.join(OUTPUT_PATH, "missing.xtc"), offset=10, content=b"")
+
+    path = os.path.join(OUTPUT_PATH, "short.xtc")
+    with open(path, "wb") as f:
+        f.write(b"short")
+    with pytest.raises(ValueError):
+        append_file(path, offset=10, content=b"tail")
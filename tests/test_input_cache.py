@@ -0,0 +1,86 @@
+import os
+import shutil
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from folding.validators.protein import Protein
+from folding.validators.input_cache import InputBundleCache
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_input_cache")
+
+MD_INPUTS = {
+    "em.gro": "gro" * 100,
+    "topol.top": "topol" * 100,
+    "posre.itp": "posre" * 100,
+    "md.mdp": "nsteps = 100",
+}
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+    Protein.md_inputs_cache = None
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def make_protein(pdb_id: str = "1ubq", files: dict = MD_INPUTS) -> Protein:
+    protein = Protein(
+        pdb_id=pdb_id,
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.setup_filepaths(validator_directory=os.path.join(OUTPUT_PATH, pdb_id))
+    os.makedirs(protein.validator_directory, exist_ok=True)
+    for name, content in files.items():
+        with open(os.path.join(protein.validator_directory, name), "w") as f:
+            f.write(content)
+    return protein
+
+
+def test_known_jobs_are_not_read_again():
+    Protein.md_inputs_cache = InputBundleCache(max_bytes=1024**2)
+    protein = make_protein()
+    assert protein.load_md_inputs() == MD_INPUTS
+
+    with mock.patch.object(Protein, "read_and_return_files") as read:
+        assert protein.load_md_inputs() == MD_INPUTS
+        read.assert_not_called()
+    assert (Protein.md_inputs_cache.hits, Protein.md_inputs_cache.misses) == (1, 1)
+
+
+def test_generated_files_are_read_again():
+    Protein.md_inputs_cache = InputBundleCache(max_bytes=1024**2)
+    protein = make_protein()
+    protein.load_md_inputs()
+
+    protein = make_protein(files={**MD_INPUTS, "md.mdp": "nsteps = 200"})
+    assert protein.load_md_inputs()["md.mdp"] == "nsteps = 200"
+    assert Protein.md_inputs_cache.misses == 2
+
+
+def test_bundles_are_content_addressed():
+    cache = InputBundleCache(max_bytes=1024**2)
+    size = sum(map(len, MD_INPUTS.values()))
+
+    files, digest = cache.get(("a",), read=lambda: (MD_INPUTS, []))
+    _, other_digest = cache.get(("b",), read=lambda: (MD_INPUTS, []))
+    assert files == MD_INPUTS
+    assert digest == other_digest
+    assert cache.nbytes == size
+
+
+def test_bundles_are_evicted_by_size():
+    size = sum(map(len, MD_INPUTS.values()))
+    cache = InputBundleCache(max_bytes=size * 2)
+    for i in range(3):
+        cache.get((i,), read=lambda: ({**MD_INPUTS, "md.mdp": str(i)}, []))
+
+    assert cache.nbytes <= size * 2
+    cache.get((0,), read=lambda: ({**MD_INPUTS, "md.mdp": "0"}, []))
+    cache.get((2,), read=lambda: ({**MD_INPUTS, "md.mdp": "2"}, []))
+    assert (cache.hits, cache.misses) == (1, 4)
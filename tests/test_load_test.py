@@ -0,0 +1,90 @@
+import os
+import json
+import base64
+import shutil
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.mock import MockMiner
+from folding.utils.ops import get_last_step_time, gro_hash
+from folding.validators.protein import Protein
+from benchmarks.load_test import make_payload, process_tree_rss, StoreMonitor
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_load_test")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def test_mock_miner_responses():
+    md_output = {"md_0_1.log": b"log", "md_0_1.xtc": b"\x00\x01"}
+
+    latency, status_code, body = MockMiner(md_output=md_output, latency=2.0).respond(
+        "JobSubmissionSynapse"
+    )
+    assert (latency, status_code) == (2.0, 200)
+    assert {
+        name: base64.b64decode(content)
+        for name, content in json.loads(body)["md_output"].items()
+    } == md_output
+
+    _, status_code, body = MockMiner(md_output=md_output, failure_rate=1.0).respond(
+        "JobSubmissionSynapse"
+    )
+    assert (status_code, body) == (500, b"")
+
+    # Pings are answered right away, even by miners that fail their jobs.
+    assert MockMiner(latency=5.0, failure_rate=1.0, can_serve=False).respond(
+        "PingSynapse"
+    ) == (0.0, 200, json.dumps({"can_serve": False}).encode())
+
+
+def test_payload_passes_in_process_verification():
+    """The generated payload goes through the verification of a synthetic challenge up to the rerun."""
+    payload = make_payload(OUTPUT_PATH, size_mb=0.5, n_atoms=1000)
+    assert set(payload) == {"md_0_1.xtc", "md_0_1.tpr", "md_0_1.log"}
+    assert len(payload["md_0_1.xtc"]) == pytest.approx(0.5 * 1024**2, rel=0.1)
+
+    protein = Protein(
+        pdb_id="loadtest",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.setup_filepaths(validator_directory=OUTPUT_PATH)
+    miner_directory = os.path.join(OUTPUT_PATH, "miner")
+    protein.save_files(files=payload, output_directory=miner_directory)
+
+    gro_file_location = protein.compute_intermediate_gro(
+        output_directory=miner_directory,
+        md_outputs_exts={"xtc": "md_0_1.xtc", "tpr": "md_0_1.tpr"},
+        simulation_step_time=get_last_step_time(
+            os.path.join(miner_directory, "md_0_1.log")
+        ),
+    )
+    assert gro_hash(gro_path=gro_file_location) == gro_hash(gro_path=protein.gro_path)
+
+
+def test_store_monitor():
+    class Store:
+        file_path = "protein_jobs.db"
+
+        def update(self, path):
+            with open(path, "wb") as f:
+                f.write(b"\0" * 1_000_000)
+
+    store = StoreMonitor(Store())
+    store.update(os.path.join(OUTPUT_PATH, "job"))
+    store.update(os.path.join(OUTPUT_PATH, "job"))
+
+    assert store.file_path == "protein_jobs.db"
+    assert store.stats["update"]["calls"] == 2
+    assert store.stats["update"]["write_mb"] >= 2 * 1e6 / 1024**2
+    assert process_tree_rss() > 0
@@ -0,0 +1,59 @@
+import os
+import shutil
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.validators.protein import Protein
+from folding.miners.folding_miner import get_md_inputs_held, md_inputs_digest_path
+from folding.utils.incremental import inputs_digest
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_md_inputs")
+
+MD_INPUTS = {"em.gro": "gro", "topol.top": "topol", "md.mdp": "nsteps = 100"}
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def test_inputs_digest():
+    digest = inputs_digest(MD_INPUTS)
+    assert inputs_digest(dict(reversed(MD_INPUTS.items()))) == digest
+    assert inputs_digest({**MD_INPUTS, "md.mdp": "nsteps = 101"}) != digest
+    assert inputs_digest({**MD_INPUTS, "posre.itp": ""}) != digest
+
+    # Names and contents are not mixed up.
+    assert inputs_digest({"ab": "c"}) != inputs_digest({"a": "bc"})
+    assert inputs_digest({k: v.encode() for k, v in MD_INPUTS.items()}) == digest
+
+
+def test_md_inputs_held():
+    protein = Protein(
+        pdb_id="1ubq",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.setup_filepaths(validator_directory=os.path.join(OUTPUT_PATH, "validator"))
+    protein.md_inputs = MD_INPUTS
+
+    # No miner was queried yet.
+    assert protein.get_md_inputs_held() == {}
+
+    held = {"5Miner": protein.get_md_inputs_digest()}
+    protein.save_md_inputs_held(held)
+    assert protein.get_md_inputs_held() == held
+
+
+def test_miner_reports_md_inputs_held():
+    assert get_md_inputs_held(OUTPUT_PATH, "1ubq") is None
+
+    with open(md_inputs_digest_path(OUTPUT_PATH, "1ubq"), "w") as f:
+        f.write(inputs_digest(MD_INPUTS))
+    assert get_md_inputs_held(OUTPUT_PATH, "1ubq") == inputs_digest(MD_INPUTS)
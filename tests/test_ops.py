@@ -0,0 +1,130 @@
+import os
+import re
+import time
+import pytest
+import shutil
+import threading
+import concurrent.futures
+from pathlib import Path
+
+from benchmarks.fixtures import write_md_log
+from folding.utils.ops import (
+    run_cmd_commands,
+    CommandCancelled,
+    get_last_step_time,
+    read_lines_reversed,
+)
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_ops")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def test_run_cmd_commands_in_cwd():
+    cwd = os.getcwd()
+    output_directories = [
+        os.path.join(OUTPUT_PATH, f"job_{i}") for i in range(4)
+    ]
+    for directory in output_directories:
+        os.makedirs(directory)
+
+    def run(directory: str):
+        run_cmd_commands(
+            commands=[f"echo {directory} > out.txt", "cp out.txt copy.txt"],
+            cwd=directory,
+        )
+
+    # Commands for different directories are run at the same time from several threads.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(run, output_directories))
+
+    assert (
+        os.getcwd() == cwd
+    ), "run_cmd_commands should not change the working directory"
+    for directory in output_directories:
+        with open(os.path.join(directory, "copy.txt"), "r") as f:
+            assert f.read().strip() == directory
+
+
+def test_run_cmd_commands_is_cancelled():
+    stop_event = threading.Event()
+    threading.Timer(0.5, stop_event.set).start()
+
+    start_time = time.time()
+    with pytest.raises(CommandCancelled):
+        run_cmd_commands(
+            commands=["sleep 30", "echo never"], stop_event=stop_event
+        )
+
+    assert (
+        time.time() - start_time < 10
+    ), "command should be killed once cancelled"
+
+
+def legacy_get_last_step_time(log_file: str) -> float:
+    """get_last_step_time as it was before it read logs from their end, used as reference."""
+    step_pattern = re.compile(r"^\s*Step\s+Time$")
+    step_value_pattern = re.compile(r"^\s*(\d+)\s+([\d.]+)$")
+
+    with open(log_file, "r") as file:
+        lines = file.readlines()
+
+    num_matches = 0
+    last_step_time = 0
+    for i, line in enumerate(reversed(lines)):
+        if step_pattern.match(line.strip()):
+            value_line = lines[-1 + (-i + 1)]
+            match = step_value_pattern.match(value_line.strip())
+            if match:
+                num_matches += 1
+                if num_matches > 1:
+                    last_step_time = float(match.group(2))
+                    break
+    return last_step_time
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 64 * 1024])
+def test_read_lines_reversed(block_size):
+    path = os.path.join(OUTPUT_PATH, "lines.txt")
+    write_md_log(path, n_steps=50000, tail="no newline at the end")
+
+    with open(path, "r") as f:
+        expected = f.read().split("\n")
+
+    lines = list(read_lines_reversed(path, block_size=block_size))
+    assert [line.decode() for line in reversed(lines)] == expected
+
+
+@pytest.mark.parametrize(
+    "n_steps, tail",
+    [
+        (0, ""),
+        (5000, ""),
+        (10000, ""),
+        (50000, ""),
+        (
+            50000,
+            "           Step           Time\n",
+        ),  # header of a block being written
+        (50000, "           Step           Time\n          50000"),
+        (5_000_000, "Writing checkpoint, step 5000000\n"),
+    ],
+)
+def test_get_last_step_time_matches_legacy(n_steps, tail):
+    log_path = os.path.join(OUTPUT_PATH, "md_0_1.log")
+    write_md_log(log_path, n_steps=n_steps, tail=tail)
+
+    assert get_last_step_time(log_path) == legacy_get_last_step_time(log_path)
+
+
+def test_get_last_step_time_of_large_log():
+    log_path = os.path.join(OUTPUT_PATH, "md_0_1.log")
+    write_md_log(log_path, n_steps=50_000_000)  # ~4.5MB
+
+    assert get_last_step_time(log_path) == 99980.0
@@ -0,0 +1,125 @@
+import os
+import shutil
+import pytest
+import concurrent.futures
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.protocol import JobSubmissionSynapse
+from folding.miners.folding_miner import attach_files
+from folding.miners.response_cache import ResponseCache
+from benchmarks.fixtures import write_md_log
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_response_cache")
+LOG_PATH = os.path.join(OUTPUT_PATH, "md_0_1.log")
+TPR_PATH = os.path.join(OUTPUT_PATH, "md_0_1.tpr")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    write_md_log(LOG_PATH, n_steps=100_000)
+    with open(TPR_PATH, "wb") as f:
+        f.write(b"tpr" * 1000)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def query(response_cache: ResponseCache, encodings=[]) -> JobSubmissionSynapse:
+    synapse = JobSubmissionSynapse(
+        pdb_id="1ubq", md_inputs={}, md_output_encodings=encodings
+    )
+    synapse.md_output = {}
+    return attach_files([LOG_PATH, TPR_PATH], synapse, response_cache=response_cache)
+
+
+def test_repeat_queries_are_cached():
+    response_cache = ResponseCache(max_bytes=1024**3)
+    expected = query(None).md_output
+
+    assert query(response_cache).md_output == expected
+    assert (response_cache.hits, response_cache.misses) == (0, 2)
+
+    assert query(response_cache).md_output == expected
+    assert (response_cache.hits, response_cache.misses) == (2, 2)
+
+    # Another encoding is another entry.
+    query(response_cache, encodings=["gzip"])
+    assert (response_cache.hits, response_cache.misses) == (2, 4)
+
+
+def test_appended_files_are_encoded_again():
+    response_cache = ResponseCache(max_bytes=1024**3)
+    query(response_cache)
+
+    write_md_log(LOG_PATH, n_steps=200_000)
+    synapse = query(response_cache)
+    assert synapse.md_output == query(None).md_output
+    assert synapse.md_output_sizes["md_0_1.log"] == os.path.getsize(LOG_PATH)
+    assert (response_cache.hits, response_cache.misses) == (1, 3)
+
+
+def test_cache_size_is_bounded():
+    response_cache = ResponseCache(max_bytes=5000)
+    query(response_cache)
+
+    # The log does not fit, and the tpr is kept.
+    assert response_cache.nbytes == 4000
+    query(response_cache)
+    assert (response_cache.hits, response_cache.misses) == (1, 3)
+
+
+def test_concurrent_misses_are_counted_once():
+    response_cache = ResponseCache(max_bytes=5000)
+    stat = os.stat(TPR_PATH)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda _: response_cache.encode_file(TPR_PATH, stat), range(32)
+            )
+        )
+
+    assert all(result == results[0] for result in results)
+    assert response_cache.nbytes == len(results[0][0])
+    assert response_cache.hits + response_cache.misses == 32
+
+
+def test_grown_files_are_not_cached():
+    response_cache = ResponseCache(max_bytes=1024**3)
+    stat = os.stat(LOG_PATH)
+    with open(LOG_PATH, "ab") as f:
+        f.write(b"appended while it was read")
+
+    _, size = response_cache.encode_file(LOG_PATH, stat)
+    assert size == os.path.getsize(LOG_PATH)
+    assert response_cache.nbytes == 0
+
+
+def test_state_energies_are_cached():
+    response_cache = ResponseCache(max_bytes=1024**3)
+    edr_path = os.path.join(OUTPUT_PATH, "md_0_1.edr")
+    with open(edr_path, "wb") as f:
+        f.write(b"edr")
+
+    calls = []
+
+    def compute(output_dir):
+        calls.append(output_dir)
+        return {"state_energies": [len(calls)]}
+
+    assert response_cache.get_state_energies(OUTPUT_PATH, compute) == {
+        "state_energies": [1]
+    }
+    assert response_cache.get_state_energies(OUTPUT_PATH, compute) == {
+        "state_energies": [1]
+    }
+
+    with open(edr_path, "ab") as f:
+        f.write(b"new frame")
+    assert response_cache.get_state_energies(OUTPUT_PATH, compute) == {
+        "state_energies": [2]
+    }
+    assert len(calls) == 2
@@ -0,0 +1,115 @@
+import os
+import base64
+import shutil
+import pytest
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+from folding.protocol import JobSubmissionSynapse
+from folding.validators.protein import Protein
+from folding.utils.compression import compress
+from folding.utils.spool import SpoolFile, spool_base64, remove_spool_files
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_spool")
+SPOOL_PATH = os.path.join(OUTPUT_PATH, "spool")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    JobSubmissionSynapse.spool_directory = None
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip"])
+@pytest.mark.parametrize("chunk_size", [1, 1000, 1024**2])
+def test_spool_base64(encoding, chunk_size):
+    content = os.urandom(10_000) + b"\0" * 10_000
+    data = base64.b64encode(compress(content, encoding) if encoding else content)
+
+    spool_file = spool_base64(
+        data.decode(), SPOOL_PATH, encoding=encoding, chunk_size=chunk_size
+    )
+    assert len(spool_file) == len(content)
+    assert spool_file.read() == content
+
+
+def test_spool_memory_is_bounded():
+    data = base64.b64encode(os.urandom(20 * 1024**2)).decode()
+
+    tracemalloc.start()
+    spool_file = spool_base64(data, SPOOL_PATH, chunk_size=1024**2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(spool_file) == 20 * 1024**2
+    assert peak < 4 * 1024**2
+
+
+def test_spool_removes_partial_files():
+    with pytest.raises(ValueError):
+        spool_base64("not base64!", SPOOL_PATH, encoding="gzip")
+    assert os.listdir(SPOOL_PATH) == []
+
+
+def test_spool_rejects_compression_bombs():
+    data = base64.b64encode(compress(b"\0" * 100 * 1024**2, "gzip"))
+    with pytest.raises(ValueError):
+        spool_base64(data, SPOOL_PATH, encoding="gzip", max_size=10 * 1024**2)
+    assert os.listdir(SPOOL_PATH) == []
+
+
+def test_deserialize_to_spool_rejects_files_larger_than_declared():
+    JobSubmissionSynapse.spool_directory = SPOOL_PATH
+    content = b"log" * 1000
+
+    synapse = JobSubmissionSynapse(pdb_id="1ubq", md_inputs={})
+    synapse.md_output = {"md_0_1.log": base64.b64encode(compress(content, "gzip"))}
+    synapse.md_output_encoding = "gzip"
+    synapse.md_output_sizes = {"md_0_1.log": len(content) - 1}
+    synapse.axon = SimpleNamespace(hotkey="5MinerHotkey")
+    synapse.deserialize()
+
+    assert synapse.md_output["md_0_1.log"] is None
+    assert os.listdir(SPOOL_PATH) == []
+
+
+def test_deserialize_to_spool_and_save():
+    JobSubmissionSynapse.spool_directory = SPOOL_PATH
+    files = {"md_0_1.log": b"log" * 1000, "md_0_1.tpr": b"tpr", "md_0_1.cpt": b""}
+
+    synapse = JobSubmissionSynapse(pdb_id="1ubq", md_inputs={})
+    synapse.md_output = {k: base64.b64encode(v).decode() for k, v in files.items()}
+    synapse.axon = SimpleNamespace(hotkey="5MinerHotkey")
+    synapse.deserialize()
+
+    assert all(isinstance(v, SpoolFile) for v in synapse.md_output.values())
+    assert {k: len(v) for k, v in synapse.md_output.items()} == {
+        k: len(v) for k, v in files.items()
+    }
+
+    protein = Protein(
+        pdb_id="1ubq",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    output_directory = os.path.join(OUTPUT_PATH, "miner")
+    protein.save_files(files=synapse.md_output, output_directory=output_directory)
+    remove_spool_files(synapse.md_output)
+
+    # The files were moved out of the spool directory, and are kept.
+    assert os.listdir(SPOOL_PATH) == []
+    for name, content in files.items():
+        with open(os.path.join(output_directory, name), "rb") as f:
+            assert f.read() == content
+
+
+def test_unsaved_spool_files_are_removed():
+    spool_file = spool_base64(base64.b64encode(b"xtc"), SPOOL_PATH)
+    remove_spool_files({"md_0_1.xtc": spool_file, "md_0_1.log": b"log"})
+    assert os.listdir(SPOOL_PATH) == []
@@ -5,7 +5,8 @@ import shutil
 import pytest
 import pandas as pd
 from pathlib import Path
-from folding.store import PandasJobStore, MockJob, Job
+import numpy as np
+from folding.store import PandasJobStore, SQLiteJobStore, MockJob, Job
 
 # TODO: cleanup files after tests
 
@@ -153,3 +154,191 @@ def test_queue_is_empty_when_all_jobs_are_complete():
         store.get_queue(ready=False).qsize() == 0
     ), f"queue should be empty, currently has {store.get_queue(ready=False).qsize()}"
 
+
+
+def test_journal_is_replayed_on_load():
+
+    store = PandasJobStore(db_path=DB_PATH, force_create=True, compact_every=100)
+    csv_size = os.path.getsize(store.file_path)
+
+    for i in range(3):
+        store.insert(pdb=f'{PDB}{i}', ff=FF, box=BOX, water=WATER, hotkeys=['a', 'b'], epsilon=5)
+
+    job = store.get_queue(ready=False).get()
+    job.update(loss=-10, hotkey='a', commit_hash='1234', gro_hash='5678')
+    store.update(job=job)
+
+    # Writes only go to the journal until it is compacted.
+    assert os.path.getsize(store.file_path) == csv_size
+    assert len(store.read_journal()) == 4
+
+    store = PandasJobStore(db_path=DB_PATH, force_create=False)
+
+    assert store.get_all_pdbs() == [f'{PDB}{i}' for i in range(3)]
+    assert store._db.loc[job.pdb, 'best_loss'] == -10
+    assert store._db.loc[job.pdb, 'best_hotkey'] == 'a'
+    assert len(store.read_journal()) == 0, "journal should be compacted after replay"
+
+
+def test_journal_is_compacted():
+
+    store = PandasJobStore(db_path=DB_PATH, force_create=True, compact_every=2)
+
+    for i in range(3):
+        store.insert(pdb=f'{PDB}{i}', ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+    assert len(store.read_journal()) == 1
+    assert len(pd.read_csv(store.file_path)) == 2
+
+
+def test_incomplete_journal_record_is_ignored():
+
+    store = PandasJobStore(db_path=DB_PATH, force_create=True)
+    store.insert(pdb=PDB, ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+    # Simulate a crash in the middle of appending a record.
+    with open(store.journal_path, 'a') as f:
+        f.write('{"op": "insert", "job": {"pdb": "')
+
+    store = PandasJobStore(db_path=DB_PATH, force_create=False)
+    assert store.get_all_pdbs() == [PDB]
+
+
+def test_sqlite_insert_update_and_load():
+
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=True)
+
+    store.insert(pdb=PDB, ff=FF, box=BOX, water=WATER, hotkeys=['a', 'b', 'c'], epsilon=5)
+    job = store.get_queue(ready=False).get()
+
+    assert job.pdb == PDB and job.hotkeys == ['a', 'b', 'c']
+    assert job.best_loss == np.inf and pd.isna(job.best_loss_at)
+
+    job.update(loss=-10, hotkey='b', commit_hash='1234', gro_hash='5678')
+    job.event = {'energies': np.array([1.0, 2.0]), 'uids': [1, 2]}
+    store.update(job=job)
+
+    # A new store (after a restart) reads the job back from the database.
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=False)
+    loaded = store.get_queue(ready=False).get()
+
+    assert loaded.best_loss == -10
+    assert loaded.best_hotkey == 'b'
+    assert loaded.best_loss_at == job.best_loss_at
+    assert loaded.updated_count == 1
+    assert loaded.update_interval == job.update_interval
+    assert loaded.event == {'energies': [1.0, 2.0], 'uids': [1, 2]}
+    assert store.get_all_pdbs() == [PDB]
+
+
+def test_sqlite_repeat_insert_same_pdb_fails():
+
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=True)
+    store.insert(pdb=PDB, ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+    with pytest.raises(ValueError):
+        store.insert(pdb=PDB, ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+
+@pytest.mark.parametrize('update_seconds', [0, 3600])
+def test_sqlite_queue_contains_ready_jobs(update_seconds):
+
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=True)
+
+    for i in range(10):
+        job = MockJob(update_seconds=update_seconds)
+        store.insert(
+            pdb=job.pdb,
+            ff=job.ff,
+            box=job.box,
+            water=job.water,
+            hotkeys=job.hotkeys,
+            epsilon=job.epsilon,
+            active=i % 2 == 0,
+            update_interval=job.update_interval,
+        )
+
+    assert store.get_queue(ready=False).qsize() == 5
+    assert store.get_queue(ready=True).qsize() == (5 if update_seconds == 0 else 0)
+
+
+def test_sqlite_migrates_csv_store():
+
+    csv_store = PandasJobStore(db_path=DB_PATH, force_create=True)
+    pdbs = [f'{PDB}{i}' for i in range(3)]
+    for pdb in pdbs:
+        csv_store.insert(pdb=pdb, ff=FF, box=BOX, water=WATER, hotkeys=['a', 'b'], epsilon=5)
+
+    store = SQLiteJobStore(db_path=DB_PATH)
+
+    assert sorted(store.get_all_pdbs()) == pdbs
+    jobs = list(store.get_queue(ready=False).queue)
+    assert all(job.hotkeys == ['a', 'b'] for job in jobs)
+    assert all(job.ff == FF and job.epsilon == 5 for job in jobs)
+
+
+def test_sqlite_migrates_non_finite_events():
+
+    csv_store = PandasJobStore(db_path=DB_PATH, force_create=True)
+    for pdb in (f'{PDB}0', f'{PDB}1', f'{PDB}2'):
+        csv_store.insert(pdb=pdb, ff=FF, box=BOX, water=WATER, hotkeys=['a', 'b'], epsilon=5)
+    csv_store._db.at[f'{PDB}0', 'event'] = {'energies': [np.inf, np.nan, -np.inf]}
+    csv_store._db.at[f'{PDB}1', 'event'] = "{'energies': [__import__('os')]}"
+    csv_store._db.at[f'{PDB}2', 'event'] = np.nan
+    csv_store.write()
+
+    store = SQLiteJobStore(db_path=DB_PATH)
+
+    jobs = {job.pdb: job for job in store.get_queue(ready=False).queue}
+    energies = jobs[f'{PDB}0'].event['energies']
+    assert energies[0] == np.inf and np.isnan(energies[1]) and energies[2] == -np.inf
+    # Events that can not be used are migrated as empty events, which forward_job can update.
+    assert jobs[f'{PDB}1'].event == {}
+    assert jobs[f'{PDB}2'].event == {}
+
+
+def test_sqlite_retries_failed_migration(monkeypatch):
+
+    csv_store = PandasJobStore(db_path=DB_PATH, force_create=True)
+    csv_store.insert(pdb=PDB, ff=FF, box=BOX, water=WATER, hotkeys=['a', 'b'], epsilon=5)
+
+    def fail(job):
+        raise RuntimeError('migration failed')
+
+    with monkeypatch.context() as m:
+        m.setattr(SQLiteJobStore, '_to_row', staticmethod(fail))
+        with pytest.raises(RuntimeError):
+            SQLiteJobStore(db_path=DB_PATH)
+
+    # The database was created, but the jobs are still migrated at the next start, and only once.
+    store = SQLiteJobStore(db_path=DB_PATH)
+    assert store.get_all_pdbs() == [PDB]
+    store.connection.close()
+    assert SQLiteJobStore(db_path=DB_PATH).get_all_pdbs() == [PDB]
+
+
+def test_sqlite_archives_inactive_jobs():
+
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=True)
+    for i in range(3):
+        store.insert(pdb=f'{PDB}{i}', ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+    job = store.get_queue(ready=False).get()
+    job.active = False
+    job.event = {'energies': [1.0, 2.0]}
+    store.update(job=job)
+
+    assert store.get_queue(ready=False).qsize() == 2
+    assert job.pdb in store.archived_pdbs
+
+    # Archived pdbs are still excluded after a restart, and can't be inserted again.
+    store = SQLiteJobStore(db_path=DB_PATH, force_create=False)
+    assert sorted(store.get_all_pdbs()) == [f'{PDB}{i}' for i in range(3)]
+    with pytest.raises(ValueError):
+        store.insert(pdb=job.pdb, ff=FF, box=BOX, water=WATER, hotkeys=['a'], epsilon=5)
+
+    archived = store.get_archived_jobs()
+    assert len(archived) == 1
+    assert archived[0].pdb == job.pdb
+    assert archived[0].active == False
+    assert archived[0].event == {'energies': [1.0, 2.0]}
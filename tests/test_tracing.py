@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import shutil
+import pytest
+import contextvars
+import concurrent.futures
+from pathlib import Path
+
+from folding.utils.ops import run_cmd_commands
+from folding.utils.tracing import (
+    Span,
+    traced,
+    tracer,
+    trace_job,
+    summarize_spans,
+    export_chrome_trace,
+    append_chrome_trace,
+)
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_tracing")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    tracer.drain()
+    yield
+    tracer.drain()
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+class MockProtein:
+    @traced()
+    def setup_simulation(self):
+        run_cmd_commands(
+            commands=[
+                "head -c 1000000 /dev/zero > zeros.bin",
+                [sys.executable, "-c", "open('zeros.bin', 'rb').read()"],
+            ],
+            cwd=OUTPUT_PATH,
+        )
+        self.get_energy()
+
+    @traced()
+    def get_energy(self):
+        with open(os.path.join(OUTPUT_PATH, "zeros.bin"), "rb") as f:
+            return len(f.read())
+
+
+def test_spans_of_commands_and_methods():
+    MockProtein().setup_simulation()
+    spans = {span.key: span for span in tracer.drain()}
+
+    assert set(spans) == {
+        "MockProtein.setup_simulation",
+        "MockProtein.setup_simulation/run_cmd_commands",
+        "MockProtein.setup_simulation/head",
+        f"MockProtein.setup_simulation/{os.path.basename(sys.executable)}",
+        "MockProtein.get_energy",
+    }
+
+    setup = spans["MockProtein.setup_simulation"]
+    python = spans[f"MockProtein.setup_simulation/{os.path.basename(sys.executable)}"]
+    assert setup.wall_time >= python.wall_time > 0
+    assert python.read_bytes >= 1_000_000
+    assert python.max_rss > 0
+    assert spans["MockProtein.setup_simulation/head"].write_bytes >= 1_000_000
+
+    # The usage of the commands and the nested method is part of the usage of the method.
+    assert setup.user_time + setup.sys_time >= python.user_time + python.sys_time
+    assert (
+        setup.read_bytes
+        >= python.read_bytes + spans["MockProtein.get_energy"].read_bytes
+    )
+    assert spans["MockProtein.get_energy"].parent == "MockProtein.setup_simulation"
+
+
+def test_summarize_spans():
+    protein = MockProtein()
+    protein.setup_simulation()
+    protein.get_energy()
+
+    summary = summarize_spans(tracer.drain())
+    assert summary["MockProtein.setup_simulation"]["count"] == 1
+    assert summary["MockProtein.get_energy"]["count"] == 2
+    assert summary["MockProtein.get_energy"]["read_mb"] >= 2 * 1e6 / 1024**2
+    assert set(summary["MockProtein.get_energy"]) == {
+        "count",
+        "wall_time",
+        "user_time",
+        "sys_time",
+        "max_rss_mb",
+        "read_mb",
+        "write_mb",
+    }
+
+
+def test_chrome_trace():
+    MockProtein().setup_simulation()
+    spans = tracer.drain()
+
+    trace_path = os.path.join(OUTPUT_PATH, "trace.json")
+    export_chrome_trace(trace_path, spans)
+    with open(trace_path, "r") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(spans)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+    # Appended traces use the array format, in which the closing bracket is optional.
+    trace_path = os.path.join(OUTPUT_PATH, "trace_array.json")
+    append_chrome_trace(trace_path, spans[:2])
+    append_chrome_trace(trace_path, spans[2:])
+    with open(trace_path, "r") as f:
+        events = json.loads(f.read().rstrip().rstrip(",") + "]")
+    assert [event["name"] for event in events] == [span.name for span in spans]
+
+
+def test_spans_are_drained_per_job():
+    with trace_job("1ubq"):
+        MockProtein().setup_simulation()
+        # Threads started with a copy of the context record spans for the same job.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(
+                contextvars.copy_context().run, MockProtein().setup_simulation
+            ).result()
+        # Spans of pool processes are added for the job that is being verified.
+        tracer.add([Span(name="verify_miner_output", category="function")])
+
+    with trace_job("1fjs"):
+        MockProtein().setup_simulation()
+    MockProtein().setup_simulation()
+
+    spans = tracer.drain_job("1ubq")
+    assert (
+        len([span for span in spans if span.name == "MockProtein.setup_simulation"])
+        == 2
+    )
+    assert "verify_miner_output" in [span.name for span in spans]
+    assert all(span.job == "1ubq" for span in spans)
+
+    assert tracer.drain_job("1ubq") == []
+    assert {span.job for span in tracer.drain_job(None)} == {None}
+    assert {span.job for span in tracer.drain()} == {"1fjs"}
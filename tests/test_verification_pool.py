@@ -0,0 +1,139 @@
+import time
+import pytest
+import pandas as pd
+from types import SimpleNamespace
+
+from folding.validators.protein import Protein
+
+from folding.validators.reward import VerificationPool, get_energies
+
+
+class MockProtein:
+    """Mimics the parts of Protein that are used to verify a miner. The energy reported by
+    a miner is encoded in its hotkey so that the ordering of the results can be checked.
+    """
+
+    deadline = None
+
+    def process_md_output(self, md_output, hotkey, md_output_appended=None):
+        if md_output.get("check_deadline") and self.deadline is None:
+            raise ValueError("no deadline was set")
+        time.sleep(md_output.get("sleep", 0))
+        if md_output.get("fail"):
+            raise ValueError("corrupt md_output")
+        self.energy = -float(hotkey.split("-")[-1])
+        return True
+
+    def get_energy(self, data_type):
+        return pd.DataFrame({"step": [0], "energy": [self.energy]})
+
+    def get_rmsd(self):
+        return pd.DataFrame({"step": [0], "rmsd": [0.1]})
+
+    def is_run_valid(self, energy, hotkey):
+        return True, energy
+
+
+class MockAxon:
+    def __init__(self, hotkey):
+        self.hotkey = hotkey
+
+
+class MockDendrite:
+    status_code = 200
+
+
+class MockResponse:
+    def __init__(self, hotkey, md_output):
+        self.axon = MockAxon(hotkey)
+        self.dendrite = MockDendrite()
+        self.md_output = md_output
+        self.md_output_appended = {}
+
+
+def make_responses(n, md_output=None):
+    return [MockResponse(f"hotkey-{i + 1}", md_output or {}) for i in range(n)]
+
+
+@pytest.mark.parametrize("max_workers", [None, 1, 4])
+def test_energies_are_gathered_in_uid_order(max_workers):
+    pool = (
+        VerificationPool(max_workers=max_workers, timeout=30)
+        if max_workers is not None
+        else None
+    )
+    uids = list(range(6))
+
+    energies, event = get_energies(
+        protein=MockProtein(), responses=make_responses(len(uids)), uids=uids, pool=pool
+    )
+
+    assert energies.tolist() == [-1, -2, -3, -4, -5, -6]
+    assert event["is_valid"] == [True] * len(uids)
+
+    if pool is not None:
+        pool.shutdown()
+
+
+def test_failed_verification_returns_zero_energy():
+    pool = VerificationPool(max_workers=2, timeout=30)
+    responses = make_responses(3)
+    responses[1].md_output = {"fail": True}
+
+    energies, event = get_energies(
+        protein=MockProtein(), responses=responses, uids=[0, 1, 2], pool=pool
+    )
+
+    assert energies.tolist() == [-1, 0, -3]
+    assert event["is_valid"] == [True, False, True]
+    pool.shutdown()
+
+
+def test_slow_verification_times_out():
+    pool = VerificationPool(max_workers=2, timeout=1)
+    responses = make_responses(2)
+    responses[0].md_output = {"sleep": 5}
+
+    energies, _ = get_energies(
+        protein=MockProtein(), responses=responses, uids=[0, 1], pool=pool
+    )
+
+    assert energies.tolist() == [0, -2]
+    pool.shutdown()
+
+
+def test_stuck_verification_does_not_block_the_pool():
+    pool = VerificationPool(max_workers=1, timeout=1)
+    responses = make_responses(1, md_output={"sleep": 60})
+
+    start_time = time.time()
+    energies, _ = get_energies(
+        protein=MockProtein(), responses=responses, uids=[0], pool=pool
+    )
+    assert energies.tolist() == [0]
+
+    # The stuck process was killed, so the next step does not queue behind it.
+    responses = make_responses(1, md_output={"check_deadline": True})
+    energies, _ = get_energies(
+        protein=MockProtein(), responses=responses, uids=[0], pool=pool
+    )
+    assert energies.tolist() == [-1]
+    assert time.time() - start_time < 30
+    pool.shutdown()
+
+
+def test_commands_are_killed_at_the_deadline():
+    protein = Protein(
+        pdb_id="1ubq",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.deadline = time.monotonic() + 1
+
+    start_time = time.time()
+    try:
+        protein.run_commands(commands=["sleep 30"], cwd=None)
+    except Exception:
+        pass
+    assert time.time() - start_time < 10
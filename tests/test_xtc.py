@@ -0,0 +1,218 @@
+import os
+import shutil
+import struct
+import pytest
+import numpy as np
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks.fixtures import PRECISION, compress
+from folding.utils.ops import gro_hash
+from folding.validators.protein import Protein
+from folding.utils.xtc import (
+    XTCReader,
+    XTCFormatError,
+    write_gro_frame,
+)
+
+ROOT_PATH = Path(__file__).parent
+OUTPUT_PATH = os.path.join(ROOT_PATH, "mock_data", "test_xtc")
+VALIDATOR_GRO_FILE = os.path.join(ROOT_PATH, "fixtures/gro_files/em.gro")
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    yield
+    if os.path.exists(OUTPUT_PATH):
+        shutil.rmtree(OUTPUT_PATH)
+
+
+def write_xtc(xtc_path: str, frames, box=(5.0, 6.0, 7.0)):
+    """Writes frames of float coordinates (nm) to an xtc file."""
+    with open(xtc_path, "wb") as f:
+        for step, time, coordinates in frames:
+            natoms = len(coordinates)
+            f.write(struct.pack(">iiif", 1995, natoms, step, time))
+            f.write(struct.pack(">9f", box[0], 0, 0, 0, box[1], 0, 0, 0, box[2]))
+            f.write(struct.pack(">i", natoms))
+
+            ints = np.round(coordinates * PRECISION).astype(np.int64)
+            minint, maxint, smallidx, data = compress(ints, seed=step)
+            f.write(
+                struct.pack(
+                    ">f3i3iii", PRECISION, *minint, *maxint, smallidx, len(data)
+                )
+            )
+            f.write(data + b"\0" * ((4 - len(data) % 4) % 4))
+
+
+def write_reference_gro(gro_path: str):
+    """Writes the atoms of the validator gro fixture as a complete gro file, in the standard gro columns."""
+    with open(VALIDATOR_GRO_FILE, "r") as f:
+        title, _, *atoms, box = f.readlines()
+
+    with open(gro_path, "w") as f:
+        f.write(title)
+        f.write(f"{len(atoms):5d}\n")
+        for line in atoms:
+            residue, atom_name, atom_number, x, y, z = line.split()
+            atom_name = atom_name.strip("'")
+            f.write(
+                f"{residue[:2]:>5}{residue[2:]:<5}{atom_name:>5}{int(atom_number):5d}{float(x):8.3f}{float(y):8.3f}{float(z):8.3f}\n"
+            )
+        f.write(box)
+
+
+def read_reference_coordinates(n_frames: int, seed: int = 0):
+    """Makes trajectory frames from the coordinates in the validator gro file, with small random moves."""
+    with open(VALIDATOR_GRO_FILE, "r") as f:
+        _, _, *atoms, _ = f.readlines()
+    coordinates = np.array([line.split()[-3:] for line in atoms], dtype=np.float64)
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_frames):
+        moved = coordinates + rng.normal(scale=0.01, size=coordinates.shape)
+        frames.append((i * 5000, i * 10.0, np.round(moved, 3)))
+    return frames
+
+
+def test_read_frames():
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    frames = read_reference_coordinates(n_frames=4)
+    write_xtc(xtc_path, frames)
+
+    reader = XTCReader(xtc_path)
+
+    assert [frame["step"] for frame in reader.frames] == [0, 5000, 10000, 15000]
+    assert reader.find_frame(time=20.0) == 2
+    assert reader.find_frame(time=25.0) is None
+
+    for index, (step, time, coordinates) in enumerate(frames):
+        frame = reader.read_frame(index)
+        assert frame["step"] == step
+        assert frame["time"] == time
+        np.testing.assert_allclose(frame["coordinates"], coordinates, atol=1e-6)
+        np.testing.assert_allclose(np.diag(frame["box"]), [5.0, 6.0, 7.0])
+
+
+def test_read_frames_with_large_jumps():
+    # Atoms that are far apart can't be written as runs of small integers.
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    rng = np.random.default_rng(1)
+    coordinates = np.round(rng.uniform(0, 5, size=(50, 3)), 3)
+    write_xtc(xtc_path, [(0, 0.0, coordinates)])
+
+    frame = XTCReader(xtc_path).read_frame(0)
+    np.testing.assert_allclose(frame["coordinates"], coordinates, atol=1e-6)
+
+
+def test_incomplete_frame_is_ignored():
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    write_xtc(xtc_path, read_reference_coordinates(n_frames=3))
+
+    with open(xtc_path, "rb+") as f:
+        f.truncate(os.path.getsize(xtc_path) - 10)
+
+    assert len(XTCReader(xtc_path).frames) == 2
+
+
+def test_read_fails_on_other_files():
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    with open(xtc_path, "wb") as f:
+        f.write(b"\0" * 200)
+
+    with pytest.raises(XTCFormatError):
+        XTCReader(xtc_path)
+
+
+def test_written_gro_has_reference_hash():
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    gro_path = os.path.join(OUTPUT_PATH, "intermediate.gro")
+    frames = read_reference_coordinates(n_frames=2)
+    write_xtc(xtc_path, frames)
+
+    reference_gro_path = os.path.join(OUTPUT_PATH, "em.gro")
+    write_reference_gro(reference_gro_path)
+
+    frame = XTCReader(xtc_path).read_frame(1)
+    write_gro_frame(gro_path, reference_gro_path=reference_gro_path, frame=frame)
+
+    assert gro_hash(gro_path) == gro_hash(reference_gro_path)
+
+    with open(gro_path, "r") as f:
+        title, natoms, first_atom, *_, box = f.readlines()
+    assert title.startswith("MAJOR VIRION PROTEIN in water t=  10.00000 step= 5000")
+    assert first_atom[20:].split() == [f"{x:.3f}" for x in frames[1][2][0]]
+    assert box == "   5.00000   6.00000   7.00000\n"
+
+
+def test_compute_intermediate_gro():
+    protein = Protein(
+        pdb_id="test_xtc",
+        ff="charmm27",
+        box="cubic",
+        config=SimpleNamespace(suppress_cmd_output=True, verbose=False),
+    )
+    protein.gro_path = os.path.join(OUTPUT_PATH, "em.gro")
+    write_reference_gro(protein.gro_path)
+    write_xtc(
+        os.path.join(OUTPUT_PATH, "md_0_1.xtc"), read_reference_coordinates(n_frames=3)
+    )
+
+    gro_path = protein.compute_intermediate_gro(
+        output_directory=OUTPUT_PATH,
+        md_outputs_exts={"xtc": "md_0_1.xtc", "tpr": "md_0_1.tpr"},
+        simulation_step_time=20.0,
+    )
+
+    assert gro_hash(gro_path) == gro_hash(protein.gro_path)
+    with open(gro_path, "r") as f:
+        assert "step= 10000" in f.readline()
+
+
+def test_frame_index_is_reused_for_appended_frames(monkeypatch):
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    index_path = f"{xtc_path}.index"
+    frames = read_reference_coordinates(n_frames=5)
+    write_xtc(xtc_path, frames[:3])
+
+    reader = XTCReader(xtc_path, index_path=index_path)
+    assert len(reader.frames) == 3 and os.path.exists(index_path)
+    end = reader.frames[-1]["offset"] + reader.frames[-1]["size"]
+
+    # The miner sends the same trajectory with two more frames.
+    write_xtc(xtc_path, frames)
+
+    offsets = []
+    scan = XTCReader.scan
+    monkeypatch.setattr(
+        XTCReader,
+        "scan",
+        lambda self, offset: offsets.append(offset) or scan(self, offset),
+    )
+    reader = XTCReader(xtc_path, index_path=index_path)
+
+    assert offsets == [end], "only the appended frames should be scanned"
+    assert [frame["step"] for frame in reader.frames] == [f[0] for f in frames]
+    np.testing.assert_allclose(
+        reader.read_frame(-1)["coordinates"], frames[-1][2], atol=1e-6
+    )
+
+
+def test_frame_index_is_rebuilt_for_new_trajectory():
+    xtc_path = os.path.join(OUTPUT_PATH, "md_0_1.xtc")
+    index_path = f"{xtc_path}.index"
+    write_xtc(xtc_path, read_reference_coordinates(n_frames=3))
+    XTCReader(xtc_path, index_path=index_path)
+
+    # A restarted simulation writes different frames.
+    frames = read_reference_coordinates(n_frames=4, seed=1)
+    write_xtc(xtc_path, frames)
+    reader = XTCReader(xtc_path, index_path=index_path)
+
+    assert len(reader.frames) == 4
+    np.testing.assert_allclose(
+        reader.read_frame(0)["coordinates"], frames[0][2], atol=1e-6
+    )